@@ -0,0 +1,132 @@
+"""Archival of completed incidents.
+
+Completed signals stay in `sos_signals` only until they have been closed for
+`archive_after`; SignalArchiver then moves each one into `sos_signals_archive`
+together with its rescue track, so the hot collection, its indexes and every
+query on it only cover active incidents. An archived document holds:
+
+* the signal itself, with legacy inline `images_base64` re-encoded into the
+  blob store (WebP plus thumbnail) and kept as ordinary image references;
+  an image that cannot be decoded stays inline
+* `locations`: the recent points from `rescue_signal_tracks`
+* `tracks`: the simplified per-team tracks from `rescue_mission_tracks`
+
+The raw GPS points are dropped; by then the track downsampler has folded
+them, so `archive_after` must exceed the downsampling delay. Reads of an
+archived id fall through to the archive (`find_archived`), and the counters
+keep counting archived signals.
+
+A signal is copied first and only then removed from the hot collection, on
+the condition that it has not changed in between; a signal reopened during
+the move simply stays active.
+"""
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, List, Optional
+
+from pymongo.errors import OperationFailure
+
+from jobs import LeasedJob
+from legacy_images import offload_images
+from tracks import TRACK_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLLECTION = "sos_signals_archive"
+# The signal as the API returns it, without the archived track data
+ARCHIVED_SIGNAL_PROJECTION = {"_id": 0, "images_base64": 0, "locations": 0, "tracks": 0}
+
+
+async def find_archived(db, signal_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+    return await db[ARCHIVE_COLLECTION].find_one({"id": signal_id}, projection or ARCHIVED_SIGNAL_PROJECTION)
+
+
+class SignalArchiver(LeasedJob):
+    STATE_ID = "signal_archiver"
+    DESCRIPTION = "Signal archival"
+
+    def __init__(
+        self,
+        db,
+        blob_store,
+        archive_after: timedelta,
+        interval: float = 3600.0,
+        batch_size: int = 200,
+        on_archive: Optional[Callable[[List[dict]], Awaitable[None]]] = None,
+    ):
+        super().__init__(db, interval)
+        self.blob_store = blob_store
+        self.archive_after = archive_after
+        self.batch_size = batch_size
+        self.on_archive = on_archive
+        self.archived = 0
+        self.images_offloaded = 0
+
+    async def run_once(self) -> int:
+        now = datetime.now(timezone.utc)
+        if await self._acquire(now) is None:
+            return 0
+
+        cutoff = (now - self.archive_after).isoformat()
+        archived = 0
+        while True:
+            signals = await self.db.sos_signals.find(
+                {"status": "completed", "updated_at": {"$lt": cutoff}}, {"_id": 0}
+            ).sort("updated_at", 1).limit(self.batch_size).to_list(self.batch_size)
+
+            moved = []
+            for signal in signals:
+                if await self._archive(signal, now):
+                    moved.append(signal)
+            archived += len(moved)
+            if moved and self.on_archive:
+                await self.on_archive(moved)
+            # A signal that changed while it was copied stays behind; stop rather than re-read it
+            if len(signals) < self.batch_size or not moved:
+                break
+
+        self.archived += archived
+        if archived:
+            logger.info(f"Archived {archived} completed signals closed before {cutoff}")
+        return archived
+
+    async def _archive(self, signal: dict, now: datetime) -> bool:
+        signal_id = signal["id"]
+        track = await self.db.rescue_signal_tracks.find_one({"_id": signal_id}, {"points": 1})
+        tracks = await self.db.rescue_mission_tracks.find({"signal_id": signal_id}, {"_id": 0}).to_list(None)
+
+        document = dict(signal)
+        legacy_images = document.pop("images_base64", None) or []
+        if legacy_images:
+            refs, unreadable = await self._offload_images(signal_id, legacy_images)
+            document["images"] = document.get("images", []) + refs
+            if unreadable:
+                document["images_base64"] = unreadable
+        document["locations"] = track["points"] if track else []
+        document["tracks"] = tracks
+        document["archived_at"] = now
+        await self.db[ARCHIVE_COLLECTION].replace_one({"id": signal_id}, document, upsert=True)
+
+        removed = await self.db.sos_signals.delete_one(
+            {"id": signal_id, "status": "completed", "updated_at": signal["updated_at"]}
+        )
+        if not removed.deleted_count:
+            await self.db[ARCHIVE_COLLECTION].delete_one({"id": signal_id})
+            return False
+
+        await self.db.rescue_signal_tracks.delete_one({"_id": signal_id})
+        await self.db.rescue_mission_tracks.delete_many({"signal_id": signal_id})
+        try:
+            await self.db[TRACK_COLLECTION].delete_many({"meta.signal_id": signal_id})
+        except OperationFailure as e:
+            # Servers without time-series deletes leave the points to the retention TTL
+            logger.debug(f"Raw points of {signal_id} left to expire: {e}")
+        return True
+
+    async def _offload_images(self, signal_id: str, images_base64: List[str]) -> tuple:
+        refs, unreadable = await offload_images(self.blob_store, signal_id, images_base64)
+        self.images_offloaded += len(refs)
+        return refs, unreadable
+
+    def stats(self) -> dict:
+        return {"archived": self.archived, "images_offloaded": self.images_offloaded}
@@ -0,0 +1,62 @@
+"""In-process caches for authenticated requests.
+
+Decoded JWT claims are cached until the token expires, and team records are
+cached by id for a short TTL, so a steady stream of authenticated calls
+(location pings, dashboard polls) does no database round-trip. Anything that
+changes a team must call `TeamCache.invalidate`.
+"""
+import time
+from typing import Awaitable, Callable, Optional
+
+from cachetools import TLRUCache, TTLCache
+
+
+class TokenCache:
+    def __init__(self, maxsize: int = 10000):
+        # Each entry lives until the token's own `exp` claim
+        self._claims = TLRUCache(maxsize=maxsize, ttu=lambda _token, claims, _now: claims["exp"], timer=time.time)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[dict]:
+        claims = self._claims.get(token)
+        if claims is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return claims
+
+    def put(self, token: str, claims: dict) -> None:
+        if "exp" in claims:
+            self._claims[token] = claims
+
+    def stats(self) -> dict:
+        return {"size": len(self._claims), "hits": self.hits, "misses": self.misses}
+
+
+class TeamCache:
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0):
+        self._teams = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, team_id: str, load: Callable[[str], Awaitable[Optional[dict]]]) -> Optional[dict]:
+        team = self._teams.get(team_id)
+        if team is not None:
+            self.hits += 1
+            return team
+        self.misses += 1
+        team = await load(team_id)
+        # Unknown ids are not cached, so a team created just now is found on the next call
+        if team is not None:
+            self._teams[team_id] = team
+        return team
+
+    def invalidate(self, team_id: str) -> None:
+        self._teams.pop(team_id, None)
+
+    def clear(self) -> None:
+        self._teams.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._teams), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Micro-benchmark for list response serialization.
+
+Compares FastAPI's default path for a page of signals (response model
+validation, `jsonable_encoder`, stdlib JSON) with the pre-validated DTOs and
+orjson encoding of `serialization.py`, checks that both produce the same
+JSON, and reports the cost per page in milliseconds. No database is needed.
+
+    python benchmarks/bench_serialization.py [--signals 1000] [--iterations 20]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# server builds its clients at import time; they never connect here
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench_serialization")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+
+import serialization  # noqa: E402
+from serialization import FastJSONResponse, signal_dto  # noqa: E402
+from server import SOSSignal  # noqa: E402
+
+DESCRIPTIONS = [
+    "Nhà tôi bị ngập sâu, có 2 người già và trẻ em mắc kẹt trên mái, cần cứu gấp!",
+    "Nuoc dang rat nhanh, gia dinh 5 nguoi dang keu cuu o tang 2",
+    "Mất điện từ tối qua, cần hỗ trợ lương thực cho khu dân cư khoảng 30 hộ gia đình.",
+]
+
+
+def make_signals(n: int, rng: random.Random) -> List[dict]:
+    now = datetime.now(timezone.utc)
+    signals = []
+    for i in range(n):
+        created_at = (now - timedelta(minutes=i)).isoformat()
+        signals.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "latitude": rng.uniform(8.5, 23.4),
+            "longitude": rng.uniform(102.1, 109.5),
+            "description": rng.choice(DESCRIPTIONS),
+            "images": [
+                {
+                    "hash": f"{rng.getrandbits(256):064x}",
+                    "thumbnail_hash": f"{rng.getrandbits(256):064x}",
+                    "content_type": "image/webp",
+                    "size": rng.randint(20000, 400000),
+                }
+                for _ in range(rng.randint(0, 3))
+            ],
+            "danger_level": rng.choice(["red", "yellow", "green"]),
+            "ai_assessment": "Phân tích tự động: ngập sâu, có người mắc kẹt",
+            "status": rng.choice(["pending", "in_progress", "completed"]),
+            "triage_status": "done",
+            "assigned_team_id": None,
+            "report_count": rng.randint(1, 4),
+            "created_at": created_at,
+            "updated_at": created_at,
+            # Stored fields the API does not return
+            "geohash": "w6ugq",
+            "location": {"type": "Point", "coordinates": [106.0, 16.0]},
+        })
+    return signals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--signals", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    docs = make_signals(args.signals, random.Random(42))
+    signal_list = TypeAdapter(List[SOSSignal])
+
+    cases = {
+        "default (old)": lambda: JSONResponse(
+            jsonable_encoder([SOSSignal.model_validate(doc) for doc in docs])
+        ).body,
+        "pydantic dump_json": lambda: signal_list.dump_json(signal_list.validate_python(docs)),
+        "dto + stdlib json": lambda: JSONResponse([signal_dto(doc) for doc in docs]).body,
+        "dto + FastJSONResponse": lambda: FastJSONResponse([signal_dto(doc) for doc in docs]).body,
+        "encode raw documents": lambda: serialization.dumps(docs),
+    }
+
+    expected = json.loads(cases["default (old)"]())
+    for name in ("pydantic dump_json", "dto + stdlib json", "dto + FastJSONResponse"):
+        if json.loads(cases[name]()) != expected:
+            sys.exit(f"{name} does not match the default response")
+
+    encoder = "orjson" if serialization.orjson is not None else "stdlib json (orjson not installed)"
+    print(f"{args.signals} signals per page, {args.iterations} iterations, FastJSONResponse uses {encoder}")
+    for name, fn in cases.items():
+        seconds = min(timeit.repeat(fn, number=args.iterations, repeat=3))
+        print(f"{name:<24} {seconds / args.iterations * 1e3:8.2f} ms/page")
+
+
+if __name__ == "__main__":
+    main()
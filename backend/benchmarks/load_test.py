@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""Load test for the API, running `server.app` in-process.
+
+Seeds N signals (with stored images) and M rescue teams, then drives a
+weighted mix of requests from concurrent async clients for a fixed duration
+and writes throughput and p50/p95/p99 latency per endpoint to a JSON file.
+Runs against a local mongod by default; `--mongomock` uses mongomock-motor
+instead (no server needed, but geo queries, tiles and counters rebuilds are
+unsupported there and the numbers say little about production).
+
+    python benchmarks/load_test.py --signals 5000 --teams 50 --duration 30 --concurrency 32
+    python benchmarks/load_test.py --mix dashboard --compare load_test_abc1234.json
+
+Client and server share one event loop, so latencies include client-side
+overhead; compare results from the same machine only.
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Incident areas the synthetic calls cluster around: (lat, lon, spread in degrees)
+FLOOD_AREAS = [(16.47, 107.59, 0.15), (15.88, 108.33, 0.1), (21.03, 105.85, 0.2), (10.03, 105.77, 0.25)]
+
+DESCRIPTIONS = [
+    "Nhà tôi bị ngập sâu, có 2 người già và trẻ em mắc kẹt trên mái, cần cứu gấp!",
+    "Nước đang lên rất nhanh, gia đình 5 người đang kêu cứu ở tầng 2",
+    "Đường bị sạt lở, một người bị thương chảy máu nhiều",
+    "Chúng tôi đã an toàn, chỉ cần nước uống và thực phẩm",
+    "Mất điện từ tối qua, cần hỗ trợ lương thực cho khoảng 30 hộ gia đình",
+]
+
+MIXES = {
+    # A flood peak: many new calls, rescuers streaming positions, dashboards polling
+    "flood": {
+        "sos_create": 20, "sos_create_image": 5, "signal_detail": 10, "signals_summary": 8,
+        "location_ping": 20, "location_batch": 5, "track_read": 8, "dashboard_stats": 12,
+        "map_tile": 7, "status_update": 3, "dispatch_suggest": 2, "rescue_queue": 4,
+    },
+    "dashboard": {
+        "signals_summary": 25, "signal_detail": 20, "dashboard_stats": 25, "map_tile": 15, "track_read": 5,
+        "rescue_queue": 10,
+    },
+    "ingest": {"sos_create": 70, "sos_create_image": 15, "sos_upload_image": 15},
+}
+
+# Need aggregation operators mongomock does not implement
+MONGOMOCK_UNSUPPORTED = {"map_tile", "dashboard_stats", "rescue_queue"}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default="sos_load_test")
+    parser.add_argument("--mongomock", action="store_true", help="use mongomock-motor instead of a mongod")
+    parser.add_argument("--signals", type=int, default=5000)
+    parser.add_argument("--teams", type=int, default=50)
+    parser.add_argument("--images", type=int, default=16, help="distinct stored images shared by seeded signals")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds run before measuring")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mix", default="flood", help=f"one of {', '.join(MIXES)} or name=weight,...")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--bcrypt-rounds", type=int, default=4, help="keep logins cheap while seeding")
+    parser.add_argument("--output", help="JSON report path (default load_test_<commit>.json)")
+    parser.add_argument("--compare", help="earlier JSON report to diff p95 latencies against")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded database")
+    return parser.parse_args()
+
+
+def parse_mix(value: str) -> dict:
+    if value in MIXES:
+        return MIXES[value]
+    mix = {}
+    for part in value.split(","):
+        name, weight = part.split("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight)
+    return mix
+
+
+def configure_environment(args, blob_dir: str) -> None:
+    """Must run before `server` is imported: it reads its settings at import time."""
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = args.db_name
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    if args.mongomock:
+        try:
+            import motor.motor_asyncio
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise SystemExit("--mongomock needs the mongomock-motor package")
+        motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+        # GridFS is not available on mongomock
+        os.environ["BLOB_STORE"] = "disk"
+        os.environ["BLOB_STORE_DIR"] = blob_dir
+
+
+def random_position(rng: random.Random) -> tuple:
+    lat, lon, spread = rng.choice(FLOOD_AREAS)
+    return lat + rng.gauss(0, spread), lon + rng.gauss(0, spread)
+
+
+def noise_jpeg(rng: random.Random, size=(640, 480)) -> bytes:
+    from PIL import Image
+    pixels = np.random.default_rng(rng.randrange(2 ** 32)).integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+async def seed_signals(server, args, rng: random.Random) -> list:
+    from geo import geohash_encode, point
+
+    images = [await server.blob_store.store_image(noise_jpeg(rng)) for _ in range(args.images)]
+    now = datetime.now(timezone.utc)
+    ids = []
+    batch = []
+    for i in range(args.signals):
+        lat, lon = random_position(rng)
+        created_at = (now - timedelta(seconds=rng.uniform(0, 86400))).isoformat()
+        signal_id = str(uuid.uuid4())
+        ids.append(signal_id)
+        batch.append({
+            "id": signal_id,
+            "latitude": lat,
+            "longitude": lon,
+            "location": point(lat, lon),
+            "geohash": geohash_encode(lat, lon),
+            "description": rng.choice(DESCRIPTIONS),
+            "images": rng.sample(images, rng.choice([0, 0, 1, 2])),
+            "danger_level": rng.choices(["red", "yellow", "green"], [2, 5, 3])[0],
+            "ai_assessment": "Seeded",
+            "triage_status": "done",
+            "status": rng.choices(["pending", "in_progress", "completed"], [6, 2, 2])[0],
+            "assigned_team_id": None,
+            "report_count": 1,
+            "created_at": created_at,
+            "updated_at": created_at,
+        })
+        if len(batch) == 1000:
+            await server.db.sos_signals.insert_many(batch)
+            batch = []
+    if batch:
+        await server.db.sos_signals.insert_many(batch)
+    return ids
+
+
+async def start_server(server) -> None:
+    try:
+        await server.startup_db()
+    except Exception as e:
+        # mongomock lacks time-series collections, $currentOp and a few operators
+        print(f"startup incomplete on this backend ({type(e).__name__}: {e}); starting workers directly")
+        for service in (server.triage_queue, server.location_buffer, server.tile_cache, server.response_cache, server.dispatch_index, server.broadcast):
+            service.start()
+
+
+async def seed_teams(client, args, rng: random.Random) -> list:
+    teams = []
+    for i in range(args.teams):
+        credentials = {"username": f"loadtest-{i}", "password": "load-test-password"}
+        await client.post("/api/rescue/register", json={**credentials, "team_name": f"Đội {i}"})
+        response = await client.post("/api/rescue/login", json=credentials)
+        response.raise_for_status()
+        body = response.json()
+        teams.append({"id": body["team"]["id"], "headers": {"Authorization": f"Bearer {body['access_token']}"}})
+    return teams
+
+
+class Context:
+    def __init__(self, client, signal_ids: list, teams: list, image: bytes, rng: random.Random):
+        self.client = client
+        self.signal_ids = signal_ids
+        self.teams = teams
+        self.image = image
+        self.image_b64 = base64.b64encode(image).decode()
+        self.rng = rng
+
+    def signal_id(self) -> str:
+        return self.rng.choice(self.signal_ids)
+
+    def team(self) -> dict:
+        return self.rng.choice(self.teams)
+
+
+def sos_fields(ctx: Context) -> dict:
+    lat, lon = random_position(ctx.rng)
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "description": f"{ctx.rng.choice(DESCRIPTIONS)} #{ctx.rng.randrange(10 ** 6)}",
+        "user_selected_level": ctx.rng.choice(["red", "yellow", "green"]),
+    }
+
+
+async def sos_create(ctx: Context, with_image: bool = False):
+    payload = {**sos_fields(ctx), "images_base64": [ctx.image_b64] if with_image else []}
+    response = await ctx.client.post("/api/sos/create", json=payload)
+    if response.status_code == 200:
+        ctx.signal_ids.append(response.json()["id"])
+    return response
+
+
+async def sos_upload_image(ctx: Context):
+    response = await ctx.client.post(
+        "/api/sos/create/upload",
+        data={key: str(value) for key, value in sos_fields(ctx).items()},
+        files=[("images", ("photo.jpg", ctx.image, "image/jpeg"))],
+    )
+    if response.status_code == 200:
+        ctx.signal_ids.append(response.json()["id"])
+    return response
+
+
+async def location_ping(ctx: Context):
+    lat, lon = random_position(ctx.rng)
+    return await ctx.client.post(
+        "/api/rescue/location",
+        json={"signal_id": ctx.signal_id(), "latitude": lat, "longitude": lon},
+        headers=ctx.team()["headers"],
+    )
+
+
+async def location_batch(ctx: Context):
+    signal_id = ctx.signal_id()
+    lat, lon = random_position(ctx.rng)
+    points = [{"signal_id": signal_id, "latitude": lat + i * 1e-4, "longitude": lon} for i in range(20)]
+    return await ctx.client.post("/api/rescue/location/batch", json={"points": points}, headers=ctx.team()["headers"])
+
+
+async def map_tile(ctx: Context):
+    from geo import tile_for
+    lat, lon = random_position(ctx.rng)
+    z = ctx.rng.choice([6, 8, 10, 12])
+    x, y = tile_for(lat, lon, z)
+    return await ctx.client.get(f"/api/sos/tiles/{z}/{x}/{y}")
+
+
+async def status_update(ctx: Context):
+    return await ctx.client.put(
+        f"/api/sos/signals/{ctx.signal_id()}/status",
+        json={"status": ctx.rng.choice(["in_progress", "completed"])},
+        headers=ctx.team()["headers"],
+    )
+
+
+SCENARIOS = {
+    "sos_create": sos_create,
+    "sos_create_image": lambda ctx: sos_create(ctx, with_image=True),
+    "sos_upload_image": sos_upload_image,
+    "signal_detail": lambda ctx: ctx.client.get(f"/api/sos/signals/{ctx.signal_id()}"),
+    "signals_summary": lambda ctx: ctx.client.get("/api/sos/signals", params={"fields": "summary", "limit": 100}),
+    "location_ping": location_ping,
+    "location_batch": location_batch,
+    "track_read": lambda ctx: ctx.client.get(f"/api/rescue/location/{ctx.signal_id()}"),
+    "dashboard_stats": lambda ctx: ctx.client.get("/api/rescue/dashboard/stats", headers=ctx.team()["headers"]),
+    "rescue_queue": lambda ctx: ctx.client.get("/api/rescue/queue", params={"limit": 50}, headers=ctx.team()["headers"]),
+    "map_tile": map_tile,
+    "status_update": status_update,
+    "dispatch_suggest": lambda ctx: ctx.client.get(
+        f"/api/dispatch/suggest/{ctx.signal_id()}", headers=ctx.team()["headers"]
+    ),
+}
+
+
+async def worker(ctx: Context, mix: dict, measure_from: float, deadline: float, samples: dict) -> None:
+    names, weights = list(mix), list(mix.values())
+    while True:
+        started = time.perf_counter()
+        if started >= deadline:
+            return
+        name = ctx.rng.choices(names, weights)[0]
+        try:
+            response = await SCENARIOS[name](ctx)
+            status = response.status_code
+        except Exception as e:
+            status = type(e).__name__
+        if started >= measure_from:
+            samples.setdefault(name, []).append((time.perf_counter() - started, status))
+
+
+def summarize(samples: dict, duration: float) -> dict:
+    endpoints = {}
+    for name, results in sorted(samples.items()):
+        latencies = np.array([latency for latency, _ in results]) * 1000
+        statuses = {}
+        for _, status in results:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        errors = sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 500)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        endpoints[name] = {
+            "requests": len(results),
+            "throughput_rps": round(len(results) / duration, 1),
+            "errors": errors,
+            "status": statuses,
+            "mean_ms": round(float(latencies.mean()), 2),
+            "p50_ms": round(float(p50), 2),
+            "p95_ms": round(float(p95), 2),
+            "p99_ms": round(float(p99), 2),
+            "max_ms": round(float(latencies.max()), 2),
+        }
+    total = sum(endpoint["requests"] for endpoint in endpoints.values())
+    return {
+        "requests": total,
+        "throughput_rps": round(total / duration, 1),
+        "errors": sum(endpoint["errors"] for endpoint in endpoints.values()),
+        "endpoints": endpoints,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(report: dict, baseline: dict = None) -> None:
+    print(f"\n{report['requests']} requests, {report['throughput_rps']} req/s, {report['errors']} errors")
+    print(f"{'endpoint':<18} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}" + ("  p95 vs base" if baseline else ""))
+    for name, endpoint in report["endpoints"].items():
+        line = (f"{name:<18} {endpoint['throughput_rps']:>8} {endpoint['p50_ms']:>8} "
+                f"{endpoint['p95_ms']:>8} {endpoint['p99_ms']:>8} {endpoint['errors']:>7}")
+        previous = (baseline or {}).get("endpoints", {}).get(name)
+        if previous and previous["p95_ms"]:
+            line += f"  {(endpoint['p95_ms'] / previous['p95_ms'] - 1) * 100:+.1f}%"
+        print(line)
+
+
+async def run(args) -> dict:
+    import httpx
+    import server
+
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    if args.mongomock:
+        skipped = sorted(MONGOMOCK_UNSUPPORTED & set(mix))
+        if skipped:
+            print(f"Skipping {', '.join(skipped)} on mongomock")
+        mix = {name: weight for name, weight in mix.items() if name not in MONGOMOCK_UNSUPPORTED}
+    # One INFO line per request would dominate the client side of the measurement
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    print(f"Seeding {args.signals} signals and {args.images} images...")
+    signal_ids = await seed_signals(server, args, rng)
+    await start_server(server)
+    transport = httpx.ASGITransport(app=server.app)
+    limits = httpx.Limits(max_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test", limits=limits, timeout=60) as client:
+            print(f"Registering {args.teams} teams...")
+            teams = await seed_teams(client, args, rng)
+            image = noise_jpeg(rng, (320, 240))
+
+            print(f"Running '{args.mix}' with {args.concurrency} clients for {args.warmup}+{args.duration}s...")
+            samples = {}
+            measure_from = time.perf_counter() + args.warmup
+            deadline = measure_from + args.duration
+            await asyncio.gather(*(
+                worker(Context(client, signal_ids, teams, image, random.Random(args.seed * 1000 + i)),
+                       mix, measure_from, deadline, samples)
+                for i in range(args.concurrency)
+            ))
+    finally:
+        if not args.keep and not args.mongomock:
+            await server.client.drop_database(args.db_name)
+        await server.shutdown_db_client()
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "backend": "mongomock" if args.mongomock else "mongod",
+            "python": platform.python_version(),
+            "signals": args.signals,
+            "teams": args.teams,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "mix": mix,
+            "seed": args.seed,
+        },
+        **summarize(samples, args.duration),
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    with tempfile.TemporaryDirectory(prefix="sos-load-test-") as blob_dir:
+        configure_environment(args, blob_dir)
+        report = asyncio.run(run(args))
+
+    output = args.output or f"load_test_{report['meta']['commit']}.json"
+    Path(output).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(report, baseline)
+    print(f"\nWrote {output}")
+
+
+if __name__ == "__main__":
+    main()
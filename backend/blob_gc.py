@@ -0,0 +1,86 @@
+"""Delayed collection of images stored for submissions that failed.
+
+A submission stores its images before the signal is validated and
+inserted. When that fails, the blobs cannot simply be deleted: they are
+content-addressed, so a concurrent submission of the same photo may be
+about to reference them. Instead they are queued in `orphaned_blobs`, and
+OrphanedBlobCollector deletes a queued blob only once it has been queued
+for `grace` and no signal, active or archived, references it. Storing the
+same photo again takes it off the queue, so a blob is never collected
+while a submission that uses it may still be in flight.
+"""
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import List
+
+from pymongo import UpdateOne
+
+from archive import ARCHIVE_COLLECTION
+from jobs import LeasedJob
+
+logger = logging.getLogger(__name__)
+
+ORPHANED_BLOBS = "orphaned_blobs"
+
+
+class OrphanedBlobCollector(LeasedJob):
+    STATE_ID = "orphaned_blob_collector"
+    DESCRIPTION = "Orphaned image collection"
+
+    def __init__(self, db, blob_store, grace: timedelta = timedelta(hours=1), interval: float = 600.0,
+                 batch_size: int = 200):
+        super().__init__(db, interval)
+        self.blob_store = blob_store
+        self.grace = grace
+        self.batch_size = batch_size
+        self.collected = 0
+
+    async def queue(self, images: List[dict]) -> None:
+        """Schedule the blobs of these image references for collection."""
+        if not images:
+            return
+        now = datetime.now(timezone.utc)
+        await self.db[ORPHANED_BLOBS].bulk_write([
+            UpdateOne(
+                {"_id": image["hash"]},
+                {"$set": {"thumbnail_hash": image["thumbnail_hash"], "queued_at": now}},
+                upsert=True,
+            )
+            for image in images
+        ], ordered=False)
+
+    async def keep(self, images: List[dict]) -> None:
+        """Take blobs that a new submission stored again off the queue."""
+        await self.db[ORPHANED_BLOBS].delete_many({"_id": {"$in": [image["hash"] for image in images]}})
+
+    async def _referenced(self, image_hash: str) -> bool:
+        in_use = {"images.hash": image_hash}
+        return bool(
+            await self.db.sos_signals.find_one(in_use, {"_id": 1})
+            or await self.db[ARCHIVE_COLLECTION].find_one(in_use, {"_id": 1})
+        )
+
+    async def run_once(self) -> int:
+        now = datetime.now(timezone.utc)
+        if await self._acquire(now) is None:
+            return 0
+
+        collected = 0
+        while True:
+            queued = await self.db[ORPHANED_BLOBS].find(
+                {"queued_at": {"$lt": now - self.grace}}
+            ).limit(self.batch_size).to_list(self.batch_size)
+            for entry in queued:
+                if not await self._referenced(entry["_id"]):
+                    await self.blob_store.delete(entry["_id"])
+                    await self.blob_store.delete(entry["thumbnail_hash"])
+                    collected += 1
+                # Queued again meanwhile: leave it for a later round
+                await self.db[ORPHANED_BLOBS].delete_one({"_id": entry["_id"], "queued_at": entry["queued_at"]})
+            if len(queued) < self.batch_size:
+                break
+
+        self.collected += collected
+        if collected:
+            logger.info(f"Deleted {collected} images left behind by failed submissions")
+        return collected
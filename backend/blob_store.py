@@ -0,0 +1,230 @@
+"""Content-addressed storage for SOS images.
+
+Blobs are keyed by the SHA-256 of their bytes, so the same photo submitted
+twice is stored once. Images are normalized before storage: rotated upright,
+stripped of metadata, downscaled to MAX_IMAGE_DIMENSION and re-encoded as
+WebP. Clients that already send a WebP within the bound and without EXIF
+or XMP (as the web form does) are stored byte for byte, which skips the
+re-encode. Every image also gets a small JPEG thumbnail, stored as its own
+blob, so list and detail views never have to pull the original.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+CHUNK_SIZE = 256 * 1024
+MAX_IMAGE_DIMENSION = 1600
+MAX_SOURCE_PIXELS = 50_000_000
+IMAGE_QUALITY = 80
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_QUALITY = 75
+# Images normalized at once per store; each decode can hold a few hundred MB
+IMAGE_WORKERS = 2
+# Image.info entries that must not survive into a stored image
+METADATA_KEYS = ("exif", "xmp", "XML:com.adobe.xmp")
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class InvalidImageError(ValueError):
+    pass
+
+
+@dataclass
+class BlobInfo:
+    hash: str
+    content_type: str
+    length: int
+
+
+def is_blob_hash(value: str) -> bool:
+    return bool(_HASH_RE.match(value))
+
+
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _prepare_image(data: bytes) -> tuple:
+    """Normalize the image and render its thumbnail. CPU-bound, run in a thread."""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            if img.width * img.height > MAX_SOURCE_PIXELS:
+                raise InvalidImageError(f"Image too large: {img.width}x{img.height}")
+            # Only a bare WebP can be kept as sent; EXIF and XMP carry GPS positions and device details
+            keep_as_sent = (
+                img.format == "WEBP"
+                and max(img.size) <= MAX_IMAGE_DIMENSION
+                and not getattr(img, "is_animated", False)
+                and not any(key in img.info for key in METADATA_KEYS)
+            )
+            if not keep_as_sent:
+                # JPEG can decode straight at a reduced scale, which is most of the cost
+                img.draft("RGB", (MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION))
+            img = ImageOps.exif_transpose(img)
+            if keep_as_sent:
+                normalized = data
+            else:
+                img.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION))
+                if img.mode not in ("RGB", "RGBA", "L"):
+                    img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+                out = io.BytesIO()
+                img.save(out, format="WEBP", quality=IMAGE_QUALITY, exif=b"", xmp=b"")
+                normalized = out.getvalue()
+
+            img.thumbnail(THUMBNAIL_SIZE)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            out = io.BytesIO()
+            img.save(out, format="JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise InvalidImageError(str(e)) from e
+
+    return "image/webp", normalized, out.getvalue()
+
+
+class BlobStore:
+    def __init__(self, image_workers: int = IMAGE_WORKERS):
+        # Without a bound, a burst of uploads queues every decode on the default thread pool at once
+        self._image_slots = asyncio.Semaphore(image_workers)
+
+    async def put(self, data: bytes, content_type: str) -> str:
+        raise NotImplementedError
+
+    async def info(self, blob_hash: str) -> Optional[BlobInfo]:
+        raise NotImplementedError
+
+    def stream(self, blob_hash: str) -> AsyncIterator[bytes]:
+        raise NotImplementedError
+
+    async def delete(self, blob_hash: str) -> None:
+        """Remove the blob; a blob that does not exist is ignored."""
+        raise NotImplementedError
+
+    async def store_image(self, data: bytes) -> dict:
+        """Store the normalized image and its thumbnail, returning the reference kept on the signal."""
+        async with self._image_slots:
+            content_type, image, thumbnail = await asyncio.to_thread(_prepare_image, data)
+        image_hash = await self.put(image, content_type)
+        thumbnail_hash = await self.put(thumbnail, "image/jpeg")
+        return {
+            "hash": image_hash,
+            "thumbnail_hash": thumbnail_hash,
+            "content_type": content_type,
+            "size": len(image),
+        }
+
+
+class GridFSBlobStore(BlobStore):
+    def __init__(self, db, bucket_name: str = "sos_images", image_workers: int = IMAGE_WORKERS):
+        super().__init__(image_workers)
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=bucket_name, chunk_size_bytes=CHUNK_SIZE)
+        self.files = db[f"{bucket_name}.files"]
+
+    async def put(self, data: bytes, content_type: str) -> str:
+        blob_hash = sha256_hex(data)
+        if await self.files.find_one({"filename": blob_hash}, {"_id": 1}):
+            return blob_hash
+        await self.bucket.upload_from_stream(blob_hash, data, metadata={"contentType": content_type})
+        return blob_hash
+
+    async def info(self, blob_hash: str) -> Optional[BlobInfo]:
+        doc = await self.files.find_one({"filename": blob_hash}, {"length": 1, "metadata": 1})
+        if not doc:
+            return None
+        content_type = (doc.get("metadata") or {}).get("contentType", "application/octet-stream")
+        return BlobInfo(hash=blob_hash, content_type=content_type, length=doc["length"])
+
+    async def stream(self, blob_hash: str) -> AsyncIterator[bytes]:
+        grid_out = await self.bucket.open_download_stream_by_name(blob_hash)
+        while True:
+            chunk = await grid_out.readchunk()
+            if not chunk:
+                break
+            yield chunk
+
+    async def delete(self, blob_hash: str) -> None:
+        async for doc in self.files.find({"filename": blob_hash}, {"_id": 1}):
+            try:
+                await self.bucket.delete(doc["_id"])
+            except NoFile:
+                # Deleted concurrently
+                pass
+
+
+class LocalDiskBlobStore(BlobStore):
+    def __init__(self, root: Path, image_workers: int = IMAGE_WORKERS):
+        super().__init__(image_workers)
+        self.root = Path(root)
+
+    def _path(self, blob_hash: str) -> Path:
+        return self.root / blob_hash[:2] / blob_hash
+
+    def _write(self, blob_hash: str, data: bytes, content_type: str) -> None:
+        path = self._path(blob_hash)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        path.with_suffix(".json").write_text(json.dumps({"content_type": content_type}))
+        os.replace(tmp, path)
+
+    def _info(self, blob_hash: str) -> Optional[BlobInfo]:
+        path = self._path(blob_hash)
+        try:
+            length = path.stat().st_size
+            meta = json.loads(path.with_suffix(".json").read_text())
+        except FileNotFoundError:
+            return None
+        return BlobInfo(hash=blob_hash, content_type=meta["content_type"], length=length)
+
+    def _delete(self, blob_hash: str) -> None:
+        path = self._path(blob_hash)
+        for stale in (path, path.with_suffix(".json")):
+            try:
+                stale.unlink()
+            except FileNotFoundError:
+                pass
+
+    async def put(self, data: bytes, content_type: str) -> str:
+        blob_hash = sha256_hex(data)
+        await asyncio.to_thread(self._write, blob_hash, data, content_type)
+        return blob_hash
+
+    async def info(self, blob_hash: str) -> Optional[BlobInfo]:
+        return await asyncio.to_thread(self._info, blob_hash)
+
+    async def stream(self, blob_hash: str) -> AsyncIterator[bytes]:
+        f = await asyncio.to_thread(open, self._path(blob_hash), "rb")
+        try:
+            while True:
+                chunk = await asyncio.to_thread(f.read, CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            f.close()
+
+    async def delete(self, blob_hash: str) -> None:
+        await asyncio.to_thread(self._delete, blob_hash)
+
+
+def create_blob_store(db) -> BlobStore:
+    backend = os.environ.get("BLOB_STORE", "gridfs")
+    image_workers = int(os.environ.get("IMAGE_WORKERS", IMAGE_WORKERS))
+    if backend == "disk":
+        return LocalDiskBlobStore(Path(os.environ.get("BLOB_STORE_DIR", "/app/blobs")), image_workers)
+    if backend == "gridfs":
+        return GridFSBlobStore(db, image_workers=image_workers)
+    raise ValueError(f"Unknown BLOB_STORE backend: {backend}")
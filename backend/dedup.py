@@ -0,0 +1,113 @@
+"""Ingest-time detection of repeated SOS submissions.
+
+During floods one household often sends the same call from several phones.
+A new submission is treated as a repeat of an open signal from the last
+window when it either shares an image with it (within a few km), or was
+sent from within a small radius with a similar description. Repeats are
+merged into the existing incident, bumping its `report_count`, instead of
+creating a new signal and a new triage run.
+
+The check costs at most two indexed queries, each capped at a handful of
+candidates: one on `images.hash` and one on geohash prefix ranges around the
+caller. Descriptions are compared by Jaccard similarity of character
+shingles over the diacritic-folded text; with so few candidates an exact
+comparison is cheaper than maintaining MinHash signatures. Two simultaneous
+submissions can still both be stored, which only costs one extra signal.
+"""
+from datetime import datetime, timezone, timedelta
+from typing import List, Optional
+
+from pymongo import ReturnDocument
+
+from geo import distance_m, geohash_query, radius_bbox
+from triage import normalize
+
+OPEN_STATUSES = ["pending", "in_progress"]
+SHINGLE_SIZE = 4
+# Raw text of merged reports kept on the incident, newest last
+MAX_KEPT_REPORTS = 20
+
+
+def shingles(text: str) -> set:
+    text = normalize(text)
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def similarity(a: str, b: str) -> float:
+    left, right = shingles(a), shingles(b)
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+class DuplicateDetector:
+    CANDIDATE_PROJECTION = {"_id": 0, "id": 1, "latitude": 1, "longitude": 1, "description": 1}
+
+    def __init__(
+        self,
+        db,
+        radius_m: float = 150.0,
+        image_radius_m: float = 2000.0,
+        window: timedelta = timedelta(hours=1),
+        min_similarity: float = 0.6,
+        max_candidates: int = 20,
+    ):
+        self.db = db
+        self.radius_m = radius_m
+        self.image_radius_m = image_radius_m
+        self.window = window
+        self.min_similarity = min_similarity
+        self.max_candidates = max_candidates
+
+    async def _candidates(self, query: dict) -> List[dict]:
+        return await self.db.sos_signals.find(query, self.CANDIDATE_PROJECTION).sort(
+            "created_at", -1
+        ).limit(self.max_candidates).to_list(self.max_candidates)
+
+    async def find_duplicate(
+        self, latitude: float, longitude: float, description: str, image_hashes: List[str]
+    ) -> Optional[dict]:
+        since = (datetime.now(timezone.utc) - self.window).isoformat()
+        recent = {"created_at": {"$gte": since}, "status": {"$in": OPEN_STATUSES}}
+
+        if image_hashes:
+            for candidate in await self._candidates({**recent, "images.hash": {"$in": image_hashes}}):
+                if distance_m(latitude, longitude, candidate["latitude"], candidate["longitude"]) <= self.image_radius_m:
+                    return candidate
+
+        best, best_similarity = None, self.min_similarity
+        area = geohash_query(radius_bbox(latitude, longitude, self.radius_m), max_cells=9)
+        for candidate in await self._candidates({**recent, **area}):
+            if distance_m(latitude, longitude, candidate["latitude"], candidate["longitude"]) > self.radius_m:
+                continue
+            score = similarity(description, candidate["description"])
+            if score >= best_similarity:
+                best, best_similarity = candidate, score
+        return best
+
+    async def merge(
+        self, signal_id: str, report: dict, images: List[dict], idempotency_key: Optional[str] = None
+    ) -> Optional[dict]:
+        """Fold a repeated report into an existing signal; returns the updated signal.
+
+        With an idempotency key, a report already merged under that key is not
+        merged again and None is returned.
+        """
+        query = {"id": signal_id}
+        add = {"images": {"$each": images}}
+        if idempotency_key:
+            query["idempotency_keys"] = {"$ne": idempotency_key}
+            add["idempotency_keys"] = idempotency_key
+        return await self.db.sos_signals.find_one_and_update(
+            query,
+            {
+                "$inc": {"report_count": 1},
+                "$addToSet": add,
+                "$push": {"reports": {"$each": [report], "$slice": -MAX_KEPT_REPORTS}},
+                "$set": {"updated_at": report["created_at"]},
+            },
+            projection={"_id": 0, "images_base64": 0, "reports": 0, "idempotency_keys": 0},
+            return_document=ReturnDocument.AFTER,
+        )
@@ -0,0 +1,203 @@
+"""Nearest-available-team dispatch recommendations.
+
+DispatchIndex keeps an in-memory snapshot of every team's latest position
+(from the `rescue_team_positions` read model) and its workload (signals it
+has in progress), bucketed into a fixed lat/lon grid. A lookup only measures
+teams in the grid cells within reach of the signal, with NumPy haversine
+over the candidates. Teams are ranked by distance plus a fixed penalty per
+active mission, so a slightly farther idle team beats a busy one next door.
+
+The snapshot is rebuilt every few seconds by each worker; recommendations
+are advisory and never assign a team by themselves.
+"""
+import asyncio
+import logging
+import math
+from dataclasses import dataclass, field
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from geo import EARTH_RADIUS_M
+
+logger = logging.getLogger(__name__)
+
+GRID_DEGREES = 0.25
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def haversine_m(lat: np.ndarray, lon: np.ndarray, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle distances in meters between broadcastable arrays of radians."""
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def grid_cell(latitude: float, longitude: float) -> tuple:
+    return math.floor(latitude / GRID_DEGREES), math.floor(longitude / GRID_DEGREES)
+
+
+@dataclass
+class TeamSnapshot:
+    team_ids: List[str] = field(default_factory=list)
+    lat: np.ndarray = field(default_factory=lambda: np.empty(0))
+    lon: np.ndarray = field(default_factory=lambda: np.empty(0))
+    workload: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int64))
+    last_seen: List[str] = field(default_factory=list)
+    grid: Dict[tuple, np.ndarray] = field(default_factory=dict)
+    built_at: Optional[datetime] = None
+
+    def nearby(self, cell: tuple, radius_m: float) -> np.ndarray:
+        """Indices of teams in the grid cells that can hold a point within `radius_m` of `cell`."""
+        row, col = cell
+        rows = math.ceil(radius_m / METERS_PER_DEGREE / GRID_DEGREES)
+        # Longitude degrees shrink toward the poles; size the span for the cell's poleward edge
+        edge_lat = min(89.0, max(abs(row), abs(row + 1)) * GRID_DEGREES)
+        cols = math.ceil(radius_m / (METERS_PER_DEGREE * math.cos(math.radians(edge_lat))) / GRID_DEGREES)
+        if (2 * rows + 1) * (2 * cols + 1) > len(self.grid):
+            return np.arange(len(self.team_ids))
+        found = [
+            self.grid[key]
+            for key in ((r, c) for r in range(row - rows, row + rows + 1) for c in range(col - cols, col + cols + 1))
+            if key in self.grid
+        ]
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+
+class DispatchIndex:
+    def __init__(
+        self,
+        db,
+        refresh_interval: float = 5.0,
+        stale_after: timedelta = timedelta(hours=1),
+        max_load: int = 3,
+        workload_penalty_m: float = 5000.0,
+    ):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self.stale_after = stale_after
+        self.max_load = max_load
+        self.workload_penalty_m = workload_penalty_m
+        self.snapshot = TeamSnapshot()
+        self._task = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._refresh_periodically())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _refresh_periodically(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Dispatch index refresh failed: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    async def refresh(self) -> None:
+        now = datetime.now(timezone.utc)
+        # Positions are stored with ISO timestamps in UTC, which sort as strings
+        positions = await self.db.rescue_team_positions.find(
+            {"timestamp": {"$gte": (now - self.stale_after).isoformat()}},
+            {"_id": 1, "latitude": 1, "longitude": 1, "timestamp": 1}
+        ).to_list(None)
+        active = await self.db.sos_signals.aggregate([
+            {"$match": {"status": "in_progress", "assigned_team_id": {"$ne": None}}},
+            {"$group": {"_id": "$assigned_team_id", "count": {"$sum": 1}}},
+        ]).to_list(None)
+        workload = {group["_id"]: group["count"] for group in active}
+
+        cells = {}
+        for i, position in enumerate(positions):
+            cells.setdefault(grid_cell(position["latitude"], position["longitude"]), []).append(i)
+        self.snapshot = TeamSnapshot(
+            team_ids=[position["_id"] for position in positions],
+            lat=np.radians([position["latitude"] for position in positions]),
+            lon=np.radians([position["longitude"] for position in positions]),
+            workload=np.array([workload.get(position["_id"], 0) for position in positions], dtype=np.int64),
+            last_seen=[position["timestamp"] for position in positions],
+            grid={cell: np.array(indices, dtype=np.int64) for cell, indices in cells.items()},
+            built_at=now,
+        )
+
+    def suggest(self, latitude: float, longitude: float, k: int = 5, max_distance_m: float = 50000.0) -> List[dict]:
+        """The `k` best-ranked teams within `max_distance_m`, busy ones included but ranked lower."""
+        snapshot = self.snapshot
+        candidates = snapshot.nearby(grid_cell(latitude, longitude), max_distance_m)
+        if not len(candidates):
+            return []
+        distances = haversine_m(math.radians(latitude), math.radians(longitude), snapshot.lat[candidates], snapshot.lon[candidates])
+        within = distances <= max_distance_m
+        candidates, distances = candidates[within], distances[within]
+        scores = distances + snapshot.workload[candidates] * self.workload_penalty_m
+        best = np.argsort(scores, kind="stable")[:k]
+        return [
+            {
+                "team_id": snapshot.team_ids[candidates[i]],
+                "distance_m": round(float(distances[i]), 1),
+                "workload": int(snapshot.workload[candidates[i]]),
+                "available": bool(snapshot.workload[candidates[i]] < self.max_load),
+                "last_seen": snapshot.last_seen[candidates[i]],
+                "score": round(float(scores[i]), 1),
+            }
+            for i in best
+        ]
+
+    def plan(self, signals: List[dict], max_distance_m: float = 50000.0) -> dict:
+        """Greedily match signals, in the given priority order, to teams with spare capacity.
+
+        Distances are computed one grid cell of signals at a time against the
+        teams around that cell, so the work grows with local density rather
+        than with signals x teams.
+        """
+        snapshot = self.snapshot
+        remaining = np.maximum(self.max_load - snapshot.workload, 0)
+        by_cell = {}
+        for i, signal in enumerate(signals):
+            by_cell.setdefault(grid_cell(signal["latitude"], signal["longitude"]), []).append(i)
+
+        # Ranked (team index, distance) candidates per signal, before capacity is considered
+        ranked = {}
+        for cell, members in by_cell.items():
+            teams = snapshot.nearby(cell, max_distance_m)
+            if not len(teams):
+                continue
+            lat = np.radians([signals[i]["latitude"] for i in members])[:, None]
+            lon = np.radians([signals[i]["longitude"] for i in members])[:, None]
+            distances = haversine_m(lat, lon, snapshot.lat[teams][None, :], snapshot.lon[teams][None, :])
+            order = np.argsort(distances + snapshot.workload[teams] * self.workload_penalty_m, axis=1, kind="stable")
+            for row, i in enumerate(members):
+                row_distances = distances[row, order[row]]
+                keep = row_distances <= max_distance_m
+                ranked[i] = (teams[order[row][keep]], row_distances[keep])
+
+        assignments, unassigned = [], []
+        for i, signal in enumerate(signals):
+            teams, distances = ranked.get(i, ((), ()))
+            for team, distance in zip(teams, distances):
+                if remaining[team] > 0:
+                    remaining[team] -= 1
+                    assignments.append({
+                        "signal_id": signal["id"],
+                        "team_id": snapshot.team_ids[team],
+                        "distance_m": round(float(distance), 1),
+                    })
+                    break
+            else:
+                unassigned.append(signal["id"])
+        return {"assignments": assignments, "unassigned": unassigned}
+
+    def stats(self) -> dict:
+        snapshot = self.snapshot
+        return {
+            "teams": len(snapshot.team_ids),
+            "grid_cells": len(snapshot.grid),
+            "busy_teams": int((snapshot.workload >= self.max_load).sum()),
+            "built_at": snapshot.built_at.isoformat() if snapshot.built_at else None,
+        }
@@ -0,0 +1,295 @@
+"""In-process pub/sub for real-time pushes to WebSocket clients.
+
+Handlers publish `signal.created`, `signal.status_changed`, `signal.triaged`,
+`signal.reported`, `signal.archived` and `rescue.location` events to the bus. Each connected client owns a
+Subscription that filters events by signal id or by map viewport. With
+several workers, a ChangeStreamSource can feed the bus from MongoDB
+instead, so every worker sees every write.
+
+In-process state that no signal write describes (cached teams, manual cache
+flushes) is kept coherent with a Broadcast: messages published on one
+worker run the topic's handlers on every worker. EVENT_BUS selects both
+backends together: `memory` for a single worker, `changestream` for N.
+"""
+import asyncio
+import inspect
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+SIGNAL_CREATED = "signal.created"
+SIGNAL_STATUS_CHANGED = "signal.status_changed"
+SIGNAL_TRIAGED = "signal.triaged"
+# A repeated submission was merged into the signal
+SIGNAL_REPORTED = "signal.reported"
+# A completed signal moved to the archive collection
+SIGNAL_ARCHIVED = "signal.archived"
+RESCUE_LOCATION = "rescue.location"
+
+# Broadcast topics
+TEAM_CHANGED = "team.changed"
+CACHES_CLEARED = "caches.cleared"
+
+
+class Subscription:
+    def __init__(self, max_queue: int = 256):
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.signal_ids = set()
+        self.bbox: Optional[tuple] = None
+        self.dropped = 0
+
+    def matches(self, event: dict) -> bool:
+        if event.get("signal_id") in self.signal_ids:
+            return True
+        if self.bbox and event.get("latitude") is not None:
+            min_lon, min_lat, max_lon, max_lat = self.bbox
+            return min_lon <= event["longitude"] <= max_lon and min_lat <= event["latitude"] <= max_lat
+        return False
+
+
+class EventBus:
+    def __init__(self):
+        self.subscriptions = set()
+        # When a change stream feeds the bus, handlers must not publish the same write again
+        self.local_publish = True
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription()
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self.subscriptions.discard(subscription)
+
+    def dispatch(self, event: dict) -> None:
+        for subscription in self.subscriptions:
+            if not subscription.matches(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # A slow client loses events rather than stalling every publisher
+                subscription.dropped += 1
+
+    def publish(self, event_type: str, signal_id: str, latitude: float, longitude: float, data: dict) -> None:
+        if self.local_publish:
+            self.dispatch(make_event(event_type, signal_id, latitude, longitude, data))
+
+
+async def consume(
+    subscription: Subscription,
+    handle: Callable[[dict], Awaitable[None]],
+    on_lost: Callable[[], Awaitable[None]],
+) -> None:
+    """Pass every event on the subscription to `handle`, forever.
+
+    If events were dropped while the queue was full, `on_lost` runs before
+    the next one: caches fed by the bus cannot tell which entries the lost
+    events changed, so they drop everything.
+    """
+    dropped = 0
+    while True:
+        event = await subscription.queue.get()
+        if subscription.dropped != dropped:
+            dropped = subscription.dropped
+            await on_lost()
+        await handle(event)
+
+
+def make_event(event_type: str, signal_id: str, latitude: float, longitude: float, data: dict) -> dict:
+    return {
+        "type": event_type,
+        "signal_id": signal_id,
+        "latitude": latitude,
+        "longitude": longitude,
+        "data": data,
+    }
+
+
+def signal_event_data(signal: dict) -> dict:
+    return {
+        "id": signal["id"],
+        "latitude": signal["latitude"],
+        "longitude": signal["longitude"],
+        "danger_level": signal["danger_level"],
+        "status": signal["status"],
+        "triage_status": signal.get("triage_status", "done"),
+        "ai_assessment": signal.get("ai_assessment"),
+        "assigned_team_id": signal.get("assigned_team_id"),
+        "report_count": signal.get("report_count", 1),
+        "created_at": signal["created_at"],
+        "updated_at": signal["updated_at"],
+    }
+
+
+async def watch(collection, pipeline: list, on_change: Callable[[dict], Awaitable[None]], retry_delay: float = 5) -> None:
+    """Follow a change stream forever, resuming after errors where it left off."""
+    resume_token = None
+    while True:
+        try:
+            async with collection.watch(pipeline, full_document="updateLookup", resume_after=resume_token) as stream:
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    await on_change(change)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Change stream on {collection.name} failed, retrying: {e}")
+            await asyncio.sleep(retry_delay)
+
+
+class ChangeStreamSource:
+    """Feed the bus from MongoDB change streams (requires a replica set)."""
+
+    def __init__(self, db, bus: EventBus):
+        self.db = db
+        self.bus = bus
+        self.tasks = []
+
+    def start(self) -> None:
+        self.bus.local_publish = False
+        self.tasks = [
+            asyncio.create_task(self._watch(self.db.sos_signals, self._signal_event, [
+                {"$match": {"$or": [
+                    {"operationType": "insert"},
+                    {"operationType": "update", "updateDescription.updatedFields.status": {"$exists": True}},
+                    {"operationType": "update", "updateDescription.updatedFields.triage_status": {"$exists": True}},
+                    {"operationType": "update", "updateDescription.updatedFields.report_count": {"$exists": True}},
+                ]}},
+            ])),
+            asyncio.create_task(self._watch(self.db.sos_signals_archive, self._archived_event, [
+                {"$match": {"operationType": {"$in": ["insert", "replace"]}}},
+            ])),
+            # Time-series collections have no change streams; watch the per-signal track read model
+            asyncio.create_task(self._watch(self.db.rescue_signal_tracks, self._location_event, [
+                {"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}},
+            ])),
+        ]
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def _watch(self, collection, to_event, pipeline: list) -> None:
+        async def dispatch(change: dict) -> None:
+            event = to_event(change)
+            if event:
+                self.bus.dispatch(event)
+
+        await watch(collection, pipeline, dispatch)
+
+    @staticmethod
+    def _signal_event(change: dict) -> Optional[dict]:
+        signal = change.get("fullDocument")
+        if not signal:
+            return None
+        if change["operationType"] == "insert":
+            event_type = SIGNAL_CREATED
+        elif "status" in change["updateDescription"]["updatedFields"]:
+            event_type = SIGNAL_STATUS_CHANGED
+        elif "triage_status" in change["updateDescription"]["updatedFields"]:
+            event_type = SIGNAL_TRIAGED
+        else:
+            event_type = SIGNAL_REPORTED
+        return make_event(event_type, signal["id"], signal["latitude"], signal["longitude"], signal_event_data(signal))
+
+    @staticmethod
+    def _archived_event(change: dict) -> Optional[dict]:
+        signal = change.get("fullDocument")
+        if not signal:
+            return None
+        return make_event(SIGNAL_ARCHIVED, signal["id"], signal["latitude"], signal["longitude"], signal_event_data(signal))
+
+    @staticmethod
+    def _location_event(change: dict) -> Optional[dict]:
+        track = change.get("fullDocument")
+        if not track or not track.get("points"):
+            return None
+        location = track["points"][0]
+        return make_event(RESCUE_LOCATION, location["signal_id"], location["latitude"], location["longitude"], location)
+
+
+Handler = Callable[[dict], Union[None, Awaitable[None]]]
+
+
+class Broadcast:
+    """Delivers messages to this worker only; the single-worker backend."""
+
+    def __init__(self):
+        self.handlers: Dict[str, List[Handler]] = {}
+
+    def on(self, topic: str, handler: Handler) -> None:
+        self.handlers.setdefault(topic, []).append(handler)
+
+    async def publish(self, topic: str, payload: dict) -> None:
+        await self._deliver(topic, payload)
+
+    async def _deliver(self, topic: str, payload: dict) -> None:
+        for handler in self.handlers.get(topic, []):
+            try:
+                result = handler(payload)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Broadcast handler for {topic} failed: {e}")
+
+    def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+
+class ChangeStreamBroadcast(Broadcast):
+    """Delivers messages to every worker through a MongoDB collection (requires a replica set).
+
+    The sender runs its own handlers right away; the others see the message
+    once its insert reaches their change stream. Messages expire through a
+    TTL index on `created_at`.
+    """
+
+    def __init__(self, db, collection: str = "bus_messages"):
+        super().__init__()
+        self.collection = db[collection]
+        self.origin = uuid.uuid4().hex
+        self._task = None
+
+    async def publish(self, topic: str, payload: dict) -> None:
+        await self._deliver(topic, payload)
+        await self.collection.insert_one({
+            "topic": topic,
+            "payload": payload,
+            "origin": self.origin,
+            "created_at": datetime.now(timezone.utc),
+        })
+
+    def start(self) -> None:
+        pipeline = [{"$match": {"operationType": "insert", "fullDocument.origin": {"$ne": self.origin}}}]
+        self._task = asyncio.create_task(watch(self.collection, pipeline, self._on_change))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _on_change(self, change: dict) -> None:
+        message = change["fullDocument"]
+        await self._deliver(message["topic"], message["payload"])
+
+
+def create_event_backends(db, bus: EventBus) -> tuple:
+    """(ChangeStreamSource or None, Broadcast) for the EVENT_BUS setting."""
+    # EVENT_SOURCE is the older name of the setting
+    backend = os.environ.get("EVENT_BUS") or os.environ.get("EVENT_SOURCE") or "memory"
+    if backend == "memory":
+        return None, Broadcast()
+    if backend == "changestream":
+        return ChangeStreamSource(db, bus), ChangeStreamBroadcast(db)
+    raise ValueError(f"Unknown EVENT_BUS backend: {backend}")
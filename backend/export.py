@@ -0,0 +1,162 @@
+"""Streaming bulk exports of signals and rescue tracks.
+
+Documents are read from a Motor cursor in fixed-size batches and each batch
+is encoded and sent before the next one is fetched, so server memory stays
+flat however large the export is. NDJSON and CSV need nothing extra; Parquet
+uses pyarrow when it is installed and writes one row group per batch.
+"""
+import csv
+import io
+import json
+from typing import AsyncIterator, Callable, List, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional; Parquet export is unavailable without it
+    pa = pq = None
+
+EXPORT_BATCH = 2000
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# (column, Arrow type) in export order; CSV and Parquet use the same layout
+SIGNAL_COLUMNS = [
+    ("id", "string"),
+    ("created_at", "string"),
+    ("updated_at", "string"),
+    ("latitude", "float64"),
+    ("longitude", "float64"),
+    ("status", "string"),
+    ("danger_level", "string"),
+    ("triage_status", "string"),
+    ("assigned_team_id", "string"),
+    ("report_count", "int64"),
+    ("description", "string"),
+    ("ai_assessment", "string"),
+    ("image_hashes", "string"),
+]
+
+LOCATION_COLUMNS = [
+    ("id", "string"),
+    ("signal_id", "string"),
+    ("team_id", "string"),
+    ("timestamp", "string"),
+    ("latitude", "float64"),
+    ("longitude", "float64"),
+]
+
+
+def parquet_available() -> bool:
+    return pa is not None
+
+
+def signal_row(doc: dict) -> dict:
+    row = {column: doc.get(column) for column, _ in SIGNAL_COLUMNS}
+    row["triage_status"] = doc.get("triage_status", "done")
+    row["report_count"] = doc.get("report_count", 1)
+    row["image_hashes"] = ";".join(image["hash"] for image in doc.get("images", []))
+    return row
+
+
+async def _batches(cursor, row: Callable[[dict], dict], batch_size: int) -> AsyncIterator[List[dict]]:
+    batch = []
+    async for doc in cursor:
+        batch.append(row(doc))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _ndjson(batches: AsyncIterator[List[dict]]) -> AsyncIterator[bytes]:
+    async for batch in batches:
+        yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in batch).encode()
+
+
+# Leading characters that make spreadsheet tools evaluate a cell as a formula
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def csv_safe(value):
+    """Victims' free text goes into the file as-is; keep it from running as a formula."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _drain(buffer: io.StringIO) -> str:
+    text = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return text
+
+
+async def _csv(batches: AsyncIterator[List[dict]], columns: List[Tuple[str, str]]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    # The BOM makes spreadsheet tools read the Vietnamese text as UTF-8
+    buffer.write("\ufeff")
+    writer = csv.DictWriter(buffer, fieldnames=[column for column, _ in columns], extrasaction="ignore")
+    writer.writeheader()
+    yield _drain(buffer).encode()
+    async for batch in batches:
+        writer.writerows({column: csv_safe(value) for column, value in row.items()} for row in batch)
+        yield _drain(buffer).encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back what was written since the last drain."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+async def _parquet(batches: AsyncIterator[List[dict]], columns: List[Tuple[str, str]]) -> AsyncIterator[bytes]:
+    schema = pa.schema([(column, getattr(pa, arrow_type)()) for column, arrow_type in columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        async for batch in batches:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            yield sink.drain()
+    finally:
+        # Writes the footer; an empty export is still a valid file
+        writer.close()
+    yield sink.drain()
+
+
+def export_stream(
+    cursor,
+    row: Callable[[dict], dict],
+    columns: List[Tuple[str, str]],
+    fmt: str,
+    batch_size: int = EXPORT_BATCH,
+) -> AsyncIterator[bytes]:
+    batches = _batches(cursor.batch_size(batch_size), row, batch_size)
+    if fmt == "csv":
+        return _csv(batches, columns)
+    if fmt == "parquet":
+        return _parquet(batches, columns)
+    return _ndjson(batches)
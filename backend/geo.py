@@ -0,0 +1,139 @@
+"""Geospatial helpers shared by the signal, map and dispatch endpoints."""
+import math
+from typing import List, Optional
+
+EARTH_RADIUS_M = 6371008.8
+
+# Stored on every signal; 9 characters is a cell of roughly 5 x 5 m
+GEOHASH_PRECISION = 9
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Web Mercator tiles stop short of the poles
+MAX_TILE_LATITUDE = 85.0511287798
+
+
+def point(latitude: float, longitude: float) -> dict:
+    """GeoJSON point as stored on signals (GeoJSON orders coordinates lon, lat)."""
+    return {"type": "Point", "coordinates": [longitude, latitude]}
+
+
+def parse_bbox(value: Optional[str]) -> Optional[tuple]:
+    """Parse a `minLon,minLat,maxLon,maxLat` query parameter."""
+    if not value:
+        return None
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(","))
+    except ValueError:
+        raise ValueError("bbox must be minLon,minLat,maxLon,maxLat")
+    if not (-180 <= min_lon < max_lon <= 180 and -90 <= min_lat < max_lat <= 90):
+        raise ValueError("bbox is out of range")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def bbox_polygon(bbox: tuple) -> dict:
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return {
+        "type": "Polygon",
+        "coordinates": [[
+            [min_lon, min_lat],
+            [max_lon, min_lat],
+            [max_lon, max_lat],
+            [min_lon, max_lat],
+            [min_lon, min_lat],
+        ]],
+    }
+
+
+def distance_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Haversine distance in meters."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def radius_bbox(latitude: float, longitude: float, radius_m: float) -> tuple:
+    """Smallest lat/lon box containing the circle, clamped to valid coordinates."""
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    dlon = dlat / max(math.cos(math.radians(latitude)), 0.01)
+    return (
+        max(-180.0, longitude - dlon), max(-90.0, latitude - dlat),
+        min(180.0, longitude + dlon), min(90.0, latitude + dlat),
+    )
+
+
+def geohash_encode(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, starting with longitude
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= mid:
+            value |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = value = 0
+    return "".join(chars)
+
+
+def geohash_cell_size(precision: int) -> tuple:
+    """(width, height) in degrees of a geohash cell."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 360.0 / 2 ** lon_bits, 180.0 / 2 ** lat_bits
+
+
+def geohash_cover(bbox: tuple, max_cells: int = 32) -> List[str]:
+    """Geohash prefixes covering a bbox, at the longest precision that needs at most `max_cells`.
+
+    Each prefix becomes one tight range scan on an index over the stored geohash.
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    cover = [""]
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        width, height = geohash_cell_size(precision)
+        columns = range(math.floor((min_lon + 180) / width), math.floor((min(max_lon, 179.9999999) + 180) / width) + 1)
+        rows = range(math.floor((min_lat + 90) / height), math.floor((min(max_lat, 89.9999999) + 90) / height) + 1)
+        if len(columns) * len(rows) > max_cells:
+            break
+        cover = [
+            geohash_encode((row + 0.5) * height - 90, (column + 0.5) * width - 180, precision)
+            for column in columns
+            for row in rows
+        ]
+    return cover
+
+
+def geohash_query(bbox: tuple, max_cells: int = 32) -> dict:
+    """Filter on the stored `geohash` selecting (a superset of) the signals inside a bbox."""
+    return {"$or": [{"geohash": {"$gte": prefix, "$lt": prefix + "~"}} for prefix in geohash_cover(bbox, max_cells)]}
+
+
+def tile_bbox(z: int, x: int, y: int) -> tuple:
+    """(minLon, minLat, maxLon, maxLat) of a Web Mercator (XYZ) tile."""
+    n = 2 ** z
+
+    def latitude(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360 - 180, latitude(y + 1), (x + 1) / n * 360 - 180, latitude(y)
+
+
+def tile_for(latitude: float, longitude: float, z: int) -> tuple:
+    """(x, y) of the tile containing a point at zoom `z`."""
+    n = 2 ** z
+    latitude = max(-MAX_TILE_LATITUDE, min(MAX_TILE_LATITUDE, latitude))
+    x = int((longitude + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
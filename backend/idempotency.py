@@ -0,0 +1,56 @@
+"""Replay protection for SOS submissions.
+
+Phones on weak links retry a submission they never saw the answer to. A
+client that sends an `Idempotency-Key` gets the same signal back for every
+retry: the key is stored on the signal the first attempt created or was
+merged into (`idempotency_keys`, under a unique multikey index), so a
+replay is answered with one indexed read and two racing attempts cannot
+both insert. Responses are also kept in a short-lived per-worker cache,
+which serves back-to-back retries without touching the database. Keys
+stay on a signal when it is archived, so a late retry of a closed incident
+is still answered from the archive.
+"""
+import re
+from typing import Optional
+
+from cachetools import TTLCache
+
+from archive import ARCHIVE_COLLECTION
+
+KEY_PATTERN = r"^[A-Za-z0-9._:-]{8,128}$"
+_KEY_RE = re.compile(KEY_PATTERN)
+
+REPLAY_PROJECTION = {"_id": 0, "images_base64": 0, "reports": 0, "idempotency_keys": 0}
+ARCHIVE_REPLAY_PROJECTION = {**REPLAY_PROJECTION, "locations": 0, "tracks": 0}
+
+
+def is_valid_key(key: str) -> bool:
+    return bool(_KEY_RE.match(key))
+
+
+class IdempotencyCache:
+    def __init__(self, db, maxsize: int = 10000, ttl: float = 600.0):
+        self.db = db
+        self._responses = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    async def replay(self, key: str) -> Optional[dict]:
+        """The signal an earlier submission with this key produced, if any."""
+        response = self._responses.get(key)
+        if response is not None:
+            self.hits += 1
+            return response
+        self.misses += 1
+        signal = await self.db.sos_signals.find_one({"idempotency_keys": key}, REPLAY_PROJECTION)
+        if signal is None:
+            signal = await self.db[ARCHIVE_COLLECTION].find_one({"idempotency_keys": key}, ARCHIVE_REPLAY_PROJECTION)
+        if signal is not None:
+            self._responses[key] = signal
+        return signal
+
+    def remember(self, key: str, response: dict) -> None:
+        self._responses[key] = response
+
+    def stats(self) -> dict:
+        return {"size": len(self._responses), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,169 @@
+"""Index definitions for every collection the API queries.
+
+`ensure_indexes` runs on startup and only builds indexes that are missing, so
+it is safe to run from every worker on every boot.
+"""
+import logging
+import time
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    "rescue_teams": [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "sos_signals": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # Default listing and keyset pagination
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        # Filtered listings and per-status / per-danger counts
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="status_created_at_id"),
+        IndexModel([("danger_level", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="danger_created_at_id"),
+        IndexModel(
+            [("location", "2dsphere"), ("status", ASCENDING), ("danger_level", ASCENDING), ("created_at", DESCENDING)],
+            name="location_2dsphere_status_danger",
+        ),
+        # Map tiles and duplicate checks: range scans on geohash prefixes
+        IndexModel([("geohash", ASCENDING), ("created_at", DESCENDING)], name="geohash_created_at"),
+        # Duplicate checks on a shared image
+        IndexModel([("images.hash", ASCENDING), ("created_at", DESCENDING)], name="images_hash_created_at"),
+        # Retried submissions: a key belongs to at most one signal
+        IndexModel(
+            [("idempotency_keys", ASCENDING)],
+            name="idempotency_keys_unique",
+            unique=True,
+            partialFilterExpression={"idempotency_keys": {"$exists": True}},
+        ),
+        # Archival scans completed signals by closing time
+        IndexModel([("status", ASCENDING), ("updated_at", ASCENDING)], name="status_updated_at"),
+        # Rescue queue pages: keyset on (priority, id) over the pending signals
+        IndexModel([("status", ASCENDING), ("priority", DESCENDING), ("id", ASCENDING)], name="status_priority_id"),
+    ],
+    # Lookups of archived ids and exports of the archive
+    "sos_signals_archive": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        # Orphaned image collection checks whether an archived signal still uses a photo
+        IndexModel([("images.hash", ASCENDING)], name="images_hash"),
+        # Replays of keys whose signal has been archived
+        IndexModel(
+            [("idempotency_keys", ASCENDING)],
+            name="idempotency_keys",
+            partialFilterExpression={"idempotency_keys": {"$exists": True}},
+        ),
+    ],
+    # Time-series collection; secondary indexes go on the meta fields
+    "rescue_locations": [
+        IndexModel([("meta.signal_id", ASCENDING), ("timestamp", DESCENDING)], name="meta_signal_id_timestamp"),
+        IndexModel([("meta.team_id", ASCENDING), ("timestamp", DESCENDING)], name="meta_team_id_timestamp"),
+        # Downsampling windows go by ingest time
+        IndexModel([("ingested_at", ASCENDING)], name="ingested_at"),
+    ],
+    # Dispatch loads the teams seen recently
+    "rescue_team_positions": [
+        IndexModel([("timestamp", DESCENDING)], name="timestamp"),
+    ],
+    "rescue_mission_tracks": [
+        IndexModel([("signal_id", ASCENDING)], name="signal_id"),
+    ],
+    "triage_jobs": [
+        IndexModel([("status", ASCENDING), ("run_at", ASCENDING)], name="status_run_at"),
+    ],
+    # Cross-worker broadcast messages only need to outlive change stream delivery
+    "bus_messages": [
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=3600),
+    ],
+    "orphaned_blobs": [
+        IndexModel([("queued_at", ASCENDING)], name="queued_at"),
+    ],
+    "sos_images.files": [
+        IndexModel([("filename", ASCENDING)], name="filename"),
+    ],
+}
+
+# Indexes superseded by one above, dropped once their replacement is in place
+RETIRED_INDEXES = {
+    "sos_signals": ["geohash"],  # replaced by geohash_created_at
+}
+
+
+async def ensure_indexes(db) -> None:
+    total = sum(len(models) for models in INDEXES.values())
+    done = 0
+    for collection, models in INDEXES.items():
+        existing = await db[collection].index_information()
+        for model in models:
+            done += 1
+            name = model.document["name"]
+            if name in existing:
+                continue
+            started = time.monotonic()
+            logger.info(f"Building index {collection}.{name} ({done}/{total})")
+            try:
+                await db[collection].create_indexes([model])
+            except OperationFailure as e:
+                # A conflicting or unbuildable index (e.g. duplicate usernames) must not block startup
+                logger.error(f"Index build failed for {collection}.{name}: {e}")
+                continue
+            logger.info(f"Built index {collection}.{name} in {(time.monotonic() - started) * 1000:.0f} ms")
+        for name in RETIRED_INDEXES.get(collection, []):
+            if name not in existing:
+                continue
+            try:
+                await db[collection].drop_index(name)
+            except OperationFailure as e:
+                # Usually another worker dropped it first
+                logger.info(f"Could not drop retired index {collection}.{name}: {e}")
+                continue
+            logger.info(f"Dropped retired index {collection}.{name}")
+
+
+async def index_builds_in_progress(db) -> list:
+    """Index builds currently running on the server, with their progress counters."""
+    pipeline = [
+        {"$currentOp": {"allUsers": True, "idleConnections": False}},
+        {"$match": {"$or": [
+            {"command.createIndexes": {"$exists": True}},
+            {"msg": {"$regex": "^Index Build"}},
+        ]}},
+    ]
+    try:
+        ops = await db.client.admin.aggregate(pipeline).to_list(None)
+    except OperationFailure as e:
+        # $currentOp needs the inprog privilege, which the app user may not have
+        logger.warning(f"Cannot read index build progress: {e}")
+        return []
+    return [
+        {
+            "ns": op.get("ns"),
+            "msg": op.get("msg"),
+            "progress": op.get("progress"),
+            "secs_running": op.get("secs_running"),
+        }
+        for op in ops
+    ]
+
+
+async def index_usage(db) -> dict:
+    """`$indexStats` for every managed collection, busiest index first."""
+    usage = {}
+    for collection in INDEXES:
+        stats = await db[collection].aggregate([{"$indexStats": {}}]).to_list(None)
+        usage[collection] = sorted(
+            (
+                {
+                    "name": stat["name"],
+                    "key": stat["key"],
+                    "ops": stat["accesses"]["ops"],
+                    "since": stat["accesses"]["since"].isoformat(),
+                }
+                for stat in stats
+            ),
+            key=lambda stat: stat["ops"],
+            reverse=True,
+        )
+    return usage
@@ -0,0 +1,63 @@
+"""Periodic background jobs that run on one worker at a time.
+
+A LeasedJob wakes every `interval` seconds and leases itself in `jobs_state`
+before doing any work, so with several workers only one runs each round.
+The lease lasts one interval: a worker that dies mid-run hands the job to
+the next one that wakes after that. Subclasses implement `run_once`, which
+calls `_acquire` and keeps its progress on the same `jobs_state` document.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+class LeasedJob:
+    STATE_ID = ""
+    # Names the job in logs, e.g. "Signal archival"
+    DESCRIPTION = ""
+
+    def __init__(self, db, interval: float):
+        self.db = db
+        self.interval = interval
+        self._task = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run_periodically())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run_periodically(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"{self.DESCRIPTION} failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _acquire(self, now: datetime) -> Optional[dict]:
+        """Take the lease; returns the job's state document, or None while another worker holds it."""
+        try:
+            return await self.db.jobs_state.find_one_and_update(
+                {"_id": self.STATE_ID, "$or": [{"lease_until": {"$lt": now}}, {"lease_until": {"$exists": False}}]},
+                {"$set": {"lease_until": now + timedelta(seconds=self.interval)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except OperationFailure:
+            # Upsert raced with another worker holding the lease
+            return None
+
+    async def run_once(self) -> int:
+        raise NotImplementedError
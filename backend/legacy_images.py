@@ -0,0 +1,123 @@
+"""Migration of inline `images_base64` into the blob store.
+
+Signals stored before the blob store kept their photos inline as base64
+strings, which the API no longer returns. LegacyImageBackfill re-encodes
+them into blob store references: each signal is migrated with one
+conditional update that sets `images` and drops the inline copies, so the
+job resumes where it stopped after a restart and two workers never migrate
+the same signal twice. Progress is recorded in `jobs_state`.
+
+Until the backfill has reached a signal, readers call `ensure_images`,
+which migrates the signals they are about to return on the spot. A legacy
+document is recognisable by having no `images` field at all; an image that
+cannot be decoded stays inline and is not retried.
+"""
+import asyncio
+import base64
+import binascii
+import logging
+from datetime import datetime, timezone
+from typing import List
+
+from blob_store import InvalidImageError
+
+logger = logging.getLogger(__name__)
+
+LEGACY_QUERY = {"images": {"$exists": False}, "images_base64.0": {"$exists": True}}
+
+
+def decode_legacy_image(image_b64: str) -> bytes:
+    # Early clients sent data URLs
+    if image_b64.startswith("data:"):
+        image_b64 = image_b64.partition(",")[2]
+    return base64.b64decode(image_b64, validate=True)
+
+
+async def offload_images(blob_store, signal_id: str, images_base64: List[str]) -> tuple:
+    """(references to the stored images, images that could not be decoded and are kept inline)"""
+    refs, unreadable = [], []
+    for image_b64 in images_base64:
+        try:
+            refs.append(await blob_store.store_image(decode_legacy_image(image_b64)))
+        except (binascii.Error, InvalidImageError) as e:
+            logger.warning(f"Keeping an unreadable legacy image of signal {signal_id} inline: {e}")
+            unreadable.append(image_b64)
+    return refs, unreadable
+
+
+async def migrate_signal(db, blob_store, signal_id: str) -> List[dict]:
+    """Move one signal's inline images to the blob store; returns its image references."""
+    signal = await db.sos_signals.find_one({"id": signal_id}, {"_id": 0, "images": 1, "images_base64": 1})
+    if signal is None:
+        return []
+    if "images" in signal:
+        # Already migrated, possibly by another worker
+        return signal["images"]
+
+    refs, unreadable = await offload_images(blob_store, signal_id, signal.get("images_base64") or [])
+    update = {"$set": {"images": refs}}
+    if unreadable:
+        update["$set"]["images_base64"] = unreadable
+    else:
+        update["$unset"] = {"images_base64": ""}
+    result = await db.sos_signals.update_one({"id": signal_id, "images": {"$exists": False}}, update)
+    if not result.modified_count:
+        # Lost the race; blobs are content-addressed, so the winner stored the same ones
+        migrated = await db.sos_signals.find_one({"id": signal_id}, {"_id": 0, "images": 1})
+        return migrated.get("images", []) if migrated else []
+    return refs
+
+
+async def ensure_images(db, blob_store, signals: List[dict]) -> List[dict]:
+    """Fill in `images` on documents read before their signal was migrated."""
+    for signal in signals:
+        if "images" not in signal and "id" in signal:
+            signal["images"] = await migrate_signal(db, blob_store, signal["id"])
+    return signals
+
+
+class LegacyImageBackfill:
+    STATE_ID = "legacy_image_backfill"
+
+    def __init__(self, db, blob_store, batch_size: int = 100):
+        self.db = db
+        self.blob_store = blob_store
+        self.batch_size = batch_size
+        self._task = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        try:
+            await self.run_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Legacy image backfill failed: {e}")
+
+    async def run_once(self) -> int:
+        migrated = 0
+        while True:
+            batch = await self.db.sos_signals.find(LEGACY_QUERY, {"_id": 0, "id": 1}).limit(
+                self.batch_size
+            ).to_list(self.batch_size)
+            if not batch:
+                break
+            for signal in batch:
+                await migrate_signal(self.db, self.blob_store, signal["id"])
+            migrated += len(batch)
+            await self.db.jobs_state.update_one(
+                {"_id": self.STATE_ID},
+                {"$inc": {"migrated": len(batch)}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+                upsert=True,
+            )
+        if migrated:
+            logger.info(f"Moved the inline images of {migrated} signals to the blob store")
+        return migrated
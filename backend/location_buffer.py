@@ -0,0 +1,140 @@
+"""Write-coalescing buffer for rescuer GPS pings.
+
+Location updates are queued in memory and written with one unordered
+`insert_many` per batch, triggered by batch size or by the flush interval.
+Each flush also upserts two small read models:
+
+* `rescue_team_positions`: the latest position of each team, keyed by team id
+* `rescue_signal_tracks`: the most recent points per signal, newest first
+
+so reads never have to sort the location history. `on_flush`, if given, is
+called with the ids of the signals whose track changed once a flush has
+landed, e.g. to invalidate cached tracks. A flush that fails outright
+keeps its points for the next one, and shutdown drains the buffer. Points
+still buffered when a worker dies are lost, which is acceptable for a
+stream that resends every few seconds.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional, Set
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from geo import point
+from tracks import to_series_document
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+class LocationWriteBuffer:
+    def __init__(
+        self,
+        db,
+        max_batch: int = 500,
+        flush_interval: float = 1.0,
+        recent_points: int = 10,
+        on_flush: Optional[Callable[[Set[str]], Awaitable[None]]] = None,
+    ):
+        self.db = db
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.recent_points = recent_points
+        self.on_flush = on_flush
+        self._pending = []
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def add(self, locations: list) -> None:
+        self._pending.extend(locations)
+        if len(self._pending) >= self.max_batch:
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+            try:
+                await self.db.rescue_locations.insert_many([to_series_document(loc) for loc in batch], ordered=False)
+            except BulkWriteError as e:
+                # Unordered: every point without an error was written
+                failed = {err["index"] for err in e.details["writeErrors"]}
+                logger.error(f"Dropped {len(failed)} of {len(batch)} rescue locations: {e}")
+                batch = [loc for i, loc in enumerate(batch) if i not in failed]
+                if not batch:
+                    return
+            except Exception:
+                # Nothing is known to have landed; keep the points for the next flush
+                self._pending[:0] = batch
+                raise
+            await self._update_read_models(batch)
+            if self.on_flush:
+                await self.on_flush({loc["signal_id"] for loc in batch})
+
+    async def _update_read_models(self, batch: list) -> None:
+        latest_by_team = {}
+        points_by_signal = {}
+        for loc in batch:
+            current = latest_by_team.get(loc["team_id"])
+            if current is None or loc["timestamp"] >= current["timestamp"]:
+                latest_by_team[loc["team_id"]] = loc
+            points_by_signal.setdefault(loc["signal_id"], []).append(loc)
+
+        # Only move a team forward in time: points replayed from an offline device
+        # fail the timestamp filter, and the upsert then hits the existing _id
+        positions = [
+            UpdateOne(
+                {"_id": team_id, "timestamp": {"$lt": loc["timestamp"]}},
+                {"$set": {**loc, "location": point(loc["latitude"], loc["longitude"])}},
+                upsert=True,
+            )
+            for team_id, loc in latest_by_team.items()
+        ]
+        tracks = [
+            UpdateOne(
+                {"_id": signal_id},
+                {"$push": {"points": {
+                    "$each": points,
+                    "$sort": {"timestamp": -1},
+                    "$slice": self.recent_points,
+                }}},
+                upsert=True,
+            )
+            for signal_id, points in points_by_signal.items()
+        ]
+        try:
+            await self.db.rescue_team_positions.bulk_write(positions, ordered=False)
+        except BulkWriteError as e:
+            errors = [err for err in e.details["writeErrors"] if err["code"] != DUPLICATE_KEY]
+            if errors:
+                logger.error(f"Failed to update {len(errors)} team positions: {errors[0]['errmsg']}")
+        await self.db.rescue_signal_tracks.bulk_write(tracks, ordered=False)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self) -> None:
+        if self._task:
+            # Cancelling mid-flush would lose the batch it holds, so wait for it to land
+            async with self._lock:
+                self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Rescue location flush failed: {e}")
@@ -0,0 +1,267 @@
+"""Request and MongoDB instrumentation, exposed in the Prometheus text format.
+
+MetricsMiddleware records per-route latency, request and response sizes and
+the number of requests in flight. MongoCommandListener is registered on the
+Motor client and records per-collection command time and document counts.
+Motor runs each command on its executor inside a copy of the caller's
+context, so the listener can also attribute commands to the HTTP request
+that issued them; requests slower than the threshold are logged as one JSON
+line with that breakdown.
+
+MongoDB does not report documents examined in command replies, so the
+document counters track documents returned (cursor batches) and written (`n`).
+"""
+import json
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+# Mongo commands issued while handling the current request: (collection.command, seconds)
+_request_commands: ContextVar[Optional[list]] = ContextVar("request_commands", default=None)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def render(self) -> list:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> list:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> list:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, labels)} {value}" for labels, value in items]
+
+
+class Gauge(_Metric):
+    """A gauge set directly, or read from `fn` at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, help_text)
+        self.fn = fn
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.inc(-amount)
+
+    def _samples(self) -> list:
+        return [f"{self.name} {self.fn() if self.fn else self.value}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], buckets: tuple):
+        super().__init__(name, help_text, labels)
+        self.buckets = buckets
+        # labels -> [count per bucket..., +Inf count, sum]
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def _samples(self) -> list:
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        bounds = ['le="%s"' % bound for bound in self.buckets] + ['le="+Inf"']
+        lines = []
+        for labels, series in items:
+            for bound, count in zip(bounds, series):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, bound)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {series[-2]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route and status.", ("method", "route", "status")))
+http_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency.", ("method", "route"), LATENCY_BUCKETS))
+http_request_size = registry.register(Histogram(
+    "http_request_size_bytes", "HTTP request body size.", ("method", "route"), SIZE_BUCKETS))
+http_response_size = registry.register(Histogram(
+    "http_response_size_bytes", "HTTP response body size.", ("method", "route"), SIZE_BUCKETS))
+http_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests being handled."))
+mongo_duration = registry.register(Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency.", ("collection", "command"), MONGO_BUCKETS))
+mongo_failures = registry.register(Counter(
+    "mongo_command_failures_total", "Failed MongoDB commands.", ("collection", "command")))
+mongo_documents = registry.register(Counter(
+    "mongo_documents_total", "Documents returned by reads or affected by writes.", ("collection", "command")))
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    def __init__(self):
+        # (connection, request id) -> collection, from started until succeeded/failed
+        self._collections = {}
+
+    @staticmethod
+    def _collection(event: monitoring.CommandStartedEvent) -> str:
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        return target if isinstance(target, str) else event.database_name
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        self._collections[(event.connection_id, event.request_id)] = self._collection(event)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        collection = self._collections.pop((event.connection_id, event.request_id), "unknown")
+        seconds = event.duration_micros / 1e6
+        labels = (collection, event.command_name)
+        mongo_duration.observe(labels, seconds)
+
+        reply = event.reply
+        cursor = reply.get("cursor")
+        if cursor:
+            mongo_documents.inc(labels, len(cursor.get("firstBatch", cursor.get("nextBatch", ()))))
+        elif isinstance(reply.get("n"), int):
+            mongo_documents.inc(labels, reply["n"])
+
+        commands = _request_commands.get()
+        if commands is not None:
+            commands.append((f"{collection}.{event.command_name}", seconds))
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        collection = self._collections.pop((event.connection_id, event.request_id), "unknown")
+        mongo_failures.inc((collection, event.command_name))
+
+
+def _route_template(scope: dict) -> str:
+    # FastAPI stores the matched route in the scope; unmatched paths share one label
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    def __init__(self, app, slow_request_seconds: float = 1.0):
+        self.app = app
+        self.slow_request_seconds = slow_request_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        commands = []
+        token = _request_commands.set(commands)
+        sizes = {"request": 0, "response": 0}
+        status = [500]
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes["request"] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            elif message["type"] == "http.response.body":
+                sizes["response"] += len(message.get("body", b""))
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            http_in_flight.dec()
+            _request_commands.reset(token)
+            elapsed = time.perf_counter() - started
+            method, route = scope["method"], _route_template(scope)
+            http_requests.inc((method, route, str(status[0])))
+            http_duration.observe((method, route), elapsed)
+            http_request_size.observe((method, route), sizes["request"])
+            http_response_size.observe((method, route), sizes["response"])
+            if elapsed >= self.slow_request_seconds:
+                self._log_slow(scope, route, status[0], elapsed, commands)
+
+    @staticmethod
+    def _log_slow(scope: dict, route: str, status: int, elapsed: float, commands: list) -> None:
+        breakdown = {}
+        for name, seconds in commands:
+            entry = breakdown.setdefault(name, {"count": 0, "ms": 0.0})
+            entry["count"] += 1
+            entry["ms"] += seconds * 1000
+        logger.warning(json.dumps({
+            "event": "slow_request",
+            "method": scope["method"],
+            "route": route,
+            "path": scope["path"],
+            "status": status,
+            "duration_ms": round(elapsed * 1000, 1),
+            "mongo_commands": len(commands),
+            "mongo_ms": round(sum(seconds for _, seconds in commands) * 1000, 1),
+            "mongo": {name: {"count": entry["count"], "ms": round(entry["ms"], 1)} for name, entry in breakdown.items()},
+        }))
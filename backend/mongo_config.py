@@ -0,0 +1,48 @@
+"""MongoDB client settings from the environment.
+
+Pool and timeout options are only passed to the driver when set, so the
+driver defaults (and anything in MONGO_URL) apply otherwise. Each worker
+process opens its own pool, so size MONGO_MAX_POOL_SIZE per worker: N
+workers hold up to N x maxPoolSize connections.
+
+POLL_READ_PREFERENCE selects where the polled per-signal reads go; a
+secondary-preferred handle takes that traffic off the primary at the cost
+of replication lag.
+"""
+import os
+from typing import Mapping, Optional
+
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+
+# Environment variable -> MongoClient keyword
+CLIENT_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": "maxPoolSize",
+    "MONGO_MIN_POOL_SIZE": "minPoolSize",
+    "MONGO_MAX_CONNECTING": "maxConnecting",
+    "MONGO_MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+    "MONGO_CONNECT_TIMEOUT_MS": "connectTimeoutMS",
+    "MONGO_SOCKET_TIMEOUT_MS": "socketTimeoutMS",
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+}
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def client_options(environ: Mapping[str, str] = os.environ) -> dict:
+    return {option: int(environ[name]) for name, option in CLIENT_OPTIONS.items() if environ.get(name)}
+
+
+def read_preference(name: str, max_staleness_seconds: Optional[int] = None):
+    if name not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference: {name}")
+    if name == "primary":
+        return Primary()
+    # The server enforces a 90 second minimum for maxStalenessSeconds
+    return READ_PREFERENCES[name](max_staleness=max_staleness_seconds or -1)
@@ -0,0 +1,137 @@
+"""Password hashing off the event loop, plus login throttling.
+
+bcrypt is deliberately slow (100-300 ms per call), and running it inside an
+async handler stalls every other request on the worker. PasswordHasher runs
+it on a small dedicated thread pool (the bcrypt C extension releases the
+GIL) and refuses new work once too many calls are queued, so a login burst
+degrades into fast 503s instead of a stalled server.
+
+LoginThrottle keeps its counts in process memory, so each worker throttles
+on its own: with N workers an attacker gets up to N times the configured
+failures per window. Set the limits with the worker count in mind.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from cachetools import TTLCache
+from passlib.context import CryptContext
+
+
+class PasswordPoolBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = 2, max_queue: int = 32, rounds: int = 12):
+        self.rounds = rounds
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.workers = workers
+        self.max_pending = workers + max_queue
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordPoolBusy()
+        self.pending += 1
+        started = time.monotonic()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            self.total_seconds += time.monotonic() - started
+
+    def _needs_rehash(self, password_hash: str) -> bool:
+        # "$2b$12$..." carries its cost; rehash whenever it differs from the configured one
+        try:
+            cost = int(password_hash.split("$")[2])
+        except (IndexError, ValueError):
+            return True
+        return cost != self.rounds or self.context.needs_update(password_hash)
+
+    def _verify(self, password: str, password_hash: str) -> tuple:
+        if not self.context.verify(password, password_hash):
+            return False, None
+        if self._needs_rehash(password_hash):
+            return True, self.context.hash(password)
+        return True, None
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, password_hash: str) -> tuple:
+        """Return (valid, new_hash); new_hash is set when the stored hash should be replaced."""
+        return await self._run(self._verify, password, password_hash)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "rounds": self.rounds,
+            "pending": self.pending,
+            "queued": max(0, self.pending - self.workers),
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_latency_ms": round(self.total_seconds / self.completed * 1000, 1) if self.completed else None,
+        }
+
+
+class LoginThrottle:
+    """Counts failed logins per username and per client IP within a rolling window.
+
+    The counts are per worker process and are lost on restart.
+    """
+
+    def __init__(self, max_per_username: int = 5, max_per_ip: int = 50, window: float = 300.0):
+        self.max_per_username = max_per_username
+        self.max_per_ip = max_per_ip
+        self.window = window
+        self._usernames = TTLCache(maxsize=100000, ttl=window)
+        self._ips = TTLCache(maxsize=100000, ttl=window)
+
+    def _wait(self, failures: TTLCache, key: str, limit: int, now: float) -> Optional[int]:
+        """Seconds until the key drops below its limit, or None if it is below it already."""
+        attempts = failures.get(key)
+        if attempts is None:
+            return None
+        while attempts and attempts[0] <= now - self.window:
+            attempts.popleft()
+        if len(attempts) < limit:
+            return None
+        # Only the last `limit` failures are kept, so the oldest one is the next to expire
+        return max(1, math.ceil(attempts[0] + self.window - now))
+
+    def retry_after(self, username: str, ip: Optional[str]) -> Optional[int]:
+        """Seconds to wait if either key is over its limit, otherwise None."""
+        now = time.monotonic()
+        waits = [self._wait(self._usernames, username.lower(), self.max_per_username, now)]
+        if ip:
+            waits.append(self._wait(self._ips, ip, self.max_per_ip, now))
+        waits = [wait for wait in waits if wait is not None]
+        return max(waits) if waits else None
+
+    def _record(self, failures: TTLCache, key: str, limit: int, now: float) -> None:
+        attempts = failures.get(key)
+        if attempts is None:
+            attempts = deque(maxlen=limit)
+        attempts.append(now)
+        # Re-assigning restarts the entry's TTL, so it lives as long as its newest failure counts
+        failures[key] = attempts
+
+    def record_failure(self, username: str, ip: Optional[str]) -> None:
+        now = time.monotonic()
+        self._record(self._usernames, username.lower(), self.max_per_username, now)
+        if ip:
+            self._record(self._ips, ip, self.max_per_ip, now)
+
+    def record_success(self, username: str) -> None:
+        self._usernames.pop(username.lower(), None)
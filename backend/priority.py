@@ -0,0 +1,196 @@
+"""Priority ranking of pending signals for a rescue team's work queue.
+
+A signal's priority adds points for its danger level, for how long it has
+been waiting (so old low-danger calls are not starved) and for repeated
+reports. It is stored on the signal as `priority`: written with the signal,
+updated when triage or a merged report changes it, and kept current while
+it ages by PriorityRefresher. Age points stop growing after AGE_CAP, so the
+refresher only ever revisits the signals of the last few hours.
+
+Without a team position the queue is an indexed keyset scan over
+`(status, priority, id)`, so a page costs the same however large the
+national backlog is. With a position, points per kilometre from the team
+are subtracted; distance depends on the team, so the candidates come from
+a `$geoNear` bounded by the search radius and MAX_CANDIDATES and are ranked
+per request. Pages are keyed on (score, id), with the origin carried in
+the cursor.
+"""
+import base64
+import binascii
+import json
+import logging
+import math
+from datetime import datetime, timezone, timedelta
+from typing import List, Optional
+
+from pymongo import UpdateOne
+
+from geo import point
+from jobs import LeasedJob
+
+logger = logging.getLogger(__name__)
+
+DANGER_POINTS = {"red": 100.0, "yellow": 40.0, "green": 10.0}
+AGE_POINTS_PER_HOUR = 10.0
+MAX_AGE_POINTS = 60.0
+AGE_CAP = timedelta(hours=MAX_AGE_POINTS / AGE_POINTS_PER_HOUR)
+POINTS_PER_EXTRA_REPORT = 10.0
+MAX_REPORT_POINTS = 50.0
+POINTS_PER_KM = 1.0
+MAX_CANDIDATES = 2000
+REFRESH_BATCH = 500
+
+QUEUE_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "latitude": 1,
+    "longitude": 1,
+    "description": 1,
+    "danger_level": 1,
+    "status": 1,
+    "report_count": 1,
+    "priority": 1,
+    "created_at": 1,
+}
+
+
+def signal_priority(signal: dict, now: datetime) -> float:
+    """The stored priority: danger, waiting time and repeated reports, without distance."""
+    waited_hours = max(0.0, (now - datetime.fromisoformat(signal["created_at"])).total_seconds() / 3600)
+    score = DANGER_POINTS.get(signal["danger_level"], 0.0)
+    score += min(MAX_AGE_POINTS, waited_hours * AGE_POINTS_PER_HOUR)
+    score += min(MAX_REPORT_POINTS, (signal.get("report_count", 1) - 1) * POINTS_PER_EXTRA_REPORT)
+    return round(score, 2)
+
+
+def priority_score(signal: dict, now: datetime, distance_m: Optional[float]) -> float:
+    """The queue score from a team `distance_m` away, from the stored priority when there is one."""
+    score = signal.get("priority")
+    if score is None:
+        score = signal_priority(signal, now)
+    if distance_m is not None:
+        score -= distance_m / 1000 * POINTS_PER_KM
+    return round(score, 2)
+
+
+async def update_priority(db, signal: dict, now: datetime) -> None:
+    """Store the priority of a signal whose danger level or report count just changed."""
+    await db.sos_signals.update_one({"id": signal["id"]}, {"$set": {"priority": signal_priority(signal, now)}})
+
+
+async def queue_page(db, after: Optional[tuple], limit: int) -> tuple:
+    """One page of all pending signals by stored priority, and whether more follow."""
+    query = {"status": "pending"}
+    if after is not None:
+        priority, signal_id = after
+        query["$or"] = [{"priority": {"$lt": priority}}, {"priority": priority, "id": {"$gt": signal_id}}]
+    signals = await db.sos_signals.find(query, QUEUE_PROJECTION).sort(
+        [("priority", -1), ("id", 1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    for signal in signals:
+        signal["distance_m"] = None
+    return signals[:limit], len(signals) > limit
+
+
+async def nearby_candidates(
+    db, origin: tuple, radius_m: float, max_candidates: int = MAX_CANDIDATES
+) -> List[dict]:
+    """The pending signals within `radius_m` of `origin`, nearest first."""
+    return await db.sos_signals.aggregate([
+        {"$geoNear": {
+            "near": point(*origin),
+            "distanceField": "distance_m",
+            "maxDistance": radius_m,
+            "query": {"status": "pending"},
+            "spherical": True
+        }},
+        {"$limit": max_candidates},
+        {"$project": {**QUEUE_PROJECTION, "distance_m": 1}},
+    ]).to_list(max_candidates)
+
+
+def rank(signals: List[dict], now: datetime) -> List[dict]:
+    for signal in signals:
+        distance = signal.get("distance_m")
+        signal["distance_m"] = round(distance, 1) if distance is not None else None
+        signal["priority"] = priority_score(signal, now, distance)
+    return sorted(signals, key=lambda signal: (-signal["priority"], signal["id"]))
+
+
+def page_after(ranked: List[dict], after: Optional[tuple], limit: int) -> tuple:
+    """The `limit` signals ranked after the (priority, id) key, and whether more follow."""
+    if after is not None:
+        priority, signal_id = after
+        ranked = [signal for signal in ranked if (-signal["priority"], signal["id"]) > (-priority, signal_id)]
+    return ranked[:limit], len(ranked) > limit
+
+
+def encode_queue_cursor(origin: Optional[tuple], last: dict) -> str:
+    raw = json.dumps([origin, last["priority"], last["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_queue_cursor(cursor: str) -> tuple:
+    """Returns (origin, (priority, id)); raises ValueError for a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        origin, priority, signal_id = json.loads(raw)
+        return _decode_origin(origin), (float(priority), str(signal_id))
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def _decode_origin(origin) -> Optional[tuple]:
+    if origin is None:
+        return None
+    if not isinstance(origin, list) or len(origin) != 2 or not all(
+        isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value) for value in origin
+    ):
+        raise ValueError("Invalid cursor origin")
+    latitude, longitude = float(origin[0]), float(origin[1])
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError("Invalid cursor origin")
+    return latitude, longitude
+
+
+class PriorityRefresher(LeasedJob):
+    """Re-scores pending signals whose age points are still growing, and those without a priority."""
+
+    STATE_ID = "priority_refresher"
+    DESCRIPTION = "Priority refresh"
+
+    def __init__(self, db, interval: float = 60.0):
+        super().__init__(db, interval)
+        # One more pass after a signal's age points are capped, with room for skipped rounds
+        self.window = AGE_CAP + timedelta(seconds=10 * interval)
+
+    async def run_once(self) -> int:
+        now = datetime.now(timezone.utc)
+        if await self._acquire(now) is None:
+            return 0
+
+        since = (now - self.window).isoformat()
+        signals = self.db.sos_signals.find(
+            {"$or": [
+                {"status": "pending", "created_at": {"$gte": since}},
+                # Signals stored before priorities were
+                {"status": "pending", "priority": None},
+            ]},
+            {"_id": 0, "id": 1, "danger_level": 1, "report_count": 1, "priority": 1, "created_at": 1},
+        )
+        updates = []
+        updated = 0
+        async for signal in signals:
+            priority = signal_priority(signal, now)
+            if priority != signal.get("priority"):
+                updates.append(UpdateOne({"id": signal["id"]}, {"$set": {"priority": priority}}))
+            if len(updates) >= REFRESH_BATCH:
+                updated += await self._write(updates)
+                updates = []
+        if updates:
+            updated += await self._write(updates)
+        return updated
+
+    async def _write(self, updates: list) -> int:
+        await self.db.sos_signals.bulk_write(updates, ordered=False)
+        return len(updates)
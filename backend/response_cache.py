@@ -0,0 +1,223 @@
+"""Read-through cache for hot public GETs, with ETags.
+
+Victims and families poll a signal and its rescue track every few seconds.
+Responses are cached as serialized JSON together with a hash-based ETag,
+keyed by signal id, so a poll is served without touching MongoDB and a poll
+whose `If-None-Match` still matches gets a bodyless 304.
+
+Every write to a signal or its track invalidates the key: request handlers
+do it directly (read-your-writes on this worker), the location buffer after
+each flush, and the event bus for writes seen through a change stream. The
+default backend is per-worker memory; with RESPONSE_CACHE=redis all workers
+share one cache and its invalidations. A short TTL bounds staleness if an
+invalidation is ever missed.
+
+When the loads read from secondaries, a load right after a write may still
+see the old document; `settle_seconds` keeps such loads out of the cache
+for a while after each invalidation.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Iterable, Optional, Tuple
+
+from cachetools import TTLCache
+
+from events import consume, RESCUE_LOCATION, SIGNAL_ARCHIVED, SIGNAL_REPORTED, SIGNAL_STATUS_CHANGED, SIGNAL_TRIAGED
+from tiles import WORLD
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Only needed for RESPONSE_CACHE=redis
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+CLEAR_BATCH = 500
+
+SIGNAL_EVENTS = {SIGNAL_STATUS_CHANGED, SIGNAL_TRIAGED, SIGNAL_REPORTED, SIGNAL_ARCHIVED}
+
+
+def signal_key(signal_id: str) -> str:
+    return f"signal:{signal_id}"
+
+
+def locations_key(signal_id: str) -> str:
+    return f"locations:{signal_id}"
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+class MemoryBackend:
+    def __init__(self, maxsize: int, ttl: float):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._entries.get(key)
+
+    async def set(self, key: str, value: bytes) -> None:
+        self._entries[key] = value
+
+    async def delete(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            self._entries.pop(key, None)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Any client with redis-py's asyncio get/set/delete/scan_iter/unlink works, e.g. fakeredis in a test."""
+
+    def __init__(self, client, ttl: float, prefix: str = "sos:response:"):
+        self.client = client
+        self.ttl = max(1, int(ttl))
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes) -> None:
+        await self.client.set(self.prefix + key, value, ex=self.ttl)
+
+    async def delete(self, keys: Iterable[str]) -> None:
+        keys = [self.prefix + key for key in keys]
+        if keys:
+            await self.client.delete(*keys)
+
+    async def clear(self) -> None:
+        # Shared by every worker, so this drops their entries too
+        keys = []
+        async for key in self.client.scan_iter(match=self.prefix + "*", count=CLEAR_BATCH):
+            keys.append(key)
+            if len(keys) >= CLEAR_BATCH:
+                await self.client.unlink(*keys)
+                keys = []
+        if keys:
+            await self.client.unlink(*keys)
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+def create_response_cache_backend(maxsize: int, ttl: float):
+    backend = os.environ.get("RESPONSE_CACHE", "memory")
+    if backend == "memory":
+        return MemoryBackend(maxsize, ttl)
+    if backend == "redis":
+        if aioredis is None:
+            raise ValueError("RESPONSE_CACHE=redis requires the redis package")
+        return RedisBackend(aioredis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379/0")), ttl)
+    raise ValueError(f"Unknown RESPONSE_CACHE backend: {backend}")
+
+
+class ResponseCache:
+    def __init__(self, backend, bus=None, settle_seconds: float = 0.0):
+        self.backend = backend
+        self.bus = bus
+        self.settle_seconds = settle_seconds
+        # Last invalidation per key; a response loaded across one is not stored
+        self._version = 0
+        self._invalidated = TTLCache(maxsize=100000, ttl=60)
+        self._subscription = None
+        self._task = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    async def get(self, key: str, load: Callable[[], Awaitable[Optional[bytes]]]) -> Optional[Tuple[str, bytes]]:
+        """(etag, body) for the key, loading and storing it on a miss; None if `load` finds nothing."""
+        try:
+            cached = await self.backend.get(key)
+        except Exception as e:
+            # A cache outage degrades to uncached reads rather than failing requests
+            self.errors += 1
+            logger.warning(f"Response cache read failed: {e}")
+            cached = None
+        if cached is not None:
+            self.hits += 1
+            etag, _, body = cached.partition(b"\n")
+            return etag.decode(), body
+
+        self.misses += 1
+        invalidated = self._invalidated.get(key)
+        body = await load()
+        if body is None:
+            return None
+        etag = make_etag(body)
+        settled = invalidated is None or time.monotonic() - invalidated[1] >= self.settle_seconds
+        if self._invalidated.get(key) == invalidated and settled:
+            try:
+                await self.backend.set(key, etag.encode() + b"\n" + body)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Response cache write failed: {e}")
+        return etag, body
+
+    async def invalidate(self, keys: Iterable[str]) -> None:
+        keys = list(keys)
+        self._version += 1
+        for key in keys:
+            self._invalidated[key] = (self._version, time.monotonic())
+        self.invalidations += len(keys)
+        try:
+            await self.backend.delete(keys)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Response cache invalidation failed: {e}")
+
+    async def clear(self) -> None:
+        await self.backend.clear()
+
+    async def invalidate_signal(self, signal_id: str) -> None:
+        await self.invalidate([signal_key(signal_id)])
+
+    async def invalidate_locations(self, signal_ids: Iterable[str]) -> None:
+        await self.invalidate(locations_key(signal_id) for signal_id in signal_ids)
+
+    def start(self) -> None:
+        if self.bus is None:
+            return
+        self._subscription = self.bus.subscribe()
+        self._subscription.bbox = WORLD
+        self._task = asyncio.create_task(consume(self._subscription, self._on_event, self.clear))
+
+    async def stop(self) -> None:
+        if self._subscription:
+            self.bus.unsubscribe(self._subscription)
+            self._subscription = None
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _on_event(self, event: dict) -> None:
+        if event["type"] in SIGNAL_EVENTS:
+            await self.invalidate_signal(event["signal_id"])
+        elif event["type"] == RESCUE_LOCATION:
+            await self.invalidate_locations([event["signal_id"]])
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "size": self.backend.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+        }
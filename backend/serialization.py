@@ -0,0 +1,93 @@
+"""Fast JSON encoding for the high-volume list endpoints.
+
+FastAPI's default path validates every returned item against its response
+model, converts the models back to plain data with `jsonable_encoder` and
+encodes the result with the stdlib `json` module. For a page of 1000 signals
+that is most of the request's CPU time, and it buys nothing for documents
+this service wrote itself.
+
+Routes opt in by building their documents with `signal_dto` (a plain dict
+with exactly the public `SOSSignal` fields and its defaults, no validation)
+and returning `FastJSONResponse`, which encodes with orjson when it is
+installed and falls back to compact stdlib JSON otherwise. Both produce the
+same JSON as the default path; `benchmarks/bench_serialization.py` checks
+that and compares the costs.
+"""
+import json
+from datetime import datetime
+from typing import Any, List, Optional, TypedDict
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # Falls back to the stdlib encoder
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_default).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class ImageRefDTO(TypedDict):
+    hash: str
+    thumbnail_hash: str
+    content_type: str
+    size: int
+
+
+class SignalDTO(TypedDict):
+    id: str
+    latitude: float
+    longitude: float
+    description: str
+    images: List[ImageRefDTO]
+    danger_level: str
+    ai_assessment: str
+    status: str
+    triage_status: str
+    assigned_team_id: Optional[str]
+    report_count: int
+    created_at: str
+    updated_at: str
+
+
+def image_ref_dto(image: dict) -> ImageRefDTO:
+    return {
+        "hash": image["hash"],
+        "thumbnail_hash": image["thumbnail_hash"],
+        "content_type": image["content_type"],
+        "size": image["size"],
+    }
+
+
+def signal_dto(doc: dict) -> SignalDTO:
+    """The public view of a stored signal, with the same fields and defaults as `SOSSignal`."""
+    return {
+        "id": doc["id"],
+        "latitude": float(doc["latitude"]),
+        "longitude": float(doc["longitude"]),
+        "description": doc["description"],
+        "images": [image_ref_dto(image) for image in doc.get("images", ())],
+        "danger_level": doc["danger_level"],
+        "ai_assessment": doc["ai_assessment"],
+        "status": doc["status"],
+        "triage_status": doc.get("triage_status", "done"),
+        "assigned_team_id": doc.get("assigned_team_id"),
+        "report_count": doc.get("report_count", 1),
+        "created_at": doc["created_at"],
+        "updated_at": doc["updated_at"],
+    }
@@ -1,54 +1,197 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Header, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
+import asyncio
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, TypeAdapter, ValidationError
+from typing import List, Optional, Union
+from contextlib import asynccontextmanager
 import uuid
 from datetime import datetime, timezone, timedelta
-from passlib.context import CryptContext
 import jwt
 import base64
-async def analyze_sos_with_ai(description: str, images_base64: List[str]) -> tuple:
-    """
-    Simple fallback analyzer because AI module is removed.
-    """
-    # RULE BASIC: nếu mô tả có từ nguy hiểm → red
-    danger_keywords = ["fire", "cháy", "burn", "accident", "blood", "injured", 
-                       "nguy hiểm", "kêu cứu", "khẩn cấp", "tai nạn", "kẹt"]
-
-    desc_lower = description.lower()
-
-    if any(word in desc_lower for word in danger_keywords):
-        return "red", "High danger based on keywords"
-
-    return "yellow", "Medium danger (AI disabled)"
+import binascii
+import json
 
+from blob_store import create_blob_store, is_blob_hash, InvalidImageError
+from blob_gc import OrphanedBlobCollector
+from geo import point, parse_bbox, bbox_polygon, geohash_encode
+from indexes import ensure_indexes, index_builds_in_progress, index_usage
+from stats import ensure_counters, get_counters, record_signal_created, record_transition
+from events import (
+    EventBus, create_event_backends, signal_event_data,
+    SIGNAL_CREATED, SIGNAL_STATUS_CHANGED, SIGNAL_TRIAGED, SIGNAL_REPORTED, SIGNAL_ARCHIVED, RESCUE_LOCATION,
+    TEAM_CHANGED, CACHES_CLEARED
+)
+from triage import ReloadingTriageEngine, TriageResult, file_loader, collection_loader
+from triage_queue import TriageQueue
+from auth_cache import TeamCache, TokenCache
+from passwords import PasswordHasher, PasswordPoolBusy, LoginThrottle
+from location_buffer import LocationWriteBuffer
+from tracks import ensure_track_collection, from_series_document, TrackDownsampler
+from serialization import FastJSONResponse, signal_dto
+from legacy_images import LegacyImageBackfill, ensure_images
+from archive import ARCHIVE_COLLECTION, ARCHIVED_SIGNAL_PROJECTION, SignalArchiver, find_archived
+from dedup import DuplicateDetector
+from idempotency import KEY_PATTERN, IdempotencyCache, is_valid_key
+from metrics import Gauge, MetricsMiddleware, MongoCommandListener, registry as metrics_registry
+from dispatch import DispatchIndex
+from priority import (
+    PriorityRefresher, decode_queue_cursor, encode_queue_cursor, nearby_candidates, page_after, queue_page, rank,
+    signal_priority, update_priority
+)
+from tiles import MAX_ZOOM, TileCache, backfill_geohashes
+from response_cache import ResponseCache, create_response_cache_backend, etag_matches, locations_key, signal_key
+from uploads import MaxBodySizeMiddleware, MultipartUpload, UploadError, UploadTooLarge
+from mongo_config import client_options, read_preference
+from export import (
+    FORMATS, SIGNAL_COLUMNS, LOCATION_COLUMNS, export_stream, parquet_available, signal_row
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# MongoDB connection; one pool per worker process
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandListener()], **client_options())
 db = client[os.environ['DB_NAME']]
+# Polled per-signal reads; POLL_READ_PREFERENCE=secondaryPreferred moves them off the primary
+POLL_READ_PREFERENCE = os.environ.get('POLL_READ_PREFERENCE', 'primary')
+poll_db = client.get_database(
+    os.environ['DB_NAME'],
+    read_preference=read_preference(
+        POLL_READ_PREFERENCE, int(os.environ.get('POLL_MAX_STALENESS_SECONDS', '0')) or None
+    )
+)
+blob_store = create_blob_store(db)
+# Signals from before the blob store still carry their images inline
+legacy_image_backfill = LegacyImageBackfill(db, blob_store)
+# Images stored for submissions that failed are deleted after this grace period
+orphaned_blobs = OrphanedBlobCollector(
+    db, blob_store, grace=timedelta(minutes=float(os.environ.get('ORPHANED_IMAGE_GRACE_MINUTES', '60')))
+)
+
+# Real-time events and cross-worker broadcasts; EVENT_BUS=changestream makes
+# every worker read writes from MongoDB
+event_bus = EventBus()
+change_stream_source, broadcast = create_event_backends(db, event_bus)
+
+# Map tiles, invalidated from the event bus
+tile_cache = TileCache(db, event_bus, maxsize=int(os.environ.get('TILE_CACHE_SIZE', '4096')))
+
+# Polled per-signal GETs; RESPONSE_CACHE=redis shares the cache between workers
+response_cache = ResponseCache(
+    create_response_cache_backend(
+        maxsize=int(os.environ.get('RESPONSE_CACHE_SIZE', '10000')),
+        ttl=float(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', '30'))
+    ),
+    event_bus,
+    # Secondaries may briefly serve the pre-write document
+    settle_seconds=0.0 if POLL_READ_PREFERENCE == 'primary' else float(os.environ.get('POLL_SETTLE_SECONDS', '2'))
+)
 
 # Security
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_hasher = PasswordHasher(
+    workers=int(os.environ.get('PASSWORD_POOL_WORKERS', '2')),
+    max_queue=int(os.environ.get('PASSWORD_POOL_MAX_QUEUE', '32')),
+    rounds=int(os.environ.get('BCRYPT_ROUNDS', '12'))
+)
+# Per worker: the limits apply to each worker process separately
+login_throttle = LoginThrottle(
+    max_per_username=int(os.environ.get('LOGIN_MAX_FAILURES_PER_USERNAME', '5')),
+    max_per_ip=int(os.environ.get('LOGIN_MAX_FAILURES_PER_IP', '50')),
+    window=float(os.environ.get('LOGIN_THROTTLE_WINDOW_SECONDS', '300'))
+)
+TRUST_FORWARDED_FOR = os.environ.get('TRUST_FORWARDED_FOR', '').lower() in ('1', 'true', 'yes')
 security = HTTPBearer()
 
 JWT_SECRET = os.environ.get('JWT_SECRET_KEY', 'fallback_secret')
 JWT_ALGORITHM = os.environ.get('JWT_ALGORITHM', 'HS256')
 JWT_EXPIRATION_HOURS = int(os.environ.get('JWT_EXPIRATION_HOURS', '24'))
 
-OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
+location_buffer = LocationWriteBuffer(
+    db,
+    max_batch=int(os.environ.get('LOCATION_BATCH_SIZE', '500')),
+    flush_interval=float(os.environ.get('LOCATION_FLUSH_SECONDS', '1')),
+    on_flush=response_cache.invalidate_locations
+)
+
+TRACK_RETENTION_SECONDS = int(float(os.environ.get('TRACK_RETENTION_DAYS', '30')) * 86400)
+track_downsampler = TrackDownsampler(
+    db,
+    downsample_after=timedelta(minutes=float(os.environ.get('TRACK_DOWNSAMPLE_AFTER_MINUTES', '60'))),
+    tolerance_m=float(os.environ.get('TRACK_SIMPLIFY_TOLERANCE_M', '15'))
+)
+
+async def on_signals_archived(signals: List[dict]) -> None:
+    # Archived signals are served from the archive, with their legacy images as references
+    await response_cache.invalidate(
+        [signal_key(signal["id"]) for signal in signals] + [locations_key(signal["id"]) for signal in signals]
+    )
+    for signal in signals:
+        # Drops the pins from cached tiles and from clients' maps
+        event_bus.publish(SIGNAL_ARCHIVED, signal["id"], signal["latitude"], signal["longitude"], signal_event_data(signal))
+
+# Completed signals move to the archive collection once they have been closed this long
+signal_archiver = SignalArchiver(
+    db,
+    blob_store,
+    archive_after=timedelta(days=float(os.environ.get('ARCHIVE_AFTER_DAYS', '7'))),
+    interval=float(os.environ.get('ARCHIVE_INTERVAL_SECONDS', '3600')),
+    on_archive=on_signals_archived
+)
+
+# Keeps the stored queue priority of pending signals current as they wait
+priority_refresher = PriorityRefresher(db, interval=float(os.environ.get('PRIORITY_REFRESH_SECONDS', '60')))
+
+# Repeated submissions of the same SOS are merged into one incident
+duplicate_detector = DuplicateDetector(
+    db,
+    radius_m=float(os.environ.get('DEDUP_RADIUS_M', '150')),
+    window=timedelta(minutes=float(os.environ.get('DEDUP_WINDOW_MINUTES', '60'))),
+    min_similarity=float(os.environ.get('DEDUP_MIN_SIMILARITY', '0.6'))
+)
+
+# Dispatch recommendations from the latest team positions
+dispatch_index = DispatchIndex(
+    db,
+    refresh_interval=float(os.environ.get('DISPATCH_REFRESH_SECONDS', '5')),
+    max_load=int(os.environ.get('DISPATCH_MAX_LOAD', '3')),
+    workload_penalty_m=float(os.environ.get('DISPATCH_WORKLOAD_PENALTY_M', '5000'))
+)
+
+# Upload limits; decoded image bytes, before normalization
+MAX_IMAGES_PER_SIGNAL = int(os.environ.get('MAX_IMAGES_PER_SIGNAL', '3'))
+MAX_IMAGE_BYTES = int(os.environ.get('MAX_IMAGE_BYTES', str(8 * 1024 * 1024)))
+# Enough for the images base64-encoded in a JSON body, plus the other fields
+MAX_REQUEST_BYTES = int(os.environ.get('MAX_REQUEST_BYTES', str(MAX_IMAGES_PER_SIGNAL * MAX_IMAGE_BYTES * 4 // 3 + 1024 * 1024)))
+
+# Replayed submissions (Idempotency-Key) and offline batches
+idempotency_cache = IdempotencyCache(db, ttl=float(os.environ.get('IDEMPOTENCY_CACHE_TTL_SECONDS', '600')))
+MAX_BATCH_REPORTS = int(os.environ.get('MAX_BATCH_REPORTS', '20'))
+
+token_cache = TokenCache()
+team_cache = TeamCache(ttl=float(os.environ.get('TEAM_CACHE_TTL_SECONDS', '60')))
+
+
+async def clear_caches(payload: dict) -> None:
+    tile_cache.clear()
+    team_cache.clear()
+    await response_cache.clear()
+
+
+# Per-worker caches that other workers' writes must reach
+broadcast.on(TEAM_CHANGED, lambda payload: team_cache.invalidate(payload["team_id"]))
+broadcast.on(CACHES_CLEARED, clear_caches)
 
-# Create the main app
-app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
 # Models
@@ -69,34 +212,105 @@ class RescueTeam(BaseModel):
     created_at: str
 
 class SOSSignalCreate(BaseModel):
-    latitude: float
-    longitude: float
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
     description: str
-    images_base64: List[str] = []  # List of base64 images
+    images_base64: List[str] = Field([], max_length=MAX_IMAGES_PER_SIGNAL)  # List of base64 images
     user_selected_level: Optional[str] = "medium"  # red, yellow, green
 
+class SOSBatchReport(SOSSignalCreate):
+    idempotency_key: str = Field(..., pattern=KEY_PATTERN)
+
+class SOSBatchSubmit(BaseModel):
+    reports: List[SOSBatchReport] = Field(..., min_length=1, max_length=MAX_BATCH_REPORTS)
+
+class ImageRef(BaseModel):
+    hash: str
+    thumbnail_hash: str
+    content_type: str
+    size: int
+
 class SOSSignal(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str
     latitude: float
     longitude: float
     description: str
-    images_base64: List[str]
+    images: List[ImageRef] = []
     danger_level: str  # red, yellow, green
     ai_assessment: str
     status: str  # pending, in_progress, completed
+    triage_status: str = "done"  # pending, done, failed
     assigned_team_id: Optional[str] = None
+    report_count: int = 1
     created_at: str
     updated_at: str
 
+# Fields the map and list views need; served without per-item model validation
+SIGNAL_SUMMARY_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "latitude": 1,
+    "longitude": 1,
+    "danger_level": 1,
+    "status": 1,
+    "created_at": 1
+}
+
+# Response schemas of the routes that encode with FastJSONResponse; they document, not validate
+class SOSSignalSummary(BaseModel):
+    id: str
+    latitude: float
+    longitude: float
+    danger_level: str
+    status: str
+    created_at: str
+
+class SOSSignalPage(BaseModel):
+    items: Union[List[SOSSignal], List[SOSSignalSummary]]
+    next_cursor: Optional[str] = None
+
+class NearbySOSSignal(SOSSignal):
+    distance_m: float
+
+class NearbySOSSignalSummary(SOSSignalSummary):
+    distance_m: float
+
+class QueuedSOSSignal(BaseModel):
+    id: str
+    latitude: float
+    longitude: float
+    description: str
+    danger_level: str
+    status: str
+    report_count: int = 1
+    priority: float
+    distance_m: Optional[float] = None  # None when ranked without a team position
+    created_at: str
+
+class QueueOrigin(BaseModel):
+    latitude: float
+    longitude: float
+
+class RescueQueuePage(BaseModel):
+    items: List[QueuedSOSSignal]
+    origin: Optional[QueueOrigin] = None
+    next_cursor: Optional[str] = None
+
 class SOSStatusUpdate(BaseModel):
-    status: str  # in_progress, completed
+    status: str = Field(..., pattern="^(pending|in_progress|completed)$")
     notes: Optional[str] = None
 
 class RescueLocationUpdate(BaseModel):
     signal_id: str
-    latitude: float
-    longitude: float
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+
+class RescueLocationPoint(RescueLocationUpdate):
+    recorded_at: Optional[datetime] = None  # device time, for points queued while offline
+
+class RescueLocationBatch(BaseModel):
+    points: List[RescueLocationPoint] = Field(..., min_length=1, max_length=500)
 
 class RescueLocation(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -107,12 +321,124 @@ class RescueLocation(BaseModel):
     longitude: float
     timestamp: str
 
+RESCUE_LOCATION_LIST = TypeAdapter(List[RescueLocation])
+
 # Helper functions
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+PASSWORD_POOL_BUSY = HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "2"})
+
+async def hash_password(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except PasswordPoolBusy:
+        raise PASSWORD_POOL_BUSY
+
+async def verify_password(plain_password: str, hashed_password: str) -> tuple:
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except PasswordPoolBusy:
+        raise PASSWORD_POOL_BUSY
+
+def client_ip(request: Request) -> Optional[str]:
+    if TRUST_FORWARDED_FOR and request.headers.get("x-forwarded-for"):
+        return request.headers["x-forwarded-for"].split(",")[0].strip()
+    return request.client.host if request.client else None
+
+IMAGE_TOO_LARGE = HTTPException(status_code=413, detail=f"Images are limited to {MAX_IMAGE_BYTES} bytes each")
+
+async def store_signal_image(data: bytes) -> dict:
+    if len(data) > MAX_IMAGE_BYTES:
+        raise IMAGE_TOO_LARGE
+    try:
+        image = await blob_store.store_image(data)
+    except InvalidImageError:
+        raise HTTPException(status_code=400, detail="Invalid image data")
+    # An earlier failed submission of the same photo may have queued it for deletion
+    await orphaned_blobs.keep([image])
+    return image
+
+async def store_signal_images(images_base64: List[str]) -> List[dict]:
+    refs = []
+    try:
+        for img_b64 in images_base64:
+            # Reject from the encoded length before decoding anything
+            if len(img_b64) > (MAX_IMAGE_BYTES + 2) // 3 * 4:
+                raise IMAGE_TOO_LARGE
+            try:
+                data = base64.b64decode(img_b64, validate=True)
+            except binascii.Error:
+                raise HTTPException(status_code=400, detail="Invalid image data")
+            refs.append(await store_signal_image(data))
+    except Exception:
+        await discard_signal_images(refs)
+        raise
+    return refs
+
+async def discard_signal_images(images: List[dict]) -> None:
+    """Hand the blobs stored for a submission that failed to the collector."""
+    try:
+        await orphaned_blobs.queue(images)
+    except Exception as e:
+        # The submission's own error is the one to report
+        logger.warning(f"Could not queue {len(images)} orphaned images for collection: {e}")
+
+def signal_filter_query(status: Optional[str], danger_level: Optional[str]) -> dict:
+    query = {}
+    if status:
+        query["status"] = status
+    if danger_level:
+        query["danger_level"] = danger_level
+    return query
+
+def apply_bbox_filter(query: dict, bbox: Optional[str]) -> dict:
+    try:
+        box = parse_bbox(bbox)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if box:
+        query["location"] = {"$geoWithin": {"$geometry": bbox_polygon(box)}}
+    return query
+
+def time_range_query(since: Optional[datetime], until: Optional[datetime], as_iso: bool = False) -> dict:
+    bounds = {}
+    for op, value in (("$gte", since), ("$lt", until)):
+        if value is None:
+            continue
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        value = value.astimezone(timezone.utc)
+        # Signal timestamps are stored as ISO strings, track timestamps as dates
+        bounds[op] = value.isoformat() if as_iso else value
+    return bounds
+
+def encode_signal_cursor(signal: dict) -> str:
+    raw = json.dumps([signal["created_at"], signal["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+def decode_signal_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, signal_id = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return created_at, signal_id
+
+def iso_utc(value: datetime) -> str:
+    # Motor returns naive datetimes that are in UTC
+    return value.replace(tzinfo=timezone.utc).isoformat() if value.tzinfo is None else value.isoformat()
+
+def make_rescue_location(point_data: RescueLocationUpdate, team_id: str, recorded_at: Optional[datetime] = None) -> dict:
+    if recorded_at is None:
+        recorded_at = datetime.now(timezone.utc)
+    elif recorded_at.tzinfo is None:
+        recorded_at = recorded_at.replace(tzinfo=timezone.utc)
+    return {
+        "id": str(uuid.uuid4()),
+        "signal_id": point_data.signal_id,
+        "team_id": team_id,
+        "latitude": point_data.latitude,
+        "longitude": point_data.longitude,
+        "timestamp": recorded_at.astimezone(timezone.utc).isoformat()
+    }
 
 def create_jwt_token(data: dict) -> str:
     to_encode = data.copy()
@@ -126,80 +452,88 @@ def decode_jwt_token(token: str) -> dict:
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+async def load_team(team_id: str) -> Optional[dict]:
+    return await db.rescue_teams.find_one({"id": team_id}, {"_id": 0, "password_hash": 0})
+
 async def get_current_team(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     token = credentials.credentials
-    payload = decode_jwt_token(token)
-    team = await db.rescue_teams.find_one({"id": payload.get("team_id")}, {"_id": 0})
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = decode_jwt_token(token)
+        token_cache.put(token, payload)
+    team = await team_cache.get(payload.get("team_id"), load_team)
     if not team:
         raise HTTPException(status_code=401, detail="Team not found")
     return team
 
-async def analyze_sos_with_ai(description: str, images_base64: List[str]) -> tuple:
-    """Analyze SOS signal using OpenAI Vision API"""
-    try:
-        chat = LlmChat(
-            api_key=OPENAI_API_KEY,
-            session_id=f"sos-analysis-{uuid.uuid4()}",
-            system_message="You are an emergency assessment AI. Analyze the situation and determine danger level."
-        ).with_model("openai", "gpt-4o")
-
-        # Prepare prompt
-        prompt = f"""Analyze this emergency situation:
-
-Description: {description}
-
-Based on the description and any images provided, assess:
-1. Danger level (high/medium/low)
-2. Brief assessment of the situation
-3. Recommended immediate actions
-
-Respond in this format:
-DANGER_LEVEL: [high/medium/low]
-ASSESSMENT: [your assessment]"""
-
-        # Prepare message with images
-        file_contents = []
-        for img_b64 in images_base64[:3]:  # Limit to 3 images
-            file_contents.append(ImageContent(image_base64=img_b64))
-
-        user_message = UserMessage(
-            text=prompt,
-            file_contents=file_contents if file_contents else None
-        )
+# Background triage
+PROVISIONAL_DANGER_LEVELS = {
+    "red": "red", "high": "red",
+    "yellow": "yellow", "medium": "yellow",
+    "green": "green", "low": "green"
+}
 
-        # Get AI response
-        response = await chat.send_message(user_message)
-        
-        # Parse response
-        danger_level = "medium"  # default
-        assessment = response
-        
-        if "DANGER_LEVEL:" in response:
-            lines = response.split("\n")
-            for line in lines:
-                if "DANGER_LEVEL:" in line:
-                    level = line.split(":")[1].strip().lower()
-                    if level == "high":
-                        danger_level = "red"
-                    elif level == "low":
-                        danger_level = "green"
-                    else:
-                        danger_level = "yellow"
-                    break
-        
-        return danger_level, assessment
-        
-    except Exception as e:
-        logging.error(f"AI analysis error: {str(e)}")
-        # Fallback to basic analysis
-        danger_keywords = ["fire", "blood", "injured", "accident", "trapped", "emergency"]
-        desc_lower = description.lower()
-        if any(word in desc_lower for word in danger_keywords):
-            return "red", "AI analysis unavailable. Flagged as high priority based on keywords."
-        return "yellow", "AI analysis unavailable. Marked as medium priority."
+def provisional_danger_level(user_selected_level: Optional[str]) -> str:
+    return PROVISIONAL_DANGER_LEVELS.get((user_selected_level or "").lower(), "yellow")
+
+if os.environ.get('TRIAGE_RULES_FILE'):
+    triage_engine = ReloadingTriageEngine(file_loader(os.environ['TRIAGE_RULES_FILE']))
+elif os.environ.get('TRIAGE_RULES_COLLECTION'):
+    triage_engine = ReloadingTriageEngine(collection_loader(db[os.environ['TRIAGE_RULES_COLLECTION']]))
+else:
+    triage_engine = ReloadingTriageEngine()
+
+async def run_triage(job: dict) -> TriageResult:
+    return await triage_engine.analyze(job["description"])
+
+async def finish_triage(signal_id: str, result: TriageResult) -> None:
+    danger_level = result.danger_level
+    update_fields = {
+        "danger_level": danger_level,
+        "ai_assessment": result.assessment,
+        "triage_score": result.score,
+        "triage_matches": result.matched,
+        "triage_status": "done",
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }
+    previous = await db.sos_signals.find_one_and_update(
+        {"id": signal_id, "triage_status": "pending"},
+        {"$set": update_fields},
+        projection={"_id": 0, "images": 0, "description": 0},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not previous:
+        if not await db.sos_signals.find_one({"id": signal_id}, {"_id": 1}):
+            # The job is enqueued before the signal is inserted; retry once it lands
+            raise LookupError(f"Signal {signal_id} not found")
+        # Already triaged by another worker whose lease expired mid-job
+        return
+    await record_transition(db, "danger", previous["danger_level"], danger_level)
+    updated = {**previous, **update_fields}
+    await update_priority(db, updated, datetime.now(timezone.utc))
+    await response_cache.invalidate_signal(signal_id)
+    event_bus.publish(SIGNAL_TRIAGED, signal_id, updated["latitude"], updated["longitude"], signal_event_data(updated))
+
+async def fail_triage(signal_id: str, error: str) -> None:
+    # The provisional danger level stays; rescuers see that automated triage failed
+    await db.sos_signals.update_one(
+        {"id": signal_id},
+        {"$set": {"triage_status": "failed", "updated_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    await response_cache.invalidate_signal(signal_id)
+
+triage_queue = TriageQueue(
+    db,
+    analyze=run_triage,
+    on_complete=finish_triage,
+    on_failed=fail_triage,
+    workers=int(os.environ.get('TRIAGE_WORKERS', '4')),
+    timeout=float(os.environ.get('TRIAGE_TIMEOUT_SECONDS', '10')),
+    max_attempts=int(os.environ.get('TRIAGE_MAX_ATTEMPTS', '5'))
+)
 
 # Routes
 @api_router.get("/")
@@ -216,12 +550,15 @@ async def register_rescue_team(team_data: RescueTeamCreate):
     team = {
         "id": str(uuid.uuid4()),
         "username": team_data.username,
-        "password_hash": hash_password(team_data.password),
+        "password_hash": await hash_password(team_data.password),
         "team_name": team_data.team_name,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     
-    await db.rescue_teams.insert_one(team)
+    try:
+        await db.rescue_teams.insert_one(team)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Username already exists")
     
     return {
         "id": team["id"],
@@ -230,10 +567,27 @@ async def register_rescue_team(team_data: RescueTeamCreate):
     }
 
 @api_router.post("/rescue/login")
-async def login_rescue_team(credentials: RescueTeamLogin):
+async def login_rescue_team(credentials: RescueTeamLogin, request: Request):
+    ip = client_ip(request)
+    retry_after = login_throttle.retry_after(credentials.username, ip)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many failed login attempts",
+            headers={"Retry-After": str(retry_after)}
+        )
+    
     team = await db.rescue_teams.find_one({"username": credentials.username}, {"_id": 0})
-    if not team or not verify_password(credentials.password, team["password_hash"]):
+    valid, new_hash = await verify_password(credentials.password, team["password_hash"]) if team else (False, None)
+    if not valid:
+        login_throttle.record_failure(credentials.username, ip)
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    login_throttle.record_success(credentials.username)
+    
+    if new_hash:
+        # Cost factor changed since this hash was made; upgrade it transparently
+        await db.rescue_teams.update_one({"id": team["id"]}, {"$set": {"password_hash": new_hash}})
+        await broadcast.publish(TEAM_CHANGED, {"team_id": team["id"]})
     
     token = create_jwt_token({"team_id": team["id"], "username": team["username"]})
     
@@ -248,51 +602,328 @@ async def login_rescue_team(credentials: RescueTeamLogin):
     }
 
 # SOS Signal Management
+def idempotency_key_header(idempotency_key: Optional[str] = Header(None)) -> Optional[str]:
+    if idempotency_key is not None and not is_valid_key(idempotency_key):
+        raise HTTPException(
+            status_code=400,
+            detail="Idempotency-Key must be 8-128 letters, digits or '.', '_', ':', '-'"
+        )
+    return idempotency_key
+
+async def replay_submission(idempotency_key: Optional[str], response: Response) -> Optional[dict]:
+    if not idempotency_key:
+        return None
+    signal = await idempotency_cache.replay(idempotency_key)
+    if signal is not None:
+        response.headers["Idempotent-Replayed"] = "true"
+    return signal
+
 @api_router.post("/sos/create", response_model=SOSSignal)
-async def create_sos_signal(signal_data: SOSSignalCreate):
-    # Analyze with AI
-    danger_level, ai_assessment = await analyze_sos_with_ai(
-        signal_data.description,
-        signal_data.images_base64
+async def create_sos_signal(
+    signal_data: SOSSignalCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Depends(idempotency_key_header)
+):
+    """Create a signal. Retries sent with the same Idempotency-Key return the original signal."""
+    replayed = await replay_submission(idempotency_key, response)
+    if replayed:
+        return replayed
+    images = await store_signal_images(signal_data.images_base64)
+    return await submit_with_images(signal_data, images, idempotency_key)
+
+@api_router.post("/sos/create/upload", response_model=SOSSignal)
+async def create_sos_signal_upload(
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Depends(idempotency_key_header)
+):
+    """Multipart variant of /sos/create: the same fields as form fields, images as `images` file parts.
+
+    Images are streamed, size-checked and stored one at a time as they arrive
+    instead of being buffered in the request body.
+    """
+    replayed = await replay_submission(idempotency_key, response)
+    if replayed:
+        return replayed
+    images = []
+    try:
+        signal_data = await parse_signal_upload(request, images)
+    except Exception:
+        await discard_signal_images(images)
+        raise
+    return await submit_with_images(signal_data, images, idempotency_key)
+
+async def parse_signal_upload(request: Request, images: List[dict]) -> SOSSignalCreate:
+    """Read the multipart form, storing its images into `images` as they arrive."""
+    async def store(name: str, data: bytes) -> None:
+        if name != "images":
+            raise UploadError(f"Unexpected file field '{name}'")
+        images.append(await store_signal_image(data))
+
+    try:
+        upload = MultipartUpload(
+            request.headers.get("content-type", ""), store,
+            max_file_bytes=MAX_IMAGE_BYTES, max_files=MAX_IMAGES_PER_SIGNAL
+        )
+        fields = await upload.parse(request.stream())
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    fields.pop("images_base64", None)
+    try:
+        return SOSSignalCreate.model_validate(fields)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+@api_router.post("/sos/batch")
+async def create_sos_signal_batch(batch: SOSBatchSubmit):
+    """Submit reports queued on a device while offline, each with its own idempotency key.
+
+    Reports are handled in order and independently; the response holds one
+    result per report, so the client can drop the ones that succeeded and
+    safely resend the whole batch if the response is lost.
+    """
+    results = []
+    for report in batch.reports:
+        key = report.idempotency_key
+        try:
+            signal = await idempotency_cache.replay(key)
+            replayed = signal is not None
+            if not replayed:
+                images = await store_signal_images(report.images_base64)
+                signal = await submit_with_images(report, images, key)
+        except HTTPException as e:
+            results.append({"idempotency_key": key, "status": e.status_code, "detail": e.detail})
+            continue
+        except Exception as e:
+            # One failed report must not take the results of the others down with it
+            logger.error(f"Batch report {key} failed: {e}")
+            results.append({"idempotency_key": key, "status": 500, "detail": "Internal error, retry this report"})
+            continue
+        results.append({
+            "idempotency_key": key,
+            "status": 200,
+            "replayed": replayed,
+            "signal": SOSSignal.model_validate(signal).model_dump()
+        })
+    return {"results": results}
+
+async def submit_with_images(
+    signal_data: SOSSignalCreate, images: List[dict], idempotency_key: Optional[str] = None
+) -> dict:
+    """Submit a signal whose images are already stored, deleting the ones it ends up not using."""
+    try:
+        signal = await submit_sos_signal(signal_data, images, idempotency_key)
+    except Exception:
+        await discard_signal_images(images)
+        raise
+    # A retry that lost the race to an earlier attempt returns that attempt's signal
+    kept = {image["hash"] for image in signal.get("images", [])}
+    unused = [image for image in images if image["hash"] not in kept]
+    if unused:
+        await discard_signal_images(unused)
+    return signal
+
+async def submit_sos_signal(
+    signal_data: SOSSignalCreate, images: List[dict], idempotency_key: Optional[str] = None
+) -> dict:
+    now = datetime.now(timezone.utc).isoformat()
+
+    duplicate = await duplicate_detector.find_duplicate(
+        signal_data.latitude, signal_data.longitude, signal_data.description, [image["hash"] for image in images]
     )
+    if duplicate:
+        report = {
+            "latitude": signal_data.latitude,
+            "longitude": signal_data.longitude,
+            "description": signal_data.description,
+            "created_at": now
+        }
+        try:
+            merged = await duplicate_detector.merge(duplicate["id"], report, images, idempotency_key)
+        except DuplicateKeyError:
+            # A concurrent attempt with the same key was stored as a separate signal first
+            merged = None
+        if merged:
+            await update_priority(db, merged, datetime.now(timezone.utc))
+            await response_cache.invalidate_signal(merged["id"])
+            event_bus.publish(SIGNAL_REPORTED, merged["id"], merged["latitude"], merged["longitude"], signal_event_data(merged))
+            if idempotency_key:
+                idempotency_cache.remember(idempotency_key, merged)
+            return merged
+        if idempotency_key:
+            # A concurrent attempt with the same key may have merged first
+            replayed = await idempotency_cache.replay(idempotency_key)
+            if replayed:
+                return replayed
     
+    # Persist right away with the victim's own assessment; the triage queue re-scores it
     signal = {
         "id": str(uuid.uuid4()),
         "latitude": signal_data.latitude,
         "longitude": signal_data.longitude,
+        "location": point(signal_data.latitude, signal_data.longitude),
+        "geohash": geohash_encode(signal_data.latitude, signal_data.longitude),
         "description": signal_data.description,
-        "images_base64": signal_data.images_base64,
-        "danger_level": danger_level,
-        "ai_assessment": ai_assessment,
+        "images": images,
+        "danger_level": provisional_danger_level(signal_data.user_selected_level),
+        "ai_assessment": "Awaiting automated assessment",
+        "triage_status": "pending",
         "status": "pending",
         "assigned_team_id": None,
-        "created_at": datetime.now(timezone.utc).isoformat(),
-        "updated_at": datetime.now(timezone.utc).isoformat()
+        "report_count": 1,
+        "created_at": now,
+        "updated_at": now
     }
+    signal["priority"] = signal_priority(signal, datetime.fromisoformat(now))
+    if idempotency_key:
+        signal["idempotency_keys"] = [idempotency_key]
     
-    await db.sos_signals.insert_one(signal)
+    await triage_queue.enqueue(signal["id"], signal["description"], [image["hash"] for image in images])
+    try:
+        await db.sos_signals.insert_one(dict(signal))
+    except DuplicateKeyError:
+        # A concurrent attempt with the same key was stored first
+        await triage_queue.cancel(signal["id"])
+        replayed = await idempotency_cache.replay(idempotency_key) if idempotency_key else None
+        if replayed is None:
+            raise
+        return replayed
+    if idempotency_key:
+        idempotency_cache.remember(idempotency_key, signal)
+    await record_signal_created(db, signal)
+    event_bus.publish(SIGNAL_CREATED, signal["id"], signal["latitude"], signal["longitude"], signal_event_data(signal))
     return signal
 
-@api_router.get("/sos/signals", response_model=List[SOSSignal])
+@api_router.get("/sos/signals", response_model=Union[List[SOSSignal], List[SOSSignalSummary], SOSSignalPage])
 async def get_all_sos_signals(
     status: Optional[str] = None,
-    danger_level: Optional[str] = None
+    danger_level: Optional[str] = None,
+    fields: Optional[str] = Query(None, pattern="^(full|summary)$"),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    bbox: Optional[str] = None
 ):
-    query = {}
-    if status:
-        query["status"] = status
-    if danger_level:
-        query["danger_level"] = danger_level
-    
-    signals = await db.sos_signals.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    return signals
+    query = apply_bbox_filter(signal_filter_query(status, danger_level), bbox)
+
+    # Keyset pagination on (created_at, id): each page is an index range scan,
+    # so latency does not depend on how deep into the history the client is
+    paginated = limit is not None or cursor is not None
+    if cursor:
+        created_at, signal_id = decode_signal_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "id": {"$lt": signal_id}}
+        ]
+
+    summary = fields == "summary"
+    projection = SIGNAL_SUMMARY_PROJECTION if summary else {"_id": 0, "images_base64": 0}
+    page_size = limit or 1000
+    fetch_size = page_size + 1 if paginated else page_size
+
+    signals = await db.sos_signals.find(query, projection).sort(
+        [("created_at", -1), ("id", -1)]
+    ).limit(fetch_size).to_list(fetch_size)
+
+    next_cursor = None
+    if paginated and len(signals) > page_size:
+        signals = signals[:page_size]
+        next_cursor = encode_signal_cursor(signals[-1])
+
+    # Documents come from our own writes; skip response model validation
+    items = signals if summary else [signal_dto(signal) for signal in await ensure_images(db, blob_store, signals)]
+    return FastJSONResponse(content={"items": items, "next_cursor": next_cursor} if paginated else items)
+
+@api_router.get("/sos/signals/near", response_model=Union[List[NearbySOSSignal], List[NearbySOSSignalSummary]])
+async def get_nearby_sos_signals(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(5000, gt=0, le=200000),
+    status: Optional[str] = None,
+    danger_level: Optional[str] = None,
+    fields: Optional[str] = Query(None, pattern="^(full|summary)$"),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    if fields == "summary":
+        projection = {**SIGNAL_SUMMARY_PROJECTION, "distance_m": 1}
+    else:
+        projection = {"_id": 0, "images_base64": 0}
+
+    signals = await db.sos_signals.aggregate([
+        {"$geoNear": {
+            "near": point(lat, lon),
+            "distanceField": "distance_m",
+            "maxDistance": radius_m,
+            "query": signal_filter_query(status, danger_level),
+            "spherical": True
+        }},
+        {"$limit": limit},
+        {"$project": projection}
+    ]).to_list(limit)
+
+    if fields == "summary":
+        return FastJSONResponse(content=signals)
+    await ensure_images(db, blob_store, signals)
+    return FastJSONResponse(content=[{**signal_dto(signal), "distance_m": signal["distance_m"]} for signal in signals])
+
+@api_router.get("/sos/tiles/{z}/{x}/{y}")
+async def get_sos_tile(z: int, x: int, y: int):
+    if not 0 <= z <= MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail="Tile is out of range")
+    return await tile_cache.get(z, x, y)
+
+@api_router.get("/sos/clusters")
+async def get_sos_clusters(bbox: str, zoom: int = Query(..., ge=0, le=MAX_ZOOM)):
+    try:
+        return await tile_cache.clusters(parse_bbox(bbox), zoom)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def cached_json_response(key: str, load, if_none_match: Optional[str], not_found: str) -> Response:
+    cached = await response_cache.get(key, load)
+    if cached is None:
+        raise HTTPException(status_code=404, detail=not_found)
+    etag, body = cached
+    # Clients may keep the body but must revalidate it on every poll
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @api_router.get("/sos/signals/{signal_id}", response_model=SOSSignal)
-async def get_sos_signal(signal_id: str):
-    signal = await db.sos_signals.find_one({"id": signal_id}, {"_id": 0})
-    if not signal:
-        raise HTTPException(status_code=404, detail="Signal not found")
-    return signal
+async def get_sos_signal(signal_id: str, if_none_match: Optional[str] = Header(None)):
+    async def load() -> Optional[bytes]:
+        signal = await poll_db.sos_signals.find_one({"id": signal_id}, {"_id": 0, "images_base64": 0})
+        if not signal:
+            signal = await find_archived(poll_db, signal_id)
+        elif "images" not in signal:
+            await ensure_images(db, blob_store, [signal])
+        return SOSSignal.model_validate(signal).model_dump_json().encode() if signal else None
+
+    return await cached_json_response(signal_key(signal_id), load, if_none_match, "Signal not found")
+
+@api_router.get("/sos/images/{image_hash}")
+async def get_sos_image(image_hash: str, if_none_match: Optional[str] = Header(None)):
+    if not is_blob_hash(image_hash):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    # Blobs are content-addressed, so the hash is a strong validator that never changes
+    etag = f'"{image_hash}"'
+    cache_headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=cache_headers)
+
+    info = await blob_store.info(image_hash)
+    if not info:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    return StreamingResponse(
+        blob_store.stream(image_hash),
+        media_type=info.content_type,
+        headers={**cache_headers, "Content-Length": str(info.length)}
+    )
 
 @api_router.put("/sos/signals/{signal_id}/status")
 async def update_sos_status(
@@ -300,10 +931,6 @@ async def update_sos_status(
     update_data: SOSStatusUpdate,
     current_team: dict = Depends(get_current_team)
 ):
-    signal = await db.sos_signals.find_one({"id": signal_id}, {"_id": 0})
-    if not signal:
-        raise HTTPException(status_code=404, detail="Signal not found")
-    
     update_fields = {
         "status": update_data.status,
         "assigned_team_id": current_team["id"],
@@ -313,7 +940,20 @@ async def update_sos_status(
     if update_data.notes:
         update_fields["rescue_notes"] = update_data.notes
     
-    await db.sos_signals.update_one({"id": signal_id}, {"$set": update_fields})
+    # Read the previous status in the same atomic operation so counters stay exact
+    previous = await db.sos_signals.find_one_and_update(
+        {"id": signal_id},
+        {"$set": update_fields},
+        projection={"_id": 0, "id": 1, "latitude": 1, "longitude": 1, "danger_level": 1, "status": 1, "created_at": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not previous:
+        raise HTTPException(status_code=404, detail="Signal not found")
+    
+    await record_transition(db, "status", previous["status"], update_data.status)
+    await response_cache.invalidate_signal(signal_id)
+    updated = {**previous, **update_fields}
+    event_bus.publish(SIGNAL_STATUS_CHANGED, signal_id, updated["latitude"], updated["longitude"], signal_event_data(updated))
     
     return {"message": "Status updated", "signal_id": signal_id}
 
@@ -323,53 +963,334 @@ async def update_rescue_location(
     location_data: RescueLocationUpdate,
     current_team: dict = Depends(get_current_team)
 ):
-    location = {
-        "id": str(uuid.uuid4()),
-        "signal_id": location_data.signal_id,
-        "team_id": current_team["id"],
-        "latitude": location_data.latitude,
-        "longitude": location_data.longitude,
-        "timestamp": datetime.now(timezone.utc).isoformat()
-    }
-    
-    await db.rescue_locations.insert_one(location)
+    location = make_rescue_location(location_data, current_team["id"])
+    await location_buffer.add([location])
+    event_bus.publish(RESCUE_LOCATION, location["signal_id"], location["latitude"], location["longitude"], location)
     return location
 
+@api_router.post("/rescue/location/batch")
+async def update_rescue_locations_batch(
+    batch: RescueLocationBatch,
+    current_team: dict = Depends(get_current_team)
+):
+    locations = [make_rescue_location(p, current_team["id"], p.recorded_at) for p in batch.points]
+    await location_buffer.add(locations)
+
+    # Subscribers only need the newest point of each signal in the batch
+    latest = {}
+    for location in locations:
+        if location["signal_id"] not in latest or location["timestamp"] >= latest[location["signal_id"]]["timestamp"]:
+            latest[location["signal_id"]] = location
+    for location in latest.values():
+        event_bus.publish(RESCUE_LOCATION, location["signal_id"], location["latitude"], location["longitude"], location)
+
+    return {"accepted": len(locations)}
+
 @api_router.get("/rescue/location/{signal_id}", response_model=List[RescueLocation])
-async def get_rescue_locations(signal_id: str):
-    locations = await db.rescue_locations.find(
+async def get_rescue_locations(signal_id: str, if_none_match: Optional[str] = Header(None)):
+    async def load() -> bytes:
+        track = await poll_db.rescue_signal_tracks.find_one({"_id": signal_id}, {"points": 1})
+        if track:
+            return RESCUE_LOCATION_LIST.dump_json(RESCUE_LOCATION_LIST.validate_python(track["points"]))
+
+        archived = await find_archived(poll_db, signal_id, {"_id": 0, "locations": 1})
+        if archived:
+            return RESCUE_LOCATION_LIST.dump_json(RESCUE_LOCATION_LIST.validate_python(archived["locations"]))
+
+        # Signals tracked before the read model existed
+        locations = await poll_db.rescue_locations.find(
+            {"meta.signal_id": signal_id},
+            {"_id": 0}
+        ).sort("timestamp", -1).limit(10).to_list(10)
+        return RESCUE_LOCATION_LIST.dump_json(
+            RESCUE_LOCATION_LIST.validate_python([from_series_document(location) for location in locations])
+        )
+
+    # New points reach the track when the location buffer flushes, which invalidates the entry
+    return await cached_json_response(locations_key(signal_id), load, if_none_match, "Track not found")
+
+@api_router.get("/rescue/track/{signal_id}")
+async def get_rescue_mission_tracks(signal_id: str):
+    missions = await db.rescue_mission_tracks.find(
         {"signal_id": signal_id},
-        {"_id": 0}
-    ).sort("timestamp", -1).limit(10).to_list(10)
-    return locations
+        {"_id": 0, "points": 0}
+    ).to_list(100)
+    if not missions:
+        archived = await find_archived(db, signal_id, {"_id": 0, "tracks.points": 0})
+        missions = archived["tracks"] if archived else []
+    return [
+        {**mission, "started_at": iso_utc(mission["started_at"]), "ended_at": iso_utc(mission["ended_at"])}
+        for mission in missions
+    ]
+
+# Bulk export
+def export_response(fmt: str, name: str, stream) -> StreamingResponse:
+    media_type, extension = FORMATS[fmt]
+    filename = f"{name}_{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.{extension}"
+    return StreamingResponse(
+        stream,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def check_export_format(fmt: str) -> None:
+    if fmt == "parquet" and not parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow on the server")
+
+@api_router.get("/export/signals")
+async def export_sos_signals(
+    format: str = Query("ndjson", pattern="^(ndjson|csv|parquet)$"),
+    status: Optional[str] = None,
+    danger_level: Optional[str] = None,
+    bbox: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    archived: bool = False,
+    current_team: dict = Depends(get_current_team)
+):
+    check_export_format(format)
+    query = apply_bbox_filter(signal_filter_query(status, danger_level), bbox)
+    created_at = time_range_query(since, until, as_iso=True)
+    if created_at:
+        query["created_at"] = created_at
+
+    if archived:
+        collection, name, projection = db[ARCHIVE_COLLECTION], ARCHIVE_COLLECTION, ARCHIVED_SIGNAL_PROJECTION
+    else:
+        collection, name, projection = db.sos_signals, "sos_signals", {"_id": 0, "images_base64": 0}
+    cursor = collection.find(query, projection).sort([("created_at", 1), ("id", 1)])
+    return export_response(format, name, export_stream(cursor, signal_row, SIGNAL_COLUMNS, format))
+
+@api_router.get("/export/locations")
+async def export_rescue_locations(
+    format: str = Query("ndjson", pattern="^(ndjson|csv|parquet)$"),
+    signal_id: Optional[str] = None,
+    team_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_team: dict = Depends(get_current_team)
+):
+    check_export_format(format)
+    query = {}
+    if signal_id:
+        query["meta.signal_id"] = signal_id
+    if team_id:
+        query["meta.team_id"] = team_id
+    timestamp = time_range_query(since, until)
+    if timestamp:
+        query["timestamp"] = timestamp
+
+    cursor = db.rescue_locations.find(query, {"_id": 0}).sort("timestamp", 1)
+    return export_response(
+        format, "rescue_locations",
+        export_stream(cursor, from_series_document, LOCATION_COLUMNS, format)
+    )
+
+# Dispatch
+@api_router.get("/dispatch/suggest/{signal_id}")
+async def suggest_dispatch(
+    signal_id: str,
+    k: int = Query(5, ge=1, le=50),
+    max_distance_m: float = Query(50000, gt=0, le=500000),
+    current_team: dict = Depends(get_current_team)
+):
+    signal = await db.sos_signals.find_one({"id": signal_id}, {"_id": 0, "id": 1, "latitude": 1, "longitude": 1})
+    if not signal:
+        raise HTTPException(status_code=404, detail="Signal not found")
+
+    suggestions = dispatch_index.suggest(signal["latitude"], signal["longitude"], k, max_distance_m)
+    teams = await db.rescue_teams.find(
+        {"id": {"$in": [suggestion["team_id"] for suggestion in suggestions]}},
+        {"_id": 0, "id": 1, "team_name": 1}
+    ).to_list(k)
+    names = {team["id"]: team["team_name"] for team in teams}
+    return {
+        "signal_id": signal_id,
+        "teams": [{**suggestion, "team_name": names.get(suggestion["team_id"])} for suggestion in suggestions],
+        "positions_as_of": dispatch_index.stats()["built_at"]
+    }
+
+@api_router.get("/dispatch/batch")
+async def plan_dispatch_batch(
+    danger_level: str = Query("red", pattern="^(red|yellow|green)$"),
+    max_distance_m: float = Query(50000, gt=0, le=500000),
+    limit: int = Query(5000, ge=1, le=20000),
+    current_team: dict = Depends(get_current_team)
+):
+    # Oldest calls first: the greedy match gives them the first pick of teams
+    signals = await db.sos_signals.find(
+        {"status": "pending", "danger_level": danger_level},
+        {"_id": 0, "id": 1, "latitude": 1, "longitude": 1}
+    ).sort([("created_at", 1), ("id", 1)]).limit(limit).to_list(limit)
+    return {**dispatch_index.plan(signals, max_distance_m), "index": dispatch_index.stats()}
 
 # Dashboard Stats
 @api_router.get("/rescue/dashboard/stats")
-async def get_dashboard_stats(current_team: dict = Depends(get_current_team)):
-    total_signals = await db.sos_signals.count_documents({})
-    red_signals = await db.sos_signals.count_documents({"danger_level": "red"})
-    yellow_signals = await db.sos_signals.count_documents({"danger_level": "yellow"})
-    green_signals = await db.sos_signals.count_documents({"danger_level": "green"})
-    pending_signals = await db.sos_signals.count_documents({"status": "pending"})
+async def get_dashboard_stats(
+    breakdowns: bool = False,
+    current_team: dict = Depends(get_current_team)
+):
+    counters = await get_counters(db, breakdowns)
+    danger = counters.get("danger", {})
+    by_status = counters.get("status", {})
     
+    stats = {
+        "total_signals": counters.get("total", 0),
+        "red_signals": danger.get("red", 0),
+        "yellow_signals": danger.get("yellow", 0),
+        "green_signals": danger.get("green", 0),
+        "pending_signals": by_status.get("pending", 0)
+    }
+    if breakdowns:
+        stats["by_status"] = by_status
+        stats["by_region"] = counters.get("region", {})
+        stats["by_hour"] = counters.get("hour", {})
+    return stats
+
+@api_router.get("/rescue/queue", response_model=RescueQueuePage)
+async def get_rescue_queue(
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    radius_m: float = Query(50000, gt=0, le=200000),
+    limit: int = Query(20, ge=1, le=200),
+    cursor: Optional[str] = None,
+    current_team: dict = Depends(get_current_team)
+):
+    """Pending signals around the team, highest priority first.
+
+    Ranked from the given position, else the team's last reported one; with
+    no position at all, by priority alone. Later pages reuse the first page's
+    origin from the cursor.
+    """
+    after = None
+    if cursor:
+        try:
+            origin, after = decode_queue_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        if lat is not None and lon is not None:
+            origin = (lat, lon)
+        else:
+            position = await db.rescue_team_positions.find_one(
+                {"_id": current_team["id"]}, {"_id": 0, "latitude": 1, "longitude": 1}
+            )
+            origin = (position["latitude"], position["longitude"]) if position else None
+
+    if origin is None:
+        items, more = await queue_page(db, after, limit)
+    else:
+        ranked = rank(await nearby_candidates(db, origin, radius_m), datetime.now(timezone.utc))
+        items, more = page_after(ranked, after, limit)
+    return FastJSONResponse(content={
+        "items": items,
+        "origin": {"latitude": origin[0], "longitude": origin[1]} if origin else None,
+        "next_cursor": encode_queue_cursor(origin, items[-1]) if more else None
+    })
+
+# Admin
+@api_router.get("/admin/indexes")
+async def get_index_stats(current_team: dict = Depends(get_current_team)):
+    return {
+        "collections": await index_usage(db),
+        "builds_in_progress": await index_builds_in_progress(db)
+    }
+
+@api_router.get("/admin/cache")
+async def get_cache_stats(current_team: dict = Depends(get_current_team)):
     return {
-        "total_signals": total_signals,
-        "red_signals": red_signals,
-        "yellow_signals": yellow_signals,
-        "green_signals": green_signals,
-        "pending_signals": pending_signals
+        "tokens": token_cache.stats(),
+        "teams": team_cache.stats(),
+        "idempotency": idempotency_cache.stats(),
+        "tiles": tile_cache.stats(),
+        "responses": response_cache.stats(),
+        "archive": signal_archiver.stats()
     }
 
+@api_router.post("/admin/cache/clear")
+async def clear_all_caches(current_team: dict = Depends(get_current_team)):
+    # Reaches every worker, not just the one serving this request
+    await broadcast.publish(CACHES_CLEARED, {})
+    return {"message": "Caches cleared"}
+
+@api_router.get("/admin/password-pool")
+async def get_password_pool_stats(current_team: dict = Depends(get_current_team)):
+    return password_hasher.stats()
+
+# Real-time push channel
+MAX_SUBSCRIBED_SIGNALS = 100
+
+def apply_subscription_command(subscription, message: dict) -> dict:
+    action = message.get("action")
+    if action not in ("subscribe", "unsubscribe"):
+        return {"type": "error", "data": {"detail": "Unknown action"}}
+
+    signal_ids = message.get("signal_ids") or []
+    if not isinstance(signal_ids, list) or not all(isinstance(s, str) for s in signal_ids):
+        return {"type": "error", "data": {"detail": "signal_ids must be a list of strings"}}
+
+    if action == "subscribe":
+        if len(subscription.signal_ids | set(signal_ids)) > MAX_SUBSCRIBED_SIGNALS:
+            return {"type": "error", "data": {"detail": "Too many subscribed signals"}}
+        subscription.signal_ids.update(signal_ids)
+        if message.get("bbox") is not None:
+            bbox = message["bbox"]
+            try:
+                subscription.bbox = parse_bbox(bbox if isinstance(bbox, str) else ",".join(str(v) for v in bbox))
+            except (TypeError, ValueError) as e:
+                return {"type": "error", "data": {"detail": str(e)}}
+    else:
+        subscription.signal_ids.difference_update(signal_ids)
+        if message.get("bbox"):
+            subscription.bbox = None
+
+    return {"type": "subscribed", "data": {
+        "signal_ids": sorted(subscription.signal_ids),
+        "bbox": list(subscription.bbox) if subscription.bbox else None
+    }}
+
+@api_router.websocket("/ws")
+async def events_websocket(websocket: WebSocket):
+    await websocket.accept()
+    subscription = event_bus.subscribe()
+
+    async def receive_commands():
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                message = {}
+            reply = apply_subscription_command(subscription, message if isinstance(message, dict) else {})
+            # Replies go through the queue so only send_events writes to the socket
+            await subscription.queue.put(reply)
+
+    async def send_events():
+        while True:
+            event = await subscription.queue.get()
+            await websocket.send_json({"type": event["type"], "data": event["data"]})
+
+    tasks = [asyncio.create_task(receive_commands()), asyncio.create_task(send_events())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        event_bus.unsubscribe(subscription)
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception) and not isinstance(result, (WebSocketDisconnect, asyncio.CancelledError)):
+                logger.warning(f"WebSocket closed with error: {result}")
+
 # Include router
-app.include_router(api_router)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+metrics_registry.register(Gauge(
+    "sos_websocket_subscriptions", "Connected WebSocket clients.", fn=lambda: len(event_bus.subscriptions)))
+metrics_registry.register(Gauge(
+    "sos_location_buffer_pending", "Rescue locations waiting to be flushed.", fn=lambda: location_buffer.pending))
+metrics_registry.register(Gauge(
+    "sos_password_pool_pending", "Password hashes running or queued.", fn=lambda: password_hasher.pending))
+
+async def get_metrics():
+    return Response(content=metrics_registry.render(), media_type="text/plain; version=0.0.4")
 
 logging.basicConfig(
     level=logging.INFO,
@@ -377,7 +1298,73 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
+async def startup_db():
+    # Signals created before the location field existed get it derived from lat/lon
+    await db.sos_signals.update_many(
+        {"location": {"$exists": False}},
+        [{"$set": {"location": {"type": "Point", "coordinates": ["$longitude", "$latitude"]}}}]
+    )
+    await db.sos_signals.update_many({"report_count": {"$exists": False}}, {"$set": {"report_count": 1}})
+    await backfill_geohashes(db)
+    await ensure_track_collection(db, TRACK_RETENTION_SECONDS)
+    await ensure_indexes(db)
+    await ensure_counters(db)
+    legacy_image_backfill.start()
+    triage_queue.start()
+    location_buffer.start()
+    track_downsampler.start()
+    signal_archiver.start()
+    priority_refresher.start()
+    orphaned_blobs.start()
+    tile_cache.start()
+    response_cache.start()
+    dispatch_index.start()
+    if change_stream_source:
+        change_stream_source.start()
+    broadcast.start()
+
 async def shutdown_db_client():
+    await broadcast.stop()
+    if change_stream_source:
+        await change_stream_source.stop()
+    await legacy_image_backfill.stop()
+    await triage_queue.stop()
+    await location_buffer.stop()
+    await track_downsampler.stop()
+    await signal_archiver.stop()
+    await priority_refresher.stop()
+    await orphaned_blobs.stop()
+    await tile_cache.stop()
+    await response_cache.stop()
+    await dispatch_index.stop()
     client.close()
-    # test update
\ No newline at end of file
+    # test update
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup_db()
+    yield
+    await shutdown_db_client()
+
+def create_app() -> FastAPI:
+    """The ASGI app; `uvicorn server:create_app --factory --workers N` runs one per worker process."""
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(api_router)
+    app.add_api_route("/metrics", get_metrics, methods=["GET"], include_in_schema=False)
+
+    # Inside CORS, so browsers can read the 413
+    app.add_middleware(MaxBodySizeMiddleware, max_bytes=MAX_REQUEST_BYTES)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Outermost, so the timing covers every other middleware
+    app.add_middleware(MetricsMiddleware, slow_request_seconds=float(os.environ.get('SLOW_REQUEST_MS', '1000')) / 1000)
+    return app
+
+app = create_app()
@@ -0,0 +1,97 @@
+"""Materialized SOS counters for the rescue dashboard.
+
+A single document holds totals by danger level, status, region and hour. The
+write paths keep it current with atomic `$inc` updates, so the dashboard reads
+one document by primary key instead of counting the signals collection.
+"""
+import logging
+import math
+
+from archive import ARCHIVE_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+COUNTERS_ID = "sos_signals"
+DANGER_LEVELS = ("red", "yellow", "green")
+
+# Regions are 1x1 degree cells, roughly 110 km on a side
+REGION_CELL_DEGREES = 1
+
+# Left out of dashboard reads that do not ask for the breakdowns
+BREAKDOWN_PROJECTION = {"region": 0, "hour": 0}
+
+
+def region_key(latitude: float, longitude: float) -> str:
+    return f"{math.floor(latitude / REGION_CELL_DEGREES)}_{math.floor(longitude / REGION_CELL_DEGREES)}"
+
+
+def hour_key(created_at: str) -> str:
+    # ISO timestamps sort and bucket by their first 13 characters: YYYY-MM-DDTHH
+    return created_at[:13]
+
+
+async def record_signal_created(db, signal: dict) -> None:
+    await db.stats.update_one({"_id": COUNTERS_ID}, {"$inc": {
+        "total": 1,
+        f"danger.{signal['danger_level']}": 1,
+        f"status.{signal['status']}": 1,
+        f"region.{region_key(signal['latitude'], signal['longitude'])}": 1,
+        f"hour.{hour_key(signal['created_at'])}": 1,
+    }})
+
+
+async def record_transition(db, field: str, old: str, new: str) -> None:
+    """Move one signal from `old` to `new` in the `status` or `danger` breakdown."""
+    if old == new:
+        return
+    await db.stats.update_one({"_id": COUNTERS_ID}, {"$inc": {f"{field}.{old}": -1, f"{field}.{new}": 1}})
+
+
+async def rebuild_counters(db) -> dict:
+    """Recount everything, archived signals included, in one aggregation pass and replace the counters document."""
+    result = await db.sos_signals.aggregate([
+        {"$unionWith": ARCHIVE_COLLECTION},
+        {"$facet": {
+            "total": [{"$count": "n"}],
+            "danger": [{"$group": {"_id": "$danger_level", "n": {"$sum": 1}}}],
+            "status": [{"$group": {"_id": "$status", "n": {"$sum": 1}}}],
+            "region": [{"$group": {
+                "_id": {"$concat": [
+                    {"$toString": {"$floor": {"$divide": ["$latitude", REGION_CELL_DEGREES]}}},
+                    "_",
+                    {"$toString": {"$floor": {"$divide": ["$longitude", REGION_CELL_DEGREES]}}},
+                ]},
+                "n": {"$sum": 1},
+            }}],
+            "hour": [{"$group": {"_id": {"$substrCP": ["$created_at", 0, 13]}, "n": {"$sum": 1}}}],
+        }}
+    ]).to_list(1)
+    facets = result[0]
+
+    counters = {
+        "_id": COUNTERS_ID,
+        "total": facets["total"][0]["n"] if facets["total"] else 0,
+    }
+    for field in ("danger", "status", "region", "hour"):
+        counters[field] = {str(bucket["_id"]): bucket["n"] for bucket in facets[field] if bucket["_id"] is not None}
+
+    await db.stats.replace_one({"_id": COUNTERS_ID}, counters, upsert=True)
+    logger.info(f"Rebuilt SOS counters: {counters['total']} signals")
+    return counters
+
+
+async def ensure_counters(db) -> None:
+    # Increments never upsert, so the document must exist before signals are written
+    if not await db.stats.find_one({"_id": COUNTERS_ID}, {"_id": 1}):
+        await rebuild_counters(db)
+
+
+async def get_counters(db, breakdowns: bool = False) -> dict:
+    """The counters; the region and hour maps grow with every new cell and hour, so only with `breakdowns`."""
+    counters = await db.stats.find_one({"_id": COUNTERS_ID}, None if breakdowns else BREAKDOWN_PROJECTION)
+    if not counters:
+        counters = await rebuild_counters(db)
+        if not breakdowns:
+            for field in BREAKDOWN_PROJECTION:
+                counters.pop(field)
+    return counters
@@ -0,0 +1,223 @@
+"""Clustered map tiles built from the geohash stored on each signal.
+
+A tile counts the signals inside one Web Mercator tile, grouped by a geohash
+prefix whose length follows the zoom level, with per-danger-level and
+per-status counts and the centroid of each cluster. Built tiles are kept in
+an LRU cache that drops every tile containing a signal when the signal is
+created, re-triaged, changes status or is archived. A tile built while one
+of its signals changed is not stored; other tiles are unaffected, so the
+cache keeps filling under a steady write load. The cache learns about those writes
+from the event bus, so with EVENT_BUS=changestream each worker also sees
+writes made by the others.
+"""
+import asyncio
+import logging
+
+from cachetools import TTLCache
+from pymongo import UpdateOne
+
+from events import EventBus, consume, SIGNAL_ARCHIVED, SIGNAL_CREATED, SIGNAL_STATUS_CHANGED, SIGNAL_TRIAGED
+from geo import geohash_encode, geohash_query, tile_bbox, tile_for
+
+logger = logging.getLogger(__name__)
+
+MAX_ZOOM = 20
+MAX_CLUSTER_PRECISION = 8
+MAX_CLUSTER_TILES = 64
+BACKFILL_BATCH = 1000
+
+SIGNAL_EVENTS = {SIGNAL_CREATED, SIGNAL_STATUS_CHANGED, SIGNAL_TRIAGED, SIGNAL_ARCHIVED}
+WORLD = (-180.0, -90.0, 180.0, 90.0)
+
+
+def cluster_precision(z: int) -> int:
+    """Geohash length to group by at zoom `z`: a few cells to a few dozen per tile side."""
+    return max(1, min(MAX_CLUSTER_PRECISION, (z + 1) // 2))
+
+
+def tile_query(bbox: tuple) -> dict:
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return {
+        **geohash_query(bbox),
+        # Exact bounds, so a signal near an edge is counted in one tile only
+        "latitude": {"$gte": min_lat, "$lt": max_lat},
+        "longitude": {"$gte": min_lon, "$lt": max_lon},
+    }
+
+
+def _add_counts(target: dict, source: dict) -> None:
+    for key, count in source.items():
+        target[key] = target.get(key, 0) + count
+
+
+def _merge_cells(cells) -> dict:
+    """Sum cells with the same geohash; centroids are weighted by count."""
+    merged = {}
+    for cell in cells:
+        current = merged.get(cell["geohash"])
+        if current is None:
+            merged[cell["geohash"]] = {**cell, "danger": dict(cell["danger"]), "status": dict(cell["status"])}
+            continue
+        total = current["count"] + cell["count"]
+        current["latitude"] = (current["latitude"] * current["count"] + cell["latitude"] * cell["count"]) / total
+        current["longitude"] = (current["longitude"] * current["count"] + cell["longitude"] * cell["count"]) / total
+        current["count"] = total
+        _add_counts(current["danger"], cell["danger"])
+        _add_counts(current["status"], cell["status"])
+    return merged
+
+
+def _summary(cells: list) -> dict:
+    danger, status = {}, {}
+    for cell in cells:
+        _add_counts(danger, cell["danger"])
+        _add_counts(status, cell["status"])
+    return {"count": sum(cell["count"] for cell in cells), "danger": danger, "status": status}
+
+
+async def build_tile(db, z: int, x: int, y: int) -> dict:
+    precision = cluster_precision(z)
+    groups = db.sos_signals.aggregate([
+        {"$match": tile_query(tile_bbox(z, x, y))},
+        {"$group": {
+            "_id": {
+                "cell": {"$substrCP": ["$geohash", 0, precision]},
+                "danger": "$danger_level",
+                "status": "$status",
+            },
+            "count": {"$sum": 1},
+            "latitude": {"$avg": "$latitude"},
+            "longitude": {"$avg": "$longitude"},
+        }},
+    ])
+    # One group per (cell, danger, status); fold them into one entry per cell
+    parts = []
+    async for group in groups:
+        key = group["_id"]
+        parts.append({
+            "geohash": key["cell"],
+            "count": group["count"],
+            "latitude": group["latitude"],
+            "longitude": group["longitude"],
+            "danger": {key["danger"]: group["count"]},
+            "status": {key["status"]: group["count"]},
+        })
+    cells = sorted(_merge_cells(parts).values(), key=lambda cell: cell["geohash"])
+    return {"z": z, "x": x, "y": y, "precision": precision, **_summary(cells), "cells": cells}
+
+
+async def backfill_geohashes(db) -> int:
+    """Store the geohash on signals created before it existed."""
+    updated = 0
+    while True:
+        signals = await db.sos_signals.find(
+            {"geohash": {"$exists": False}},
+            {"_id": 1, "latitude": 1, "longitude": 1}
+        ).limit(BACKFILL_BATCH).to_list(BACKFILL_BATCH)
+        if not signals:
+            break
+        await db.sos_signals.bulk_write([
+            UpdateOne({"_id": signal["_id"]}, {"$set": {"geohash": geohash_encode(signal["latitude"], signal["longitude"])}})
+            for signal in signals
+        ], ordered=False)
+        updated += len(signals)
+    if updated:
+        logger.info(f"Backfilled geohash on {updated} signals")
+    return updated
+
+
+class TileCache:
+    def __init__(self, db, bus: EventBus, maxsize: int = 4096, ttl: float = 300.0):
+        self.db = db
+        self.bus = bus
+        # The TTL only bounds staleness if an invalidation is ever missed
+        self._tiles = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Last invalidation per tile, and of the whole cache; a tile built across one is not stored
+        self._version = 0
+        self._invalidated = TTLCache(maxsize=100000, ttl=60)
+        self._cleared = 0
+        self._subscription = None
+        self._task = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def get(self, z: int, x: int, y: int) -> dict:
+        key = (z, x, y)
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self.hits += 1
+            return tile
+        self.misses += 1
+        version = (self._cleared, self._invalidated.get(key))
+        tile = await build_tile(self.db, z, x, y)
+        # A signal in this tile may have changed while it was being built
+        if version == (self._cleared, self._invalidated.get(key)):
+            self._tiles[key] = tile
+        return tile
+
+    async def clusters(self, bbox: tuple, zoom: int) -> dict:
+        """Clusters inside an arbitrary bbox, assembled from the cached tiles that cover it."""
+        min_lon, min_lat, max_lon, max_lat = bbox
+        min_x, min_y = tile_for(max_lat, min_lon, zoom)
+        max_x, max_y = tile_for(min_lat, max_lon, zoom)
+        count = (max_x - min_x + 1) * (max_y - min_y + 1)
+        if count > MAX_CLUSTER_TILES:
+            raise ValueError(f"bbox spans {count} tiles at zoom {zoom}; zoom out or shrink it")
+
+        tiles = await asyncio.gather(*(
+            self.get(zoom, x, y)
+            for x in range(min_x, max_x + 1)
+            for y in range(min_y, max_y + 1)
+        ))
+        # Cells cut by a tile edge appear in both tiles and are merged back together
+        merged = _merge_cells(cell for tile in tiles for cell in tile["cells"])
+        cells = sorted(
+            (
+                cell for cell in merged.values()
+                if min_lon <= cell["longitude"] <= max_lon and min_lat <= cell["latitude"] <= max_lat
+            ),
+            key=lambda cell: cell["geohash"]
+        )
+        return {"zoom": zoom, "precision": cluster_precision(zoom), **_summary(cells), "cells": cells}
+
+    def invalidate_point(self, latitude: float, longitude: float) -> None:
+        self._version += 1
+        self.invalidations += 1
+        for z in range(MAX_ZOOM + 1):
+            key = (z, *tile_for(latitude, longitude, z))
+            self._invalidated[key] = self._version
+            self._tiles.pop(key, None)
+
+    def clear(self) -> None:
+        self._cleared += 1
+        self._tiles.clear()
+
+    def start(self) -> None:
+        self._subscription = self.bus.subscribe()
+        self._subscription.bbox = WORLD
+        self._task = asyncio.create_task(consume(self._subscription, self._on_event, self._on_lost))
+
+    async def stop(self) -> None:
+        if self._subscription:
+            self.bus.unsubscribe(self._subscription)
+            self._subscription = None
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _on_event(self, event: dict) -> None:
+        if event["type"] in SIGNAL_EVENTS and event.get("latitude") is not None:
+            self.invalidate_point(event["latitude"], event["longitude"])
+
+    async def _on_lost(self) -> None:
+        self.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._tiles),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,304 @@
+"""Time-series storage, downsampling and retention for rescue tracks.
+
+Raw GPS points live in the `rescue_locations` time-series collection
+(timeField `timestamp`, metaField `meta` = {team_id, signal_id}) and expire
+after the configured retention. Before they expire, TrackDownsampler folds
+them into one `rescue_mission_tracks` document per (signal, team): a
+Douglas-Peucker simplified point list plus its encoded polyline. Storage and
+query cost therefore stay flat over a long response.
+
+Folding goes by ingest time (`ingested_at`), not by the device timestamp, so
+points an offline phone uploads hours late are still folded into their
+mission, in timestamp order. A run records its cutoff in `jobs_state` before
+folding and each mission records the window it last absorbed, so a run that
+failed part way is retried with the same cutoff and folds no point twice.
+
+A plain `rescue_locations` collection from before the time-series layout is
+renamed and copied over in the background; its progress is kept in
+`jobs_state`, so a restart resumes the copy instead of starting over.
+"""
+import asyncio
+import logging
+import math
+from datetime import datetime, timezone, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import CollectionInvalid, DuplicateKeyError, OperationFailure
+
+from geo import EARTH_RADIUS_M
+from jobs import LeasedJob
+
+logger = logging.getLogger(__name__)
+
+TRACK_COLLECTION = "rescue_locations"
+LEGACY_COLLECTION = "rescue_locations_legacy"
+MIGRATION_BATCH = 1000
+MIGRATION_STATE_ID = "rescue_locations_migration"
+MIGRATION_LEASE = timedelta(minutes=5)
+
+# Keeps the fire-and-forget migration task referenced until it finishes
+_background_tasks = set()
+
+
+def to_series_document(location: dict) -> dict:
+    return {
+        "timestamp": datetime.fromisoformat(location["timestamp"]),
+        "meta": {"team_id": location["team_id"], "signal_id": location["signal_id"]},
+        "id": location["id"],
+        "latitude": location["latitude"],
+        "longitude": location["longitude"],
+        "ingested_at": datetime.now(timezone.utc),
+    }
+
+
+def from_series_document(doc: dict) -> dict:
+    timestamp = doc["timestamp"]
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return {
+        "id": doc["id"],
+        "signal_id": doc["meta"]["signal_id"],
+        "team_id": doc["meta"]["team_id"],
+        "latitude": doc["latitude"],
+        "longitude": doc["longitude"],
+        "timestamp": timestamp.isoformat(),
+    }
+
+
+async def ensure_track_collection(db, retention_seconds: int) -> None:
+    """Create the time-series collection, migrating a plain legacy collection if one exists."""
+    info = await db.list_collections(filter={"name": TRACK_COLLECTION}).to_list(1)
+    if info and info[0].get("type") == "timeseries":
+        if info[0].get("options", {}).get("expireAfterSeconds") != retention_seconds:
+            await db.command("collMod", TRACK_COLLECTION, expireAfterSeconds=retention_seconds)
+    else:
+        if info:
+            try:
+                await db[TRACK_COLLECTION].rename(LEGACY_COLLECTION)
+            except OperationFailure as e:
+                # Another worker renamed it first
+                logger.info(f"Skipping rescue_locations rename: {e}")
+
+        try:
+            await db.create_collection(
+                TRACK_COLLECTION,
+                timeseries={"timeField": "timestamp", "metaField": "meta", "granularity": "seconds"},
+                expireAfterSeconds=retention_seconds,
+            )
+            logger.info(f"Created time-series collection {TRACK_COLLECTION}")
+        except CollectionInvalid:
+            pass
+
+    # Also resumes a copy that an earlier process did not finish
+    if await db.list_collections(filter={"name": LEGACY_COLLECTION}).to_list(1):
+        state = await db.jobs_state.find_one({"_id": MIGRATION_STATE_ID}, {"done": 1})
+        if not (state and state.get("done")):
+            task = asyncio.create_task(migrate_legacy_locations(db))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+
+
+async def _claim_migration(db, now: datetime):
+    """Lease the copy so only one worker runs it; None if another worker holds it or it is done."""
+    try:
+        return await db.jobs_state.find_one_and_update(
+            {
+                "_id": MIGRATION_STATE_ID,
+                "done": {"$ne": True},
+                "$or": [{"lease_until": {"$lt": now}}, {"lease_until": {"$exists": False}}],
+            },
+            {"$set": {"lease_until": now + MIGRATION_LEASE}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except OperationFailure:
+        return None
+
+
+async def _without_copied(db, batch: list) -> list:
+    """Drop points a previous run already copied before it could record its progress."""
+    timestamps = [doc["timestamp"] for doc in batch]
+    copied = await db[TRACK_COLLECTION].distinct("id", {
+        "timestamp": {"$gte": min(timestamps), "$lte": max(timestamps)},
+        "id": {"$in": [doc["id"] for doc in batch]},
+    })
+    copied = set(copied)
+    return [doc for doc in batch if doc["id"] not in copied]
+
+
+async def migrate_legacy_locations(db) -> None:
+    state = await _claim_migration(db, datetime.now(timezone.utc))
+    if state is None:
+        return
+
+    query = {"_id": {"$gt": state["last_id"]}} if state.get("last_id") is not None else {}
+    cursor = db[LEGACY_COLLECTION].find(query).sort("_id", 1).batch_size(MIGRATION_BATCH)
+    migrated = 0
+    first = True
+    batch = []
+
+    async def copy(docs: list) -> None:
+        nonlocal first, migrated
+        series = [to_series_document(doc) for doc in docs]
+        if first:
+            # The batch after the last recorded one may have been written already
+            series = await _without_copied(db, series)
+            first = False
+        if series:
+            await db[TRACK_COLLECTION].insert_many(series, ordered=False)
+        migrated += len(series)
+        await db.jobs_state.update_one(
+            {"_id": MIGRATION_STATE_ID},
+            {
+                "$set": {"last_id": docs[-1]["_id"], "lease_until": datetime.now(timezone.utc) + MIGRATION_LEASE},
+                "$inc": {"migrated": len(series)},
+            },
+        )
+
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= MIGRATION_BATCH:
+            await copy(batch)
+            batch = []
+    if batch:
+        await copy(batch)
+
+    await db.jobs_state.update_one({"_id": MIGRATION_STATE_ID}, {"$set": {"done": True}, "$unset": {"lease_until": ""}})
+    logger.info(f"Migrated {migrated} rescue locations into the time-series collection; "
+                f"{LEGACY_COLLECTION} can be dropped")
+
+
+def _to_xy(lat: float, lon: float, lat0: float) -> tuple:
+    """Equirectangular projection in meters; accurate enough at mission scale."""
+    return (
+        math.radians(lon) * math.cos(math.radians(lat0)) * EARTH_RADIUS_M,
+        math.radians(lat) * EARTH_RADIUS_M,
+    )
+
+
+def _segment_distance(p: tuple, a: tuple, b: tuple) -> float:
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    if dx == 0 and dy == 0:
+        return math.hypot(p[0] - a[0], p[1] - a[1])
+    t = max(0.0, min(1.0, ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / (dx * dx + dy * dy)))
+    return math.hypot(p[0] - (a[0] + t * dx), p[1] - (a[1] + t * dy))
+
+
+def simplify(points: list, tolerance_m: float) -> list:
+    """Douglas-Peucker over `[lat, lon, ...]` points, keeping the endpoints."""
+    if len(points) < 3:
+        return list(points)
+    lat0 = points[0][0]
+    xy = [_to_xy(p[0], p[1], lat0) for p in points]
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        index, max_distance = 0, 0.0
+        for i in range(start + 1, end):
+            distance = _segment_distance(xy[i], xy[start], xy[end])
+            if distance > max_distance:
+                index, max_distance = i, distance
+        if max_distance > tolerance_m:
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return [p for p, kept in zip(points, keep) if kept]
+
+
+def encode_polyline(points: list) -> str:
+    """Encoded polyline (precision 5) of `[lat, lon, ...]` points."""
+    result = []
+    prev_lat = prev_lon = 0
+    for p in points:
+        lat, lon = round(p[0] * 1e5), round(p[1] * 1e5)
+        for delta in (lat - prev_lat, lon - prev_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                result.append(chr((0x20 | (value & 0x1F)) + 63))
+                value >>= 5
+            result.append(chr(value + 63))
+        prev_lat, prev_lon = lat, lon
+    return "".join(result)
+
+
+class TrackDownsampler(LeasedJob):
+    STATE_ID = "track_downsampler"
+    DESCRIPTION = "Track downsampling"
+
+    def __init__(self, db, downsample_after: timedelta, interval: float = 600.0, tolerance_m: float = 15.0):
+        super().__init__(db, interval)
+        self.downsample_after = downsample_after
+        self.tolerance_m = tolerance_m
+
+    async def run_once(self) -> int:
+        now = datetime.now(timezone.utc)
+        state = await self._acquire(now)
+        if state is None:
+            return 0
+
+        folded_until = state.get("folded_until") or datetime(1970, 1, 1, tzinfo=timezone.utc)
+        cutoff = state.get("folding_until")
+        if cutoff is None:
+            # Whole milliseconds, as MongoDB stores it, so a retry compares equal to the missions it folded
+            cutoff = now - self.downsample_after
+            cutoff = cutoff.replace(microsecond=cutoff.microsecond // 1000 * 1000)
+            await self.db.jobs_state.update_one({"_id": self.STATE_ID}, {"$set": {"folding_until": cutoff}})
+        elif cutoff.tzinfo is None:
+            cutoff = cutoff.replace(tzinfo=timezone.utc)
+        window = {"$gt": folded_until, "$lte": cutoff}
+        missions = self.db[TRACK_COLLECTION].aggregate([
+            {"$match": {"$or": [
+                {"ingested_at": window},
+                # Points stored before ingest times were recorded
+                {"ingested_at": {"$exists": False}, "timestamp": window},
+            ]}},
+            {"$sort": {"timestamp": 1}},
+            {"$group": {
+                "_id": "$meta",
+                "points": {"$push": {"lat": "$latitude", "lon": "$longitude", "t": "$timestamp"}},
+            }},
+        ], allowDiskUse=True)
+
+        folded = 0
+        async for mission in missions:
+            points = [[p["lat"], p["lon"], p["t"]] for p in mission["points"]]
+            if await self._fold(mission["_id"], points, cutoff):
+                folded += 1
+
+        await self.db.jobs_state.update_one(
+            {"_id": self.STATE_ID}, {"$set": {"folded_until": cutoff}, "$unset": {"folding_until": ""}}
+        )
+        if folded:
+            logger.info(f"Downsampled rescue tracks for {folded} missions up to {cutoff.isoformat()}")
+        return folded
+
+    async def _fold(self, meta: dict, points: list, cutoff: datetime) -> bool:
+        """Add one window's points to the mission; False if that window was folded already."""
+        simplified = simplify(points, self.tolerance_m)
+        mission_id = f"{meta['signal_id']}:{meta['team_id']}"
+        try:
+            mission = await self.db.rescue_mission_tracks.find_one_and_update(
+                {"_id": mission_id, "$or": [{"folded_until": {"$lt": cutoff}}, {"folded_until": {"$exists": False}}]},
+                {
+                    "$setOnInsert": {"signal_id": meta["signal_id"], "team_id": meta["team_id"]},
+                    "$push": {"points": {"$each": simplified}},
+                    "$inc": {"raw_point_count": len(points)},
+                    "$min": {"started_at": points[0][2]},
+                    "$max": {"ended_at": points[-1][2]},
+                    "$set": {"folded_until": cutoff},
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # The mission exists and has absorbed this window already
+            return False
+        # Late points belong earlier in the track
+        track = sorted(mission["points"], key=lambda p: p[2])
+        await self.db.rescue_mission_tracks.update_one(
+            {"_id": mission_id},
+            {"$set": {"points": track, "polyline": encode_polyline(track), "point_count": len(track)}},
+        )
+        return True
@@ -0,0 +1,220 @@
+"""Keyword triage for SOS descriptions.
+
+Descriptions are normalized (lower-cased, Vietnamese diacritics folded, so
+"kẹt", "ket" and "KẸT" are the same term) and scanned once by a single
+compiled alternation of every rule term. Each distinct matched term adds its
+weight to the score, and the score maps to a danger level through
+configurable thresholds. Negative weights let terms such as "an toàn"
+(safe) pull a report down.
+
+Rules can be hot-reloaded from a JSON file or a MongoDB collection:
+
+    {"thresholds": {"red": 3, "yellow": 0},
+     "rules": [{"term": "chay nha", "weight": 4}, ...]}
+"""
+import json
+import logging
+import os
+import re
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLDS = {"red": 3.0, "yellow": 0.0}
+
+DEFAULT_RULES = [
+    # Vietnamese. Folding diacritics makes bare "cháy" (fire) collide with "chạy" (run),
+    # so fire is matched through phrases
+    {"term": "cháy nhà", "weight": 4},
+    {"term": "đám cháy", "weight": 4},
+    {"term": "bốc cháy", "weight": 4},
+    {"term": "hỏa hoạn", "weight": 3},
+    {"term": "nguy hiểm", "weight": 2},
+    {"term": "kêu cứu", "weight": 3},
+    {"term": "cứu", "weight": 1},
+    {"term": "khẩn cấp", "weight": 2},
+    {"term": "tai nạn", "weight": 2},
+    # Not bare "kẹt", which also matches "kẹt xe" (traffic jam)
+    {"term": "mắc kẹt", "weight": 3},
+    {"term": "bị thương", "weight": 3},
+    {"term": "chảy máu", "weight": 3},
+    {"term": "bất tỉnh", "weight": 4},
+    {"term": "ngạt", "weight": 3},
+    {"term": "đuối nước", "weight": 4},
+    {"term": "nước dâng", "weight": 2},
+    {"term": "ngập", "weight": 1},
+    {"term": "lũ", "weight": 1},
+    {"term": "sạt lở", "weight": 3},
+    {"term": "nhà sập", "weight": 3},
+    {"term": "bị sập", "weight": 3},
+    {"term": "trẻ em", "weight": 1},
+    {"term": "người già", "weight": 1},
+    {"term": "mang thai", "weight": 1},
+    {"term": "an toàn", "weight": -2},
+    # English
+    {"term": "fire", "weight": 3},
+    {"term": "burn", "weight": 3},
+    {"term": "accident", "weight": 2},
+    {"term": "blood", "weight": 3},
+    {"term": "injured", "weight": 3},
+    {"term": "trapped", "weight": 3},
+    {"term": "emergency", "weight": 2},
+    {"term": "unconscious", "weight": 4},
+    {"term": "drowning", "weight": 4},
+    {"term": "collapsed", "weight": 3},
+    {"term": "flood", "weight": 1},
+    {"term": "safe", "weight": -2},
+]
+
+def _build_fold_table() -> dict:
+    """Map every precomposed Latin letter to its base letter, and drop combining marks."""
+    table = {ord("đ"): "d", ord("Đ"): "d"}
+    for codepoint in range(0x00C0, 0x1F00):
+        decomposed = unicodedata.normalize("NFD", chr(codepoint))
+        base = _COMBINING_MARKS.sub("", decomposed)
+        if base != decomposed and base.isascii():
+            table[codepoint] = base
+    for codepoint in range(0x0300, 0x0370):
+        table[codepoint] = None
+    return table
+
+
+# Vietnamese tone and vowel marks all decompose into this combining block
+_COMBINING_MARKS = re.compile("[\u0300-\u036f]+")
+_NON_WORD = re.compile(r"[^\w]+")
+_FOLD_TABLE = _build_fold_table()
+# Folded form of each whitespace-separated token; descriptions reuse a small vocabulary
+_FOLDED_TOKENS = {}
+FOLD_CACHE_SIZE = 50000
+
+
+def _fold_token(token: str) -> str:
+    folded = _NON_WORD.sub(" ", token.translate(_FOLD_TABLE)).strip()
+    if len(_FOLDED_TOKENS) >= FOLD_CACHE_SIZE:
+        _FOLDED_TOKENS.clear()
+    _FOLDED_TOKENS[token] = folded
+    return folded
+
+
+def normalize(text: str) -> str:
+    """Lower-case, fold Vietnamese diacritics and collapse punctuation to single spaces."""
+    # Whitespace is never a word character, so folding token by token gives the same result
+    # as folding the whole text, and each distinct token is translated only once
+    words = []
+    for token in text.lower().split():
+        folded = _FOLDED_TOKENS.get(token)
+        if folded is None:
+            folded = _fold_token(token)
+        if folded:
+            words.append(folded)
+    return " ".join(words)
+
+
+@dataclass
+class TriageResult:
+    score: float
+    danger_level: str
+    matched: list = field(default_factory=list)
+
+    @property
+    def assessment(self) -> str:
+        if not self.matched:
+            return "Keyword triage: no danger keywords found."
+        return f"Keyword triage score {self.score:g}, matched: {', '.join(self.matched)}."
+
+
+class TriageEngine:
+    def __init__(self, rules: list, thresholds: Optional[dict] = None):
+        self.thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+        self.weights = {}
+        for rule in rules:
+            term = normalize(rule["term"])
+            if term:
+                self.weights[term] = float(rule["weight"])
+        # Longest terms first so a phrase wins over a shorter term it starts with
+        terms = sorted(self.weights, key=len, reverse=True)
+        alternation = "|".join(re.escape(term) for term in terms) or r"(?!x)x"
+        # Normalized text separates words by single spaces, so a space or either end bounds a term;
+        # that is cheaper for the regex engine than a \w lookaround at every position
+        self.pattern = re.compile(rf"(?<![^ ])(?:{alternation})(?![^ ])")
+
+    @classmethod
+    def from_config(cls, config: dict) -> "TriageEngine":
+        return cls(config["rules"], config.get("thresholds"))
+
+    def analyze(self, description: str) -> TriageResult:
+        matched = list(dict.fromkeys(m.group(0) for m in self.pattern.finditer(normalize(description))))
+        score = sum(self.weights[term] for term in matched)
+        if score >= self.thresholds["red"]:
+            level = "red"
+        elif score >= self.thresholds["yellow"]:
+            level = "yellow"
+        else:
+            level = "green"
+        return TriageResult(score=score, danger_level=level, matched=matched)
+
+
+def file_loader(path: str) -> Callable[[], Awaitable[Optional[dict]]]:
+    """Load rules from a JSON file whenever its modification time changes."""
+    last_mtime = None
+
+    async def load() -> Optional[dict]:
+        nonlocal last_mtime
+        mtime = os.stat(path).st_mtime
+        if mtime == last_mtime:
+            return None
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        last_mtime = mtime
+        return config
+
+    return load
+
+
+def collection_loader(collection) -> Callable[[], Awaitable[Optional[dict]]]:
+    """Load rules from documents `{term, weight}` plus an optional `{_id: "thresholds", ...}`."""
+    last_fingerprint = None
+
+    async def load() -> Optional[dict]:
+        nonlocal last_fingerprint
+        docs = await collection.find({}, {"_id": 1, "term": 1, "weight": 1, "red": 1, "yellow": 1}).to_list(None)
+        fingerprint = repr(sorted(docs, key=lambda doc: str(doc["_id"])))
+        if fingerprint == last_fingerprint:
+            return None
+        last_fingerprint = fingerprint
+        thresholds = next((doc for doc in docs if doc["_id"] == "thresholds"), {})
+        return {
+            "rules": [doc for doc in docs if "term" in doc],
+            "thresholds": {k: thresholds[k] for k in ("red", "yellow") if k in thresholds},
+        }
+
+    return load
+
+
+class ReloadingTriageEngine:
+    """Wraps a TriageEngine and swaps in a new one when the rule source changes."""
+
+    def __init__(self, loader: Optional[Callable[[], Awaitable[Optional[dict]]]] = None, check_interval: float = 30.0):
+        self.engine = TriageEngine(DEFAULT_RULES, DEFAULT_THRESHOLDS)
+        self.loader = loader
+        self.check_interval = check_interval
+        self._next_check = 0.0
+
+    async def reload(self) -> None:
+        try:
+            config = await self.loader()
+            if config is not None and config["rules"]:
+                self.engine = TriageEngine.from_config(config)
+                logger.info(f"Loaded {len(self.engine.weights)} triage rules")
+        except Exception as e:
+            # Keep triaging with the last good rule set
+            logger.error(f"Failed to reload triage rules: {e}")
+
+    async def analyze(self, description: str) -> TriageResult:
+        if self.loader and time.monotonic() >= self._next_check:
+            self._next_check = time.monotonic() + self.check_interval
+            await self.reload()
+        return self.engine.analyze(description)
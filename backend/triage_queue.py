@@ -0,0 +1,149 @@
+"""Durable background queue for SOS danger analysis.
+
+`create_sos_signal` stores the signal with a provisional danger level and
+enqueues a job here. A fixed pool of asyncio workers claims jobs from the
+`triage_jobs` collection, runs the analyzer under a timeout and retries with
+exponential backoff. Jobs are leased, so if a worker dies mid-job another
+worker picks the job up once the lease expires.
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Optional
+
+from pymongo import ReturnDocument
+
+from triage import TriageResult
+
+logger = logging.getLogger(__name__)
+
+
+class TriageQueue:
+    def __init__(
+        self,
+        db,
+        analyze: Callable[[dict], Awaitable[TriageResult]],
+        on_complete: Callable[[str, TriageResult], Awaitable[None]],
+        on_failed: Callable[[str, str], Awaitable[None]],
+        workers: int = 4,
+        timeout: float = 10.0,
+        max_attempts: int = 5,
+        poll_interval: float = 2.0,
+        lease_seconds: int = 60,
+    ):
+        self.jobs = db.triage_jobs
+        self.analyze = analyze
+        self.on_complete = on_complete
+        self.on_failed = on_failed
+        self.workers = workers
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.lease = timedelta(seconds=lease_seconds)
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+        self._stopping = False
+
+    async def enqueue(self, signal_id: str, description: str, image_hashes: list) -> None:
+        now = datetime.now(timezone.utc)
+        await self.jobs.update_one(
+            {"_id": signal_id},
+            {"$setOnInsert": {
+                "description": description,
+                "image_hashes": image_hashes,
+                "status": "queued",
+                "attempts": 0,
+                "run_at": now,
+                "created_at": now,
+            }},
+            upsert=True,
+        )
+        self._wakeup.set()
+
+    async def cancel(self, signal_id: str) -> None:
+        """Drop a job that has not been claimed yet, e.g. for a signal that was never stored."""
+        await self.jobs.delete_one({"_id": signal_id, "status": "queued"})
+
+    def start(self) -> None:
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        # On Python < 3.12, wait_for() drops a cancellation that races with the wakeup
+        # event; the flag makes sure such a worker still exits on its next loop
+        self._stopping = True
+        self._wakeup.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def backlog(self) -> int:
+        return await self.jobs.count_documents({"status": {"$in": ["queued", "running"]}})
+
+    async def _claim(self) -> Optional[dict]:
+        """Lease the oldest due job, or one whose worker's lease ran out; None if there is none."""
+        now = datetime.now(timezone.utc)
+        return await self.jobs.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "run_at": {"$lte": now}},
+                {"status": "running", "lease_until": {"$lt": now}},
+            ]},
+            {"$set": {"status": "running", "lease_until": now + self.lease}, "$inc": {"attempts": 1}},
+            sort=[("run_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _worker(self) -> None:
+        while not self._stopping:
+            try:
+                job = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Triage queue claim failed: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The lease expires and another worker retries the job
+                logger.error(f"Triage queue failed to record result for signal {job['_id']}: {e}")
+
+    async def _process(self, job: dict) -> None:
+        signal_id = job["_id"]
+        try:
+            result = await asyncio.wait_for(self.analyze(job), self.timeout)
+            await self.on_complete(signal_id, result)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = "analysis timed out" if isinstance(e, asyncio.TimeoutError) else str(e)
+            await self._retry_or_fail(job, error)
+            return
+        await self.jobs.delete_one({"_id": signal_id})
+
+    async def _retry_or_fail(self, job: dict, error: str) -> None:
+        signal_id = job["_id"]
+        if job["attempts"] >= self.max_attempts:
+            logger.error(f"Triage for signal {signal_id} failed after {job['attempts']} attempts: {error}")
+            await self.jobs.update_one({"_id": signal_id}, {"$set": {"status": "failed", "last_error": error}})
+            await self.on_failed(signal_id, error)
+            return
+
+        delay = timedelta(seconds=2 ** job["attempts"])
+        logger.warning(f"Triage for signal {signal_id} failed (attempt {job['attempts']}), retrying in {delay}: {error}")
+        await self.jobs.update_one(
+            {"_id": signal_id},
+            {"$set": {"status": "queued", "run_at": datetime.now(timezone.utc) + delay, "last_error": error}},
+        )
@@ -0,0 +1,152 @@
+"""Size-limited request bodies and streaming multipart parsing.
+
+MaxBodySizeMiddleware bounds every request body: it answers 413 straight
+from Content-Length when the client declares one, and otherwise as soon as
+the streamed body crosses the limit, so an oversized upload is never
+buffered in full.
+
+MultipartUpload feeds the request stream through python-multipart and keeps
+at most one file part in memory. Each file is handed to a callback as soon
+as its part ends, so it can be re-encoded and stored before the next one
+arrives, and a part that grows past the per-file limit fails the request
+right away.
+"""
+from typing import AsyncIterator, Awaitable, Callable, Dict
+
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class UploadError(ValueError):
+    pass
+
+
+class UploadTooLarge(UploadError):
+    pass
+
+
+class MaxBodySizeMiddleware:
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        declared = dict(scope["headers"]).get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > self.max_bytes:
+            response = JSONResponse({"detail": "Request body too large"}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # FastAPI re-raises HTTPExceptions from body reading, so this becomes a 413
+                    raise HTTPException(status_code=413, detail="Request body too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class MultipartUpload:
+    def __init__(
+        self,
+        content_type: str,
+        on_file: Callable[[str, bytes], Awaitable[None]],
+        max_file_bytes: int,
+        max_files: int,
+        max_field_bytes: int = MAX_FIELD_BYTES,
+    ):
+        media_type, options = parse_options_header(content_type)
+        if media_type != b"multipart/form-data" or not options.get(b"boundary"):
+            raise UploadError("Expected a multipart/form-data body")
+        self.on_file = on_file
+        self.max_file_bytes = max_file_bytes
+        self.max_files = max_files
+        self.max_field_bytes = max_field_bytes
+        self.fields: Dict[str, str] = {}
+        self._files = 0
+        # Files whose part has ended and that still have to go through on_file
+        self._ready = []
+        self._header_field = b""
+        self._header_value = b""
+        self._headers = {}
+        self._part = None
+        self._parser = MultipartParser(options[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+        })
+
+    async def parse(self, stream: AsyncIterator[bytes]) -> Dict[str, str]:
+        """Consume the body, passing files to `on_file` as they complete; returns the text fields."""
+        try:
+            async for chunk in stream:
+                self._parser.write(chunk)
+                while self._ready:
+                    name, data = self._ready.pop(0)
+                    await self.on_file(name, data)
+            self._parser.finalize()
+        except MultipartParseError as e:
+            raise UploadError(f"Malformed multipart body: {e}") from e
+        if self._part is not None:
+            raise UploadError("Truncated multipart body")
+        return self.fields
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if b"name" not in options:
+            raise UploadError("Multipart part without a field name")
+        is_file = b"filename" in options
+        if is_file:
+            self._files += 1
+            if self._files > self.max_files:
+                raise UploadTooLarge(f"At most {self.max_files} files per request")
+        self._part = {
+            "name": options[b"name"].decode("utf-8", "replace"),
+            "is_file": is_file,
+            "data": bytearray(),
+        }
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        part = self._part
+        part["data"] += data[start:end]
+        limit = self.max_file_bytes if part["is_file"] else self.max_field_bytes
+        if len(part["data"]) > limit:
+            raise UploadTooLarge(f"Part '{part['name']}' exceeds {limit} bytes")
+
+    def _on_part_end(self) -> None:
+        part, self._part = self._part, None
+        if part["is_file"]:
+            self._ready.append((part["name"], bytes(part["data"])))
+        else:
+            self.fields[part["name"]] = part["data"].decode("utf-8", "replace")
@@ -0,0 +1,52 @@
+// Must match MAX_IMAGE_DIMENSION in backend/blob_store.py: WebP images within
+// this bound are stored as sent, anything else is re-encoded by the server.
+export const MAX_IMAGE_DIMENSION = 1600;
+const WEBP_QUALITY = 0.8;
+
+function loadImage(file) {
+  if (window.createImageBitmap) {
+    return createImageBitmap(file, { imageOrientation: 'from-image' });
+  }
+  return new Promise((resolve, reject) => {
+    const url = URL.createObjectURL(file);
+    const img = new Image();
+    img.onload = () => {
+      URL.revokeObjectURL(url);
+      resolve(img);
+    };
+    img.onerror = (error) => {
+      URL.revokeObjectURL(url);
+      reject(error);
+    };
+    img.src = url;
+  });
+}
+
+function toBlob(canvas, type, quality) {
+  return new Promise((resolve) => canvas.toBlob(resolve, type, quality));
+}
+
+// Downscale a photo and re-encode it as WebP (JPEG where the browser cannot
+// encode WebP) before upload; phone photos shrink from several MB to ~200 KB.
+// Falls back to the original file if the browser cannot decode it.
+export async function normalizeImage(file) {
+  let img;
+  try {
+    img = await loadImage(file);
+  } catch (error) {
+    return file;
+  }
+
+  const scale = Math.min(1, MAX_IMAGE_DIMENSION / Math.max(img.width, img.height));
+  const canvas = document.createElement('canvas');
+  canvas.width = Math.round(img.width * scale);
+  canvas.height = Math.round(img.height * scale);
+  canvas.getContext('2d').drawImage(img, 0, 0, canvas.width, canvas.height);
+  if (img.close) img.close();
+
+  let blob = await toBlob(canvas, 'image/webp', WEBP_QUALITY);
+  if (!blob || blob.type !== 'image/webp') {
+    blob = await toBlob(canvas, 'image/jpeg', WEBP_QUALITY);
+  }
+  return blob || file;
+}
@@ -11,6 +11,7 @@ const API = `${BACKEND_URL}/api`;
 export default function MapViewPage() {
   const navigate = useNavigate();
   const [signals, setSignals] = useState([]);
+  const [dangerCounts, setDangerCounts] = useState({});
   const [selectedSignal, setSelectedSignal] = useState(null);
   const [loading, setLoading] = useState(true);
 
@@ -20,8 +21,13 @@ export default function MapViewPage() {
 
   const fetchSignals = async () => {
     try {
-      const response = await axios.get(`${API}/sos/signals`);
-      setSignals(response.data);
+      // Latest signals for the list, plus country-wide counts from the cached z0 tile
+      const [page, tile] = await Promise.all([
+        axios.get(`${API}/sos/signals`, { params: { limit: 10 } }),
+        axios.get(`${API}/sos/tiles/0/0/0`)
+      ]);
+      setSignals(page.data.items);
+      setDangerCounts(tile.data.danger);
       setLoading(false);
     } catch (error) {
       console.error('Error fetching signals:', error);
@@ -74,7 +80,7 @@ export default function MapViewPage() {
                 <div className="w-3 h-3 rounded-full bg-red-500"></div>
                 <div>
                   <p className="text-2xl font-bold text-red-700">
-                    {signals.filter(s => s.danger_level === 'red').length}
+                    {dangerCounts.red || 0}
                   </p>
                   <p className="text-sm text-red-600">Nguy hiểm cao</p>
                 </div>
@@ -86,7 +92,7 @@ export default function MapViewPage() {
                 <div className="w-3 h-3 rounded-full bg-yellow-500"></div>
                 <div>
                   <p className="text-2xl font-bold text-yellow-700">
-                    {signals.filter(s => s.danger_level === 'yellow').length}
+                    {dangerCounts.yellow || 0}
                   </p>
                   <p className="text-sm text-yellow-600">Trung bình</p>
                 </div>
@@ -98,7 +104,7 @@ export default function MapViewPage() {
                 <div className="w-3 h-3 rounded-full bg-green-500"></div>
                 <div>
                   <p className="text-2xl font-bold text-green-700">
-                    {signals.filter(s => s.danger_level === 'green').length}
+                    {dangerCounts.green || 0}
                   </p>
                   <p className="text-sm text-green-600">An toàn</p>
                 </div>
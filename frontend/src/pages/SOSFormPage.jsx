@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { Button } from '@/components/ui/button';
 import { Textarea } from '@/components/ui/textarea';
@@ -6,10 +6,16 @@ import { Label } from '@/components/ui/label';
 import { toast } from 'sonner';
 import { ArrowLeft, MapPin, Camera, Send, Loader2 } from 'lucide-react';
 import axios from 'axios';
+import { normalizeImage } from '@/lib/images';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+function newIdempotencyKey() {
+  if (window.crypto?.randomUUID) return window.crypto.randomUUID();
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
 export default function SOSFormPage() {
   const navigate = useNavigate();
   const [loading, setLoading] = useState(false);
@@ -17,6 +23,8 @@ export default function SOSFormPage() {
   const [description, setDescription] = useState('');
   const [images, setImages] = useState([]);
   const [previewUrls, setPreviewUrls] = useState([]);
+  // One key per report, reused when a failed send is retried, so the server never stores it twice
+  const idempotencyKey = useRef(newIdempotencyKey());
 
   useEffect(() => {
     // Get user location
@@ -36,33 +44,21 @@ export default function SOSFormPage() {
     }
   }, []);
 
-  const handleImageChange = (e) => {
+  const handleImageChange = async (e) => {
     const files = Array.from(e.target.files);
     if (files.length + images.length > 3) {
       toast.error('Tối đa 3 ảnh');
       return;
     }
 
-    const newImages = [];
-    const newPreviews = [];
-
-    files.forEach(file => {
-      const reader = new FileReader();
-      reader.onloadend = () => {
-        const base64String = reader.result.split(',')[1];
-        newImages.push(base64String);
-        newPreviews.push(reader.result);
-        
-        if (newImages.length === files.length) {
-          setImages([...images, ...newImages]);
-          setPreviewUrls([...previewUrls, ...newPreviews]);
-        }
-      };
-      reader.readAsDataURL(file);
-    });
+    // Resized here so a slow mobile connection only uploads a few hundred KB per photo
+    const newImages = await Promise.all(files.map(normalizeImage));
+    setImages([...images, ...newImages]);
+    setPreviewUrls([...previewUrls, ...newImages.map((image) => URL.createObjectURL(image))]);
   };
 
   const removeImage = (index) => {
+    URL.revokeObjectURL(previewUrls[index]);
     setImages(images.filter((_, i) => i !== index));
     setPreviewUrls(previewUrls.filter((_, i) => i !== index));
   };
@@ -83,19 +79,26 @@ export default function SOSFormPage() {
     setLoading(true);
 
     try {
-      const response = await axios.post(`${API}/sos/create`, {
-        latitude: location.latitude,
-        longitude: location.longitude,
-        description: description,
-        images_base64: images,
-        user_selected_level: 'medium'
+      const form = new FormData();
+      form.append('latitude', location.latitude);
+      form.append('longitude', location.longitude);
+      form.append('description', description);
+      form.append('user_selected_level', 'medium');
+      images.forEach((image, index) => {
+        const extension = image.type === 'image/webp' ? 'webp' : 'jpg';
+        form.append('images', image, image.name || `photo-${index + 1}.${extension}`);
+      });
+      const response = await axios.post(`${API}/sos/create/upload`, form, {
+        headers: { 'Idempotency-Key': idempotencyKey.current }
       });
 
       toast.success('Đã gửi tín hiệu SOS!');
       navigate(`/track/${response.data.id}`);
     } catch (error) {
       console.error('Error sending SOS:', error);
-      toast.error('Lỗi khi gửi tín hiệu. Vui lòng thử lại.');
+      toast.error(error.response?.status === 413
+        ? 'Ảnh quá lớn. Vui lòng chọn ảnh khác.'
+        : 'Lỗi khi gửi tín hiệu. Vui lòng thử lại.');
     } finally {
       setLoading(false);
     }
@@ -16,8 +16,21 @@ export default function TrackRescuePage() {
 
   useEffect(() => {
     fetchSignal();
-    const interval = setInterval(fetchSignal, 5000); // Poll every 5 seconds
-    return () => clearInterval(interval);
+
+    // Status changes are pushed over the WebSocket; polling only covers a dropped connection
+    const ws = new WebSocket(`${BACKEND_URL.replace(/^http/, 'ws')}/api/ws`);
+    ws.onopen = () => ws.send(JSON.stringify({ action: 'subscribe', signal_ids: [signalId] }));
+    ws.onmessage = (message) => {
+      const event = JSON.parse(message.data);
+      if (event.type === 'signal.status_changed' || event.type === 'signal.triaged') {
+        setSignal((prev) => (prev ? { ...prev, ...event.data } : prev));
+      }
+    };
+    const interval = setInterval(fetchSignal, 30000);
+    return () => {
+      clearInterval(interval);
+      ws.close();
+    };
   }, [signalId]);
 
   const fetchSignal = async () => {
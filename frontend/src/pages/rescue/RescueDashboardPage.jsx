@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { Button } from '@/components/ui/button';
 import { Shield, AlertCircle, Activity, MapPin, LogOut } from 'lucide-react';
@@ -14,6 +14,8 @@ export default function RescueDashboardPage() {
   const [signals, setSignals] = useState([]);
   const [loading, setLoading] = useState(true);
   const [team, setTeam] = useState(null);
+  // Browser position; ranks the queue from where the rescuer is now rather than the last reported fix
+  const position = useRef(null);
 
   useEffect(() => {
     const token = localStorage.getItem('rescue_token');
@@ -29,6 +31,12 @@ export default function RescueDashboardPage() {
       setTeam(JSON.parse(teamData));
     }
 
+    if (navigator.geolocation) {
+      navigator.geolocation.getCurrentPosition((pos) => {
+        position.current = { lat: pos.coords.latitude, lon: pos.coords.longitude };
+      });
+    }
+
     fetchDashboardData();
     const interval = setInterval(fetchDashboardData, 10000);
     return () => clearInterval(interval);
@@ -39,13 +47,13 @@ export default function RescueDashboardPage() {
       const token = localStorage.getItem('rescue_token');
       const headers = { Authorization: `Bearer ${token}` };
 
-      const [statsRes, signalsRes] = await Promise.all([
+      const [statsRes, queueRes] = await Promise.all([
         axios.get(`${API}/rescue/dashboard/stats`, { headers }),
-        axios.get(`${API}/sos/signals?status=pending`, { headers })
+        axios.get(`${API}/rescue/queue`, { headers, params: { limit: 50, ...position.current } })
       ]);
 
       setStats(statsRes.data);
-      setSignals(signalsRes.data);
+      setSignals(queueRes.data.items);
       setLoading(false);
     } catch (error) {
       console.error('Error fetching dashboard:', error);
@@ -197,6 +205,12 @@ export default function RescueDashboardPage() {
                       <div className="flex items-center gap-2 text-xs text-gray-500">
                         <MapPin className="w-3 h-3" />
                         <span>{signal.latitude.toFixed(4)}, {signal.longitude.toFixed(4)}</span>
+                        {signal.distance_m != null && (
+                          <span>· {(signal.distance_m / 1000).toFixed(1)} km</span>
+                        )}
+                        {signal.report_count > 1 && (
+                          <span>· {signal.report_count} báo cáo</span>
+                        )}
                       </div>
                     </div>
                   </div>
@@ -192,17 +192,24 @@ export default function RescueSignalDetailPage() {
               </div>
 
               {/* Images */}
-              {signal.images_base64 && signal.images_base64.length > 0 && (
+              {signal.images && signal.images.length > 0 && (
                 <div>
                   <h3 className="font-semibold text-gray-900 mb-3">Hình ảnh</h3>
                   <div className="grid grid-cols-2 md:grid-cols-3 gap-3">
-                    {signal.images_base64.map((img, index) => (
-                      <img
-                        key={index}
-                        src={`data:image/jpeg;base64,${img}`}
-                        alt={`Evidence ${index + 1}`}
-                        className="w-full h-32 object-cover rounded-lg border border-gray-200"
-                      />
+                    {signal.images.map((img, index) => (
+                      <a
+                        key={img.hash}
+                        href={`${API}/sos/images/${img.hash}`}
+                        target="_blank"
+                        rel="noopener noreferrer"
+                      >
+                        <img
+                          src={`${API}/sos/images/${img.thumbnail_hash}`}
+                          alt={`Evidence ${index + 1}`}
+                          loading="lazy"
+                          className="w-full h-32 object-cover rounded-lg border border-gray-200"
+                        />
+                      </a>
                     ))}
                   </div>
                 </div>
@@ -317,6 +324,9 @@ export default function RescueSignalDetailPage() {
                 <p><span className="font-medium">Mã tín hiệu:</span> {signal.id.slice(0, 8)}</p>
                 <p><span className="font-medium">Thời gian gửi:</span> {new Date(signal.created_at).toLocaleString('vi-VN')}</p>
                 <p><span className="font-medium">Cập nhật:</span> {new Date(signal.updated_at).toLocaleString('vi-VN')}</p>
+                {signal.report_count > 1 && (
+                  <p><span className="font-medium">Số lần báo cáo:</span> {signal.report_count}</p>
+                )}
               </div>
             </div>
           </div>
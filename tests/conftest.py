@@ -0,0 +1,64 @@
+"""Shared fixtures. The backend is a flat module directory, so it goes on the path here.
+
+Tests that need the API import `server` through the `server` fixture, which
+swaps Motor's client for mongomock's in-memory one before the module builds
+its services; no MongoDB server is needed.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db():
+    from mongomock_motor import AsyncMongoMockClient
+
+    return AsyncMongoMockClient()["sos_test"]
+
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    import motor.motor_asyncio
+    from mongomock_motor import AsyncMongoMockClient
+
+    patch = pytest.MonkeyPatch()
+    patch.setenv("MONGO_URL", "mongodb://localhost:27017")
+    patch.setenv("DB_NAME", "sos_test")
+    patch.setenv("BLOB_STORE", "disk")
+    patch.setenv("BLOB_STORE_DIR", str(tmp_path_factory.mktemp("blobs")))
+    patch.setattr(motor.motor_asyncio, "AsyncIOMotorClient", AsyncMongoMockClient)
+    import server
+
+    yield server
+    patch.undo()
+
+
+@pytest.fixture
+async def api(server):
+    """An HTTP client for the app over an emptied database."""
+    import httpx
+
+    for name in await server.db.list_collection_names():
+        await server.db[name].delete_many({})
+    server.idempotency_cache._responses.clear()
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+async def auth_headers(api):
+    """Authorization headers of a freshly registered rescue team."""
+    team = {"username": "team-test", "password": "correct horse", "team_name": "Test team"}
+    await api.post("/api/rescue/register", json=team)
+    response = await api.post("/api/rescue/login", json={"username": team["username"], "password": team["password"]})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
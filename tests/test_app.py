@@ -0,0 +1,50 @@
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+
+def background_tasks(server) -> list:
+    """Tasks that run until shutdown; the legacy image backfill ends on its own."""
+    services = [
+        server.location_buffer, server.track_downsampler, server.signal_archiver,
+        server.priority_refresher, server.orphaned_blobs, server.tile_cache, server.response_cache,
+        server.dispatch_index,
+    ]
+    return [service._task for service in services] + list(server.triage_queue._tasks)
+
+
+def test_app_lifespan_runs_background_tasks_and_creates_indexes(server, monkeypatch):
+    async def unsupported_by_mongomock(*args):
+        pass
+
+    # Time-series collections and $unionWith need a real server
+    monkeypatch.setattr(server, "ensure_track_collection", unsupported_by_mongomock)
+    monkeypatch.setattr(server, "ensure_counters", unsupported_by_mongomock)
+    # Indexes go to a database of their own: mongomock ignores partial indexes, which would break other tests
+    monkeypatch.setattr(server, "db", AsyncMongoMockClient()["sos_app_test"])
+    # The session's other tests share the client
+    monkeypatch.setattr(server.client, "close", lambda: None)
+
+    with TestClient(server.create_app()) as client:
+        assert client.get("/api/").status_code == 200
+        tasks = background_tasks(server)
+        assert all(task is not None and not task.done() for task in tasks)
+        assert server.legacy_image_backfill._task is not None
+        indexes = client.portal.call(server.db.sos_signals.index_information)
+
+    assert {"status_priority_id", "id_unique"} <= set(indexes)
+    # Cancelled, or for triage workers woken up to see the stop flag
+    assert all(task.done() for task in tasks)
+    assert background_tasks(server) == [None] * (len(tasks) - server.triage_queue.workers)
+    assert server.legacy_image_backfill._task is None
+
+
+def test_fast_json_routes_keep_their_response_schemas(server):
+    paths = server.app.openapi()["paths"]
+
+    for path, model in [
+        ("/api/sos/signals", "SOSSignalPage"),
+        ("/api/sos/signals/near", "NearbySOSSignal"),
+        ("/api/rescue/queue", "RescueQueuePage"),
+    ]:
+        schema = paths[path]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+        assert f"#/components/schemas/{model}" in str(schema), path
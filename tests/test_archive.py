@@ -0,0 +1,123 @@
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from archive import ARCHIVE_COLLECTION, SignalArchiver, find_archived
+from blob_store import LocalDiskBlobStore
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def archiver(db, tmp_path):
+    # A zero interval lets a re-run take the lease straight away
+    return SignalArchiver(db, LocalDiskBlobStore(tmp_path), archive_after=timedelta(days=7), interval=0)
+
+
+async def add_signal(db, signal_id: str, status: str = "completed", closed_ago: timedelta = timedelta(days=8)) -> dict:
+    closed_at = (datetime.now(timezone.utc) - closed_ago).isoformat()
+    signal = {
+        "id": signal_id,
+        "latitude": 16.05,
+        "longitude": 108.2,
+        "description": "help",
+        "images": [],
+        "danger_level": "red",
+        "status": status,
+        "created_at": closed_at,
+        "updated_at": closed_at,
+    }
+    await db.sos_signals.insert_one(dict(signal))
+    await db.rescue_signal_tracks.insert_one({"_id": signal_id, "points": [{"signal_id": signal_id, "latitude": 16.05}]})
+    await db.rescue_mission_tracks.insert_one({"_id": f"{signal_id}:team-1", "signal_id": signal_id, "polyline": "abc"})
+    return signal
+
+
+async def test_completed_signals_move_with_their_tracks(db, archiver):
+    await add_signal(db, "closed")
+    await add_signal(db, "recent", closed_ago=timedelta(days=1))
+    await add_signal(db, "open", status="in_progress")
+
+    assert await archiver.run_once() == 1
+
+    assert sorted(await db.sos_signals.distinct("id")) == ["open", "recent"]
+    archived = await db[ARCHIVE_COLLECTION].find_one({"id": "closed"})
+    assert archived["locations"] == [{"signal_id": "closed", "latitude": 16.05}]
+    assert archived["tracks"] == [{"signal_id": "closed", "polyline": "abc"}]
+    assert await db.rescue_signal_tracks.count_documents({"_id": "closed"}) == 0
+    assert await db.rescue_mission_tracks.count_documents({"signal_id": "closed"}) == 0
+    assert (await find_archived(db, "closed"))["status"] == "completed"
+    assert "locations" not in await find_archived(db, "closed")
+
+
+async def test_archive_survives_a_crash_between_copy_and_delete(db, archiver, monkeypatch):
+    await add_signal(db, "closed")
+    collection_type = type(db.sos_signals)
+    delete_one = collection_type.delete_one
+
+    async def crash_on_hot_delete(self, *args, **kwargs):
+        if self.name == "sos_signals":
+            raise ConnectionError("worker lost its connection")
+        return await delete_one(self, *args, **kwargs)
+
+    monkeypatch.setattr(collection_type, "delete_one", crash_on_hot_delete)
+    with pytest.raises(ConnectionError):
+        await archiver.run_once()
+    monkeypatch.setattr(collection_type, "delete_one", delete_one)
+
+    # Copied but still active
+    assert await db[ARCHIVE_COLLECTION].count_documents({"id": "closed"}) == 1
+    assert await db.sos_signals.count_documents({"id": "closed"}) == 1
+
+    assert await archiver.run_once() == 1
+
+    assert await db[ARCHIVE_COLLECTION].count_documents({"id": "closed"}) == 1
+    assert await db.sos_signals.count_documents({}) == 0
+    assert (await db[ARCHIVE_COLLECTION].find_one({"id": "closed"}))["tracks"] == [
+        {"signal_id": "closed", "polyline": "abc"}
+    ]
+
+
+async def test_signal_reopened_during_the_move_stays_active(db, archiver, monkeypatch):
+    signal = await add_signal(db, "closed")
+    collection_type = type(db.sos_signals)
+    replace_one = collection_type.replace_one
+
+    async def reopen_while_copying(self, *args, **kwargs):
+        result = await replace_one(self, *args, **kwargs)
+        await db.sos_signals.update_one(
+            {"id": "closed"}, {"$set": {"status": "in_progress", "updated_at": datetime.now(timezone.utc).isoformat()}}
+        )
+        return result
+
+    monkeypatch.setattr(collection_type, "replace_one", reopen_while_copying)
+    assert await archiver.run_once() == 0
+
+    assert await db[ARCHIVE_COLLECTION].count_documents({}) == 0
+    stored = await db.sos_signals.find_one({"id": "closed"})
+    assert stored["status"] == "in_progress" and stored["updated_at"] > signal["updated_at"]
+    assert await db.rescue_signal_tracks.count_documents({"_id": "closed"}) == 1
+
+
+async def test_archived_signals_are_reported(db, tmp_path):
+    moved = []
+
+    async def on_archive(signals):
+        moved.extend(signal["id"] for signal in signals)
+
+    archiver = SignalArchiver(db, LocalDiskBlobStore(tmp_path), timedelta(days=7), interval=0, on_archive=on_archive)
+    await add_signal(db, "closed")
+
+    await archiver.run_once()
+
+    assert moved == ["closed"]
+
+
+async def test_lease_keeps_other_workers_out(db, tmp_path):
+    await add_signal(db, "closed")
+    first = SignalArchiver(db, LocalDiskBlobStore(tmp_path), timedelta(days=7), interval=3600)
+    second = SignalArchiver(db, LocalDiskBlobStore(tmp_path), timedelta(days=7), interval=3600)
+
+    assert await first._acquire(datetime.now(timezone.utc)) is not None
+    assert await second.run_once() == 0
+    assert await db.sos_signals.count_documents({}) == 1
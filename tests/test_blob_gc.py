@@ -0,0 +1,117 @@
+import base64
+import io
+from datetime import datetime, timezone, timedelta
+
+import pytest
+from PIL import Image
+
+from archive import ARCHIVE_COLLECTION
+from blob_gc import OrphanedBlobCollector
+from blob_store import LocalDiskBlobStore
+
+pytestmark = pytest.mark.anyio
+
+
+def png(color: str) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (40, 40), color).save(out, format="PNG")
+    return out.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalDiskBlobStore(tmp_path)
+
+
+@pytest.fixture
+def collector(db, store):
+    return OrphanedBlobCollector(db, store, grace=timedelta(minutes=10), interval=0)
+
+
+async def wait_out_grace(db) -> None:
+    await db.orphaned_blobs.update_many({}, {"$set": {"queued_at": datetime.now(timezone.utc) - timedelta(days=1)}})
+
+
+async def stored(store, image: dict) -> bool:
+    return await store.info(image["hash"]) is not None and await store.info(image["thumbnail_hash"]) is not None
+
+
+async def test_unreferenced_images_are_collected(db, store, collector):
+    image = await store.store_image(png("red"))
+    await collector.queue([image])
+    await wait_out_grace(db)
+
+    assert await collector.run_once() == 1
+
+    assert not await store.info(image["hash"])
+    assert not await store.info(image["thumbnail_hash"])
+    assert await db.orphaned_blobs.count_documents({}) == 0
+
+
+async def test_images_wait_out_the_grace_period(db, store, collector):
+    image = await store.store_image(png("red"))
+    await collector.queue([image])
+
+    assert await collector.run_once() == 0
+
+    assert await stored(store, image)
+    assert await db.orphaned_blobs.count_documents({}) == 1
+
+
+@pytest.mark.parametrize("collection", ["sos_signals", ARCHIVE_COLLECTION])
+async def test_images_a_signal_uses_are_kept(db, store, collector, collection):
+    image = await store.store_image(png("red"))
+    await db[collection].insert_one({"id": "signal-1", "images": [image]})
+    await collector.queue([image])
+    await wait_out_grace(db)
+
+    assert await collector.run_once() == 0
+
+    assert await stored(store, image)
+    assert await db.orphaned_blobs.count_documents({}) == 0
+
+
+async def test_storing_the_photo_again_cancels_collection(db, store, collector):
+    image = await store.store_image(png("red"))
+    await collector.queue([image])
+
+    # A new submission of the same photo, still in flight when the collector runs
+    await collector.keep([await store.store_image(png("red"))])
+    await wait_out_grace(db)
+
+    assert await collector.run_once() == 0
+    assert await stored(store, image)
+
+
+async def test_failed_submission_images_are_collected(api, server):
+    images = [base64.b64encode(png("green")).decode(), "not base64!"]
+
+    response = await api.post("/api/sos/create", json={
+        "latitude": 16.05, "longitude": 108.2, "description": "help", "images_base64": images
+    })
+
+    assert response.status_code == 400
+    [queued] = await server.db.orphaned_blobs.find().to_list(None)
+    await wait_out_grace(server.db)
+    collector = OrphanedBlobCollector(server.db, server.blob_store, interval=0)
+    assert await collector.run_once() == 1
+    assert await server.blob_store.info(queued["_id"]) is None
+
+
+async def test_successful_resubmission_keeps_the_photo(api, server):
+    image = base64.b64encode(png("green")).decode()
+    failed = await api.post("/api/sos/create", json={
+        "latitude": 16.05, "longitude": 108.2, "description": "help", "images_base64": [image, "not base64!"]
+    })
+    assert failed.status_code == 400
+
+    created = await api.post("/api/sos/create", json={
+        "latitude": 16.05, "longitude": 108.2, "description": "help", "images_base64": [image]
+    })
+
+    assert created.status_code == 200
+    assert await server.db.orphaned_blobs.count_documents({}) == 0
+    await wait_out_grace(server.db)
+    collector = OrphanedBlobCollector(server.db, server.blob_store, interval=0)
+    assert await collector.run_once() == 0
+    assert await server.blob_store.info(created.json()["images"][0]["hash"]) is not None
@@ -0,0 +1,140 @@
+import asyncio
+import io
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+import blob_store
+from blob_store import (
+    MAX_IMAGE_DIMENSION, InvalidImageError, LocalDiskBlobStore, _prepare_image, is_blob_hash, sha256_hex
+)
+
+ORIENTATION = 0x0112
+GPS_IFD = 0x8825
+
+
+def encode(img: Image.Image, format: str, **params) -> bytes:
+    out = io.BytesIO()
+    img.save(out, format=format, **params)
+    return out.getvalue()
+
+
+def exif_with_gps(orientation: int = 1) -> bytes:
+    exif = Image.Exif()
+    exif[ORIENTATION] = orientation
+    gps = exif.get_ifd(GPS_IFD)
+    gps[1] = "N"
+    gps[2] = (16.0, 3.0, 15.0)
+    return exif.tobytes()
+
+
+def metadata(data: bytes) -> dict:
+    with Image.open(io.BytesIO(data)) as img:
+        return {key: img.info[key] for key in ("exif", "xmp", "XML:com.adobe.xmp") if key in img.info}
+
+
+def size(data: bytes) -> tuple:
+    with Image.open(io.BytesIO(data)) as img:
+        return img.size
+
+
+def test_bare_webp_is_kept_as_sent():
+    data = encode(Image.new("RGB", (64, 48), "red"), "WEBP")
+
+    content_type, normalized, thumbnail = _prepare_image(data)
+
+    assert content_type == "image/webp"
+    assert normalized == data
+    assert size(thumbnail) == (64, 48)
+
+
+@pytest.mark.parametrize("params", [
+    {"exif": exif_with_gps()},
+    {"xmp": b"<x:xmpmeta><GPSLatitude>16.05</GPSLatitude></x:xmpmeta>"},
+])
+def test_webp_metadata_is_stripped(params):
+    data = encode(Image.new("RGB", (64, 48), "red"), "WEBP", **params)
+    assert metadata(data)
+
+    _, normalized, thumbnail = _prepare_image(data)
+
+    assert normalized != data
+    assert metadata(normalized) == {}
+    assert metadata(thumbnail) == {}
+
+
+def test_jpeg_metadata_is_stripped():
+    data = encode(Image.new("RGB", (64, 48), "red"), "JPEG", exif=exif_with_gps())
+
+    _, normalized, thumbnail = _prepare_image(data)
+
+    assert metadata(normalized) == {}
+    assert metadata(thumbnail) == {}
+
+
+@pytest.mark.parametrize("format", ["JPEG", "WEBP"])
+def test_images_and_thumbnails_are_turned_upright(format):
+    # Orientation 6: stored landscape, displayed rotated a quarter turn
+    data = encode(Image.new("RGB", (64, 48), "red"), format, exif=exif_with_gps(orientation=6))
+
+    _, normalized, thumbnail = _prepare_image(data)
+
+    assert size(normalized) == (48, 64)
+    assert size(thumbnail) == (48, 64)
+
+
+def test_large_images_are_downscaled():
+    data = encode(Image.new("RGB", (4000, 1000), "blue"), "PNG")
+
+    _, normalized, thumbnail = _prepare_image(data)
+
+    assert size(normalized) == (MAX_IMAGE_DIMENSION, 400)
+    assert max(size(thumbnail)) == 320
+
+
+def test_undecodable_data_is_rejected():
+    with pytest.raises(InvalidImageError):
+        _prepare_image(b"definitely not an image")
+
+
+@pytest.mark.anyio
+async def test_disk_store_round_trip(tmp_path):
+    store = LocalDiskBlobStore(tmp_path)
+    data = b"x" * 600_000
+
+    blob_hash = await store.put(data, "image/webp")
+    assert blob_hash == sha256_hex(data) and is_blob_hash(blob_hash)
+    assert await store.put(data, "image/webp") == blob_hash
+
+    info = await store.info(blob_hash)
+    assert (info.content_type, info.length) == ("image/webp", len(data))
+    assert b"".join([chunk async for chunk in store.stream(blob_hash)]) == data
+
+    await store.delete(blob_hash)
+    await store.delete(blob_hash)
+    assert await store.info(blob_hash) is None
+
+
+@pytest.mark.anyio
+async def test_image_normalization_is_bounded(tmp_path, monkeypatch):
+    running, peak = 0, 0
+    lock = threading.Lock()
+
+    def prepare(data):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+        return "image/webp", data, data[:1]
+
+    monkeypatch.setattr(blob_store, "_prepare_image", prepare)
+    store = LocalDiskBlobStore(tmp_path, image_workers=2)
+
+    await asyncio.gather(*(store.store_image(bytes([i]) * 10) for i in range(6)))
+
+    assert peak == 2
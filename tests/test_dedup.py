@@ -0,0 +1,106 @@
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from dedup import DuplicateDetector, similarity
+from geo import geohash_encode
+
+pytestmark = pytest.mark.anyio
+
+DESCRIPTION = "Nhà tôi bị ngập sâu, có 2 người già mắc kẹt trên mái, cần cứu gấp"
+
+
+def image(n: int) -> dict:
+    return {"hash": f"{n:064x}", "thumbnail_hash": f"{n + 1000:064x}", "content_type": "image/webp", "size": 100}
+
+
+async def add_signal(db, signal_id, latitude=16.0544, longitude=108.2022, description=DESCRIPTION, **fields):
+    created_at = (datetime.now(timezone.utc) - timedelta(minutes=5)).isoformat()
+    signal = {
+        "id": signal_id,
+        "latitude": latitude,
+        "longitude": longitude,
+        "geohash": geohash_encode(latitude, longitude),
+        "description": description,
+        "images": [],
+        "status": "pending",
+        "report_count": 1,
+        "created_at": created_at,
+        "updated_at": created_at,
+        **fields,
+    }
+    await db.sos_signals.insert_one(signal)
+    return signal
+
+
+def test_similarity_ignores_case_and_diacritics():
+    assert similarity("MẮC KẸT trên mái", "mac ket tren mai") == 1.0
+    assert similarity("cần nước uống", "cháy nhà cuối hẻm") < 0.2
+    assert similarity("", "anything") == 0.0
+
+
+async def test_similar_report_nearby_is_a_duplicate(db):
+    await add_signal(db, "original")
+    detector = DuplicateDetector(db)
+
+    duplicate = await detector.find_duplicate(16.0545, 108.2023, DESCRIPTION.upper() + "!!", [])
+
+    assert duplicate["id"] == "original"
+
+
+async def test_distant_or_different_reports_are_not_duplicates(db):
+    await add_signal(db, "original")
+    detector = DuplicateDetector(db)
+
+    assert await detector.find_duplicate(16.07, 108.2022, DESCRIPTION, []) is None
+    assert await detector.find_duplicate(16.0544, 108.2022, "Cần nước uống và thuốc cho trẻ em", []) is None
+
+
+async def test_closed_or_old_signals_are_not_duplicates(db):
+    await add_signal(db, "completed", status="completed")
+    await add_signal(db, "old", created_at=(datetime.now(timezone.utc) - timedelta(hours=3)).isoformat())
+    detector = DuplicateDetector(db)
+
+    assert await detector.find_duplicate(16.0544, 108.2022, DESCRIPTION, []) is None
+
+
+async def test_shared_image_within_the_image_radius_is_a_duplicate(db):
+    await add_signal(db, "original", images=[image(1)])
+    detector = DuplicateDetector(db)
+
+    nearby = await detector.find_duplicate(16.064, 108.2022, "Khác hoàn toàn", [image(1)["hash"]])
+    far = await detector.find_duplicate(16.2, 108.2022, "Khác hoàn toàn", [image(1)["hash"]])
+
+    assert nearby["id"] == "original"
+    assert far is None
+
+
+async def test_merge_folds_the_report_into_the_signal(db):
+    await add_signal(db, "original", images=[image(1)])
+    detector = DuplicateDetector(db)
+    report = {"latitude": 16.0545, "longitude": 108.2023, "description": "again", "created_at": "2030-01-01T00:00:00+00:00"}
+
+    merged = await detector.merge("original", report, [image(1), image(2)])
+
+    assert merged["report_count"] == 2
+    assert merged["images"] == [image(1), image(2)]
+    assert merged["updated_at"] == report["created_at"]
+    assert "reports" not in merged
+    stored = await db.sos_signals.find_one({"id": "original"})
+    assert stored["reports"] == [report]
+
+
+async def test_merge_with_a_key_happens_once(db):
+    await add_signal(db, "original")
+    detector = DuplicateDetector(db)
+    report = {"latitude": 16.0545, "longitude": 108.2023, "description": "again", "created_at": "2030-01-01T00:00:00+00:00"}
+
+    # mongomock looks the updated document up again with the original filter, which the
+    # new key no longer matches, so only the second (rejected) merge's result is checked
+    await detector.merge("original", report, [], idempotency_key="device-1:report-7")
+    second = await detector.merge("original", report, [], idempotency_key="device-1:report-7")
+
+    assert second is None
+    stored = await db.sos_signals.find_one({"id": "original"})
+    assert stored["report_count"] == 2
+    assert stored["idempotency_keys"] == ["device-1:report-7"]
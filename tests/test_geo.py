@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from geo import geohash_cell_size, geohash_cover, geohash_encode, geohash_query, tile_bbox, tile_for
+
+
+@pytest.mark.parametrize("latitude, longitude, precision, expected", [
+    (57.64911, 10.40744, 11, "u4pruydqqvj"),
+    (42.6, -5.6, 5, "ezs42"),
+    (-25.382708, -49.265506, 8, "6gkzwgjz"),
+])
+def test_geohash_encode_reference_values(latitude, longitude, precision, expected):
+    assert geohash_encode(latitude, longitude, precision) == expected
+
+
+def test_geohash_prefixes_nest():
+    assert geohash_encode(16.0544, 108.2022).startswith(geohash_encode(16.0544, 108.2022, 5))
+
+
+def test_geohash_cell_size():
+    assert geohash_cell_size(1) == (45.0, 45.0)
+    assert geohash_cell_size(2) == (11.25, 5.625)
+
+
+@pytest.mark.parametrize("bbox", [
+    (108.1, 15.9, 108.3, 16.1),
+    (105.7, 20.9, 105.9, 21.1),
+    (102.0, 8.0, 110.0, 23.5),
+    (108.2, 16.05, 108.2001, 16.0501),
+])
+def test_geohash_cover_contains_every_point_of_the_bbox(bbox):
+    min_lon, min_lat, max_lon, max_lat = bbox
+    cover = geohash_cover(bbox, max_cells=32)
+    rng = random.Random(7)
+
+    assert 0 < len(cover) <= 32
+    corners = [(min_lat, min_lon), (min_lat, max_lon), (max_lat, min_lon), (max_lat, max_lon)]
+    inside = [(rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon)) for _ in range(500)]
+    for latitude, longitude in corners + inside:
+        geohash = geohash_encode(latitude, longitude)
+        assert any(geohash.startswith(prefix) for prefix in cover), (latitude, longitude)
+
+
+def test_geohash_cover_is_tight_for_small_boxes():
+    cover = geohash_cover((108.2, 16.05, 108.2001, 16.0501), max_cells=32)
+
+    assert min(len(prefix) for prefix in cover) >= 7
+
+
+def test_geohash_query_ranges():
+    query = geohash_query((108.1, 15.9, 108.3, 16.1))
+
+    for clause in query["$or"]:
+        prefix = clause["geohash"]["$gte"]
+        assert clause["geohash"]["$lt"] == prefix + "~"
+
+
+@pytest.mark.parametrize("latitude, longitude, z", [(16.0544, 108.2022, 12), (21.0285, 105.8542, 7), (0.0, 0.0, 0)])
+def test_tile_for_lies_in_its_tile_bbox(latitude, longitude, z):
+    min_lon, min_lat, max_lon, max_lat = tile_bbox(z, *tile_for(latitude, longitude, z))
+
+    assert min_lon <= longitude <= max_lon
+    assert min_lat <= latitude <= max_lat
@@ -0,0 +1,118 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+REPORT = {"latitude": 16.0544, "longitude": 108.2022, "description": "Nhà bị ngập, cần cứu", "user_selected_level": "red"}
+OTHER_REPORT = {"latitude": 21.0285, "longitude": 105.8542, "description": "Cần nước uống", "user_selected_level": "green"}
+
+
+async def submit(api, key: str, report: dict = REPORT):
+    return await api.post("/api/sos/create", json=report, headers={"Idempotency-Key": key})
+
+
+async def test_retry_returns_the_original_signal(api, server):
+    first = await submit(api, "device-1:0001")
+    retry = await submit(api, "device-1:0001")
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json()["id"] == first.json()["id"]
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert await server.db.sos_signals.count_documents({}) == 1
+
+
+async def test_retry_is_replayed_from_the_database(api, server):
+    first = await submit(api, "device-1:0001")
+    # As on another worker, or after a restart
+    server.idempotency_cache._responses.clear()
+
+    retry = await submit(api, "device-1:0001")
+
+    assert retry.json()["id"] == first.json()["id"]
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+
+async def test_retry_of_an_archived_signal_is_replayed(api, server):
+    first = (await submit(api, "device-1:0001")).json()
+    stored = await server.db.sos_signals.find_one({"id": first["id"]}, {"_id": 0})
+    await server.db.sos_signals_archive.insert_one({**stored, "status": "completed", "locations": [], "tracks": []})
+    await server.db.sos_signals.delete_one({"id": first["id"]})
+    server.idempotency_cache._responses.clear()
+
+    retry = await submit(api, "device-1:0001")
+
+    assert retry.json()["id"] == first["id"]
+    assert retry.json()["status"] == "completed"
+    assert await server.db.sos_signals.count_documents({}) == 0
+
+
+async def test_different_keys_create_different_signals(api, server):
+    first = await submit(api, "device-1:0001")
+    second = await submit(api, "device-1:0002", OTHER_REPORT)
+
+    assert first.json()["id"] != second.json()["id"]
+
+
+async def test_retry_of_a_merged_report_is_replayed(api, server):
+    original = (await submit(api, "device-1:0001")).json()
+    # The same call sent from a second phone is merged into the first signal
+    merged = (await submit(api, "device-2:0001")).json()
+    retry = await submit(api, "device-2:0001")
+
+    assert merged["id"] == retry.json()["id"] == original["id"]
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    stored = await server.db.sos_signals.find_one({"id": original["id"]})
+    assert stored["report_count"] == 2
+
+
+async def test_malformed_key_is_rejected(api):
+    response = await submit(api, "short")
+
+    assert response.status_code == 400
+
+
+async def test_batch_resend_replays_every_report(api, server):
+    batch = {"reports": [
+        {**REPORT, "idempotency_key": "device-1:0001"},
+        {**OTHER_REPORT, "idempotency_key": "device-1:0002"},
+    ]}
+
+    first = (await api.post("/api/sos/batch", json=batch)).json()["results"]
+    resent = (await api.post("/api/sos/batch", json=batch)).json()["results"]
+
+    assert [result["status"] for result in first + resent] == [200] * 4
+    assert [result["replayed"] for result in first] == [False, False]
+    assert [result["replayed"] for result in resent] == [True, True]
+    assert [result["signal"]["id"] for result in resent] == [result["signal"]["id"] for result in first]
+    assert await server.db.sos_signals.count_documents({}) == 2
+
+
+async def test_batch_report_replays_a_single_submission(api):
+    single = (await submit(api, "device-1:0001")).json()
+
+    response = await api.post("/api/sos/batch", json={"reports": [{**REPORT, "idempotency_key": "device-1:0001"}]})
+
+    [result] = response.json()["results"]
+    assert result["replayed"] is True
+    assert result["signal"]["id"] == single["id"]
+
+
+async def test_failed_batch_report_does_not_fail_the_others(api, server):
+    batch = {"reports": [
+        {**REPORT, "idempotency_key": "device-1:0001", "images_base64": ["not base64!"]},
+        {**OTHER_REPORT, "idempotency_key": "device-1:0002"},
+    ]}
+
+    results = (await api.post("/api/sos/batch", json=batch)).json()["results"]
+
+    assert [(result["idempotency_key"], result["status"]) for result in results] == [
+        ("device-1:0001", 400),
+        ("device-1:0002", 200),
+    ]
+    assert await server.db.sos_signals.count_documents({}) == 1
+
+
+async def test_batch_rejects_reports_without_a_key(api):
+    response = await api.post("/api/sos/batch", json={"reports": [REPORT]})
+
+    assert response.status_code == 422
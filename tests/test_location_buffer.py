@@ -0,0 +1,152 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from location_buffer import LocationWriteBuffer
+
+pytestmark = pytest.mark.anyio
+
+
+def locations(count: int, signal_id: str = "signal-1", team_id: str = "team-1") -> list:
+    start = datetime(2024, 10, 1, 8, 0, tzinfo=timezone.utc)
+    return [
+        {
+            "id": f"{signal_id}-{team_id}-{i}",
+            "signal_id": signal_id,
+            "team_id": team_id,
+            "latitude": 16.0 + i * 0.001,
+            "longitude": 108.0,
+            "timestamp": (start + timedelta(seconds=i)).isoformat(),
+        }
+        for i in range(count)
+    ]
+
+
+async def stored(db) -> int:
+    return await db.rescue_locations.count_documents({})
+
+
+async def test_full_batch_is_flushed_right_away(db):
+    flushed = []
+
+    async def on_flush(signal_ids):
+        flushed.append(signal_ids)
+
+    buffer = LocationWriteBuffer(db, max_batch=3, flush_interval=3600, on_flush=on_flush)
+
+    await buffer.add(locations(2))
+    assert await stored(db) == 0
+    await buffer.add(locations(1, signal_id="signal-2"))
+
+    assert await stored(db) == 3
+    assert buffer.pending == 0
+    assert flushed == [{"signal-1", "signal-2"}]
+    position = await db.rescue_team_positions.find_one({"_id": "team-1"})
+    assert position["id"] == "signal-1-team-1-1"
+    track = await db.rescue_signal_tracks.find_one({"_id": "signal-1"})
+    assert [point["id"] for point in track["points"]] == ["signal-1-team-1-1", "signal-1-team-1-0"]
+
+
+async def test_partial_batch_is_flushed_on_the_interval(db):
+    buffer = LocationWriteBuffer(db, max_batch=500, flush_interval=0.01)
+    buffer.start()
+    try:
+        await buffer.add(locations(2))
+        for _ in range(100):
+            if await stored(db) == 2:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await buffer.stop()
+
+    assert await stored(db) == 2
+
+
+async def test_shutdown_drains_the_buffer(db):
+    buffer = LocationWriteBuffer(db, max_batch=500, flush_interval=3600)
+    buffer.start()
+    await buffer.add(locations(5))
+
+    await buffer.stop()
+
+    assert await stored(db) == 5
+    assert buffer.pending == 0
+
+
+async def test_shutdown_waits_for_a_flush_in_flight(db, monkeypatch):
+    collection = type(db.rescue_locations)
+    insert_many = collection.insert_many
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def slow_insert_many(self, documents, **kwargs):
+        started.set()
+        await release.wait()
+        return await insert_many(self, documents, **kwargs)
+
+    monkeypatch.setattr(collection, "insert_many", slow_insert_many)
+    buffer = LocationWriteBuffer(db, max_batch=500, flush_interval=0)
+    await buffer.add(locations(3))
+    buffer.start()
+    await started.wait()
+
+    stopping = asyncio.create_task(buffer.stop())
+    await asyncio.sleep(0.01)
+    release.set()
+    await stopping
+
+    assert await stored(db) == 3
+
+
+async def test_failed_flush_keeps_its_points(db, monkeypatch):
+    collection = type(db.rescue_locations)
+    insert_many = collection.insert_many
+    calls = []
+
+    async def flaky_insert_many(self, documents, **kwargs):
+        calls.append(len(documents))
+        if len(calls) == 1:
+            raise AutoReconnect("primary stepped down")
+        return await insert_many(self, documents, **kwargs)
+
+    monkeypatch.setattr(collection, "insert_many", flaky_insert_many)
+    buffer = LocationWriteBuffer(db, max_batch=500, flush_interval=3600)
+    await buffer.add(locations(2))
+
+    with pytest.raises(AutoReconnect):
+        await buffer.flush()
+    await buffer.add(locations(1, signal_id="signal-2"))
+    await buffer.flush()
+
+    assert calls == [2, 3]
+    assert await stored(db) == 3
+
+
+async def test_points_rejected_by_an_unordered_insert_are_left_out_of_the_read_models(db, monkeypatch):
+    collection = type(db.rescue_locations)
+    insert_many = collection.insert_many
+
+    async def partly_failing_insert_many(self, documents, **kwargs):
+        # The server writes the first point and rejects the second
+        await insert_many(self, [documents[0]], **kwargs)
+        raise BulkWriteError({
+            "writeErrors": [{"index": 1, "code": 2, "errmsg": "Document failed validation"}],
+            "nInserted": 1,
+        })
+
+    monkeypatch.setattr(collection, "insert_many", partly_failing_insert_many)
+    flushed = []
+
+    async def on_flush(signal_ids):
+        flushed.append(signal_ids)
+
+    buffer = LocationWriteBuffer(db, max_batch=500, flush_interval=3600, on_flush=on_flush)
+    await buffer.add(locations(1, signal_id="signal-1") + locations(1, signal_id="signal-2", team_id="team-2"))
+
+    await buffer.flush()
+
+    assert buffer.pending == 0
+    assert flushed == [{"signal-1"}]
+    assert await db.rescue_signal_tracks.distinct("_id") == ["signal-1"]
+    assert await db.rescue_team_positions.distinct("_id") == ["team-1"]
@@ -0,0 +1,55 @@
+import pytest
+
+
+def test_signal_cursor_round_trip(server):
+    signal = {"created_at": "2024-10-01T08:30:00+00:00", "id": "6f1c1a52-1b7e-4c43-9a55-2b0c4c7f7e01"}
+
+    cursor = server.encode_signal_cursor(signal)
+
+    assert "=" not in cursor
+    assert server.decode_signal_cursor(cursor) == (signal["created_at"], signal["id"])
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "bm90IGpzb24", "WzFd", "e30"])
+def test_bad_signal_cursor_is_rejected(server, cursor):
+    with pytest.raises(server.HTTPException) as excinfo:
+        server.decode_signal_cursor(cursor)
+
+    assert excinfo.value.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_pages_follow_the_cursor(api, server):
+    for i in range(5):
+        await server.db.sos_signals.insert_one({
+            "id": f"signal-{i}",
+            "latitude": 16.0,
+            "longitude": 108.0,
+            "description": "help",
+            "images": [],
+            "danger_level": "yellow",
+            "ai_assessment": "",
+            "status": "pending",
+            "created_at": f"2024-10-01T08:0{i}:00+00:00",
+            "updated_at": f"2024-10-01T08:0{i}:00+00:00",
+        })
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = await api.get("/api/sos/signals", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        seen += [signal["id"] for signal in page["items"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert seen == [f"signal-{i}" for i in reversed(range(5))]
+
+
+@pytest.mark.anyio
+async def test_listing_rejects_a_bad_cursor(api):
+    response = await api.get("/api/sos/signals", params={"limit": 2, "cursor": "e30"})
+
+    assert response.status_code == 400
@@ -0,0 +1,128 @@
+import asyncio
+import threading
+
+import pytest
+
+import passwords
+from passwords import LoginThrottle, PasswordHasher, PasswordPoolBusy
+
+# The lowest cost bcrypt accepts keeps the tests fast
+ROUNDS = 4
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(workers=1, max_queue=4, rounds=ROUNDS)
+    yield hasher
+    hasher.executor.shutdown()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(passwords.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.mark.anyio
+async def test_verify_runs_on_the_bcrypt_pool(hasher, monkeypatch):
+    threads = []
+    verify = hasher.context.verify
+
+    def recording_verify(*args):
+        threads.append(threading.current_thread().name)
+        return verify(*args)
+
+    monkeypatch.setattr(hasher.context, "verify", recording_verify)
+    password_hash = await hasher.hash("correct horse")
+
+    assert await hasher.verify("correct horse", password_hash) == (True, None)
+    assert await hasher.verify("wrong horse", password_hash) == (False, None)
+    assert threads and all(name.startswith("bcrypt") for name in threads)
+    assert hasher.stats()["completed"] == 3
+    assert hasher.pending == 0
+
+
+@pytest.mark.anyio
+async def test_verify_returns_a_new_hash_when_the_cost_changed(hasher):
+    old_hash = await PasswordHasher(rounds=ROUNDS + 1).hash("correct horse")
+
+    valid, new_hash = await hasher.verify("correct horse", old_hash)
+
+    assert valid
+    assert new_hash.split("$")[2] == f"{ROUNDS:02d}"
+    assert await hasher.verify("correct horse", new_hash) == (True, None)
+
+
+@pytest.mark.anyio
+async def test_full_pool_rejects_new_work():
+    hasher = PasswordHasher(workers=1, max_queue=0, rounds=ROUNDS)
+
+    results = await asyncio.gather(hasher.hash("a"), hasher.hash("b"), return_exceptions=True)
+
+    assert isinstance(results[1], PasswordPoolBusy)
+    assert hasher.stats()["rejected"] == 1
+    hasher.executor.shutdown()
+
+
+def test_username_is_locked_out_after_too_many_failures(clock):
+    throttle = LoginThrottle(max_per_username=3, max_per_ip=100, window=300)
+
+    for _ in range(2):
+        throttle.record_failure("Team-1", "10.0.0.1")
+    assert throttle.retry_after("team-1", "10.0.0.1") is None
+
+    throttle.record_failure("team-1", "10.0.0.2")
+    assert throttle.retry_after("TEAM-1", "10.0.0.3") == 300
+    assert throttle.retry_after("team-2", "10.0.0.1") is None
+
+
+def test_lockout_ends_as_failures_leave_the_window(clock):
+    throttle = LoginThrottle(max_per_username=2, max_per_ip=100, window=300)
+    throttle.record_failure("team-1", None)
+    clock[0] += 100
+    throttle.record_failure("team-1", None)
+
+    clock[0] += 150
+    assert throttle.retry_after("team-1", None) == 50
+    clock[0] += 50
+    assert throttle.retry_after("team-1", None) is None
+
+
+def test_ip_is_locked_out_across_usernames(clock):
+    throttle = LoginThrottle(max_per_username=100, max_per_ip=3, window=300)
+
+    for username in ("a", "b", "c"):
+        throttle.record_failure(username, "10.0.0.1")
+
+    assert throttle.retry_after("d", "10.0.0.1") == 300
+    assert throttle.retry_after("d", "10.0.0.2") is None
+
+
+def test_success_resets_the_username(clock):
+    throttle = LoginThrottle(max_per_username=2, max_per_ip=100, window=300)
+    throttle.record_failure("team-1", "10.0.0.1")
+
+    throttle.record_success("Team-1")
+    throttle.record_failure("team-1", "10.0.0.1")
+
+    assert throttle.retry_after("team-1", "10.0.0.1") is None
+
+
+@pytest.mark.anyio
+async def test_login_is_throttled_and_reset_by_success(api, server, monkeypatch):
+    monkeypatch.setattr(server, "login_throttle", LoginThrottle(max_per_username=2, max_per_ip=100, window=300))
+    team = {"username": "team-throttle", "password": "correct horse", "team_name": "Throttled"}
+    await api.post("/api/rescue/register", json=team)
+    wrong = {"username": team["username"], "password": "wrong horse"}
+    right = {"username": team["username"], "password": team["password"]}
+
+    assert (await api.post("/api/rescue/login", json=wrong)).status_code == 401
+    assert (await api.post("/api/rescue/login", json=right)).status_code == 200
+    assert (await api.post("/api/rescue/login", json=wrong)).status_code == 401
+    assert (await api.post("/api/rescue/login", json=wrong)).status_code == 401
+
+    locked = await api.post("/api/rescue/login", json=right)
+
+    assert locked.status_code == 429
+    assert int(locked.headers["Retry-After"]) > 0
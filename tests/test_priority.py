@@ -0,0 +1,187 @@
+import base64
+import json
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from priority import (
+    PriorityRefresher, decode_queue_cursor, encode_queue_cursor, page_after, priority_score, queue_page, rank,
+    signal_priority
+)
+
+NOW = datetime(2024, 10, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def signal(signal_id: str, danger_level: str = "yellow", waited: timedelta = timedelta(0), **fields) -> dict:
+    return {"id": signal_id, "danger_level": danger_level, "created_at": (NOW - waited).isoformat(), **fields}
+
+
+def raw_cursor(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("origin", [(16.0544, 108.2022), None])
+def test_queue_cursor_round_trip(origin):
+    cursor = encode_queue_cursor(origin, {"priority": 123.45, "id": "signal-9"})
+
+    assert decode_queue_cursor(cursor) == (origin, (123.45, "signal-9"))
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    raw_cursor({"origin": None}),
+    raw_cursor([None, 1.0]),
+    raw_cursor([None, "high", "a"]),
+    raw_cursor([NOW.isoformat(), None, 1.0, "a"]),
+])
+def test_malformed_queue_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_queue_cursor(cursor)
+
+
+@pytest.mark.parametrize("origin", [
+    [16.0],
+    [16.0, 108.0, 0.0],
+    "16,108",
+    {"lat": 16, "lon": 108},
+    [True, 108.0],
+    ["16", "108"],
+    [91.0, 108.0],
+    [16.0, -181.0],
+])
+def test_bad_cursor_origin_is_rejected(origin):
+    with pytest.raises(ValueError):
+        decode_queue_cursor(raw_cursor([origin, 1.0, "a"]))
+
+
+def test_non_finite_origin_is_rejected():
+    cursor = base64.urlsafe_b64encode(b'[[NaN, 108.0], 1.0, "a"]').decode()
+
+    with pytest.raises(ValueError):
+        decode_queue_cursor(cursor)
+
+
+def test_signal_priority_components():
+    assert signal_priority(signal("a", "red"), NOW) == 100
+    assert signal_priority(signal("a", "green", timedelta(hours=2)), NOW) == 30
+    # Waiting and repeated reports are capped
+    assert signal_priority(signal("a", "green", timedelta(days=3), report_count=20), NOW) == 10 + 60 + 50
+
+
+def test_priority_score_uses_the_stored_priority():
+    assert priority_score(signal("a", "red", priority=150.0), NOW, None) == 150
+    assert priority_score(signal("a", "red", priority=150.0), NOW, 12_500) == 137.5
+    assert priority_score(signal("a", "red"), NOW, 12_500) == 87.5
+
+
+def test_rank_orders_by_score_then_id():
+    signals = [
+        signal("b", "yellow"),
+        signal("a", "yellow"),
+        signal("c", "red", distance_m=30_000.04),
+        signal("d", "green", timedelta(hours=10)),
+    ]
+
+    ranked = rank(signals, NOW)
+
+    # c and d tie at 70
+    assert [s["id"] for s in ranked] == ["c", "d", "a", "b"]
+    assert ranked[0]["distance_m"] == 30000.0
+    assert ranked[0]["priority"] == ranked[1]["priority"] == 70
+
+
+def test_ranked_pages_cover_the_queue_once():
+    ranked = rank([signal(f"s{i:02}", "yellow", timedelta(minutes=i * 7 % 60)) for i in range(25)], NOW)
+
+    seen, after = [], None
+    while True:
+        page, more = page_after(ranked, after, 10)
+        seen += page
+        if not more:
+            break
+        _, after = decode_queue_cursor(encode_queue_cursor((16.0, 108.0), page[-1]))
+
+    assert seen == ranked
+
+
+async def add_pending(db, signal_id: str, priority, status: str = "pending", **fields) -> None:
+    doc = {"id": signal_id, "status": status, "danger_level": "yellow", "created_at": NOW.isoformat(), **fields}
+    if priority is not None:
+        doc["priority"] = priority
+    await db.sos_signals.insert_one(doc)
+
+
+@pytest.mark.anyio
+async def test_queue_pages_follow_the_stored_priority(db):
+    for i in range(7):
+        await add_pending(db, f"s{i}", float(i % 3))
+    await add_pending(db, "done", 500.0, status="completed")
+
+    seen, after = [], None
+    while True:
+        page, more = await queue_page(db, after, 3)
+        seen += [(s["priority"], s["id"]) for s in page]
+        if not more:
+            break
+        _, after = decode_queue_cursor(encode_queue_cursor(None, page[-1]))
+
+    assert seen == [(2.0, "s2"), (2.0, "s5"), (1.0, "s1"), (1.0, "s4"), (0.0, "s0"), (0.0, "s3"), (0.0, "s6")]
+
+
+@pytest.mark.anyio
+async def test_refresher_updates_aging_and_unscored_signals(db):
+    now = datetime.now(timezone.utc)
+    await add_pending(db, "aging", 40.0, created_at=(now - timedelta(hours=2)).isoformat())
+    await add_pending(db, "unscored", None, created_at=(now - timedelta(days=5)).isoformat(), danger_level="red")
+    # Capped long ago; the refresher does not look at it again
+    await add_pending(db, "settled", 12.0, created_at=(now - timedelta(days=2)).isoformat())
+    await add_pending(db, "fresh", 40.0, created_at=now.isoformat())
+
+    assert await PriorityRefresher(db, interval=0).run_once() == 2
+
+    stored = {s["id"]: s["priority"] async for s in db.sos_signals.find({}, {"id": 1, "priority": 1})}
+    assert stored["aging"] == pytest.approx(60.0, abs=0.1)
+    assert stored["unscored"] == 160.0
+    assert stored["settled"] == 12.0
+    assert stored["fresh"] == 40.0
+
+
+@pytest.mark.anyio
+async def test_queue_endpoint_pages_by_priority(api, server, auth_headers):
+    now = datetime.now(timezone.utc)
+    await server.db.sos_signals.insert_many([
+        {
+            "id": f"s{i:02}",
+            "latitude": 16.0 + i * 0.01,
+            "longitude": 108.0,
+            "description": "help",
+            "danger_level": ["red", "yellow", "green"][i % 3],
+            "status": "pending" if i % 5 else "completed",
+            "report_count": 1 + i % 4,
+            "created_at": (now - timedelta(hours=i % 9)).isoformat(),
+        }
+        for i in range(30)
+    ])
+    await server.priority_refresher.run_once()
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 7, **({"cursor": cursor} if cursor else {})}
+        response = await api.get("/api/rescue/queue", params=params, headers=auth_headers)
+        assert response.status_code == 200
+        page = response.json()
+        seen += [(signal["priority"], signal["id"]) for signal in page["items"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert page["origin"] is None
+    assert len(seen) == len({signal_id for _, signal_id in seen}) == 24
+    assert seen == sorted(seen, key=lambda item: (-item[0], item[1]))
+
+
+@pytest.mark.anyio
+async def test_queue_endpoint_rejects_a_bad_cursor(api, auth_headers):
+    response = await api.get("/api/rescue/queue", params={"cursor": "e30"}, headers=auth_headers)
+
+    assert response.status_code == 400
@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from events import RESCUE_LOCATION, SIGNAL_STATUS_CHANGED, EventBus
+from response_cache import MemoryBackend, ResponseCache, etag_matches, locations_key, make_etag, signal_key
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def cache():
+    cache = ResponseCache(MemoryBackend(maxsize=100, ttl=60), bus=EventBus())
+    cache.start()
+    yield cache
+    await cache.stop()
+
+
+def loader(body: bytes):
+    loads = []
+
+    async def load():
+        loads.append(body)
+        return body
+
+    return load, loads
+
+
+async def settle() -> None:
+    # Let the consumer task handle what was published
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_etag_matching():
+    etag = make_etag(b"{}")
+
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
+
+
+async def test_hits_are_served_without_loading(cache):
+    load, loads = loader(b'{"id": "s1"}')
+
+    first = await cache.get(signal_key("s1"), load)
+    second = await cache.get(signal_key("s1"), load)
+
+    assert first == second == (make_etag(b'{"id": "s1"}'), b'{"id": "s1"}')
+    assert len(loads) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+async def test_status_change_event_invalidates_the_signal(cache):
+    load, loads = loader(b'{"status": "pending"}')
+    await cache.get(signal_key("s1"), load)
+
+    cache.bus.publish(SIGNAL_STATUS_CHANGED, "s1", 16.0, 108.0, {"id": "s1", "status": "rescued"})
+    await settle()
+    await cache.get(signal_key("s1"), load)
+
+    assert len(loads) == 2
+    assert cache.invalidations == 1
+
+
+async def test_location_event_invalidates_only_the_track(cache):
+    signal_load, signal_loads = loader(b"{}")
+    track_load, track_loads = loader(b"[]")
+    await cache.get(signal_key("s1"), signal_load)
+    await cache.get(locations_key("s1"), track_load)
+
+    cache.bus.publish(RESCUE_LOCATION, "s1", 16.0, 108.0, {})
+    await settle()
+    await cache.get(signal_key("s1"), signal_load)
+    await cache.get(locations_key("s1"), track_load)
+
+    assert (len(signal_loads), len(track_loads)) == (1, 2)
+
+
+async def test_lost_events_clear_the_cache(cache):
+    load, loads = loader(b"{}")
+    await cache.get(signal_key("s1"), load)
+
+    # The queue overflowed: some write went unseen
+    cache._subscription.dropped += 1
+    cache.bus.publish(SIGNAL_STATUS_CHANGED, "s2", 16.0, 108.0, {"id": "s2"})
+    await settle()
+    await cache.get(signal_key("s1"), load)
+
+    assert len(loads) == 2
+
+
+async def signal_id(api) -> str:
+    response = await api.post("/api/sos/create", json={"latitude": 16.05, "longitude": 108.2, "description": "help"})
+    return response.json()["id"]
+
+
+async def test_matching_etag_gets_not_modified(api):
+    sid = await signal_id(api)
+    first = await api.get(f"/api/sos/signals/{sid}")
+
+    revalidated = await api.get(f"/api/sos/signals/{sid}", headers={"If-None-Match": first.headers["ETag"]})
+    stale = await api.get(f"/api/sos/signals/{sid}", headers={"If-None-Match": '"something else"'})
+
+    assert first.status_code == 200 and first.headers["Cache-Control"] == "no-cache"
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+    assert revalidated.headers["ETag"] == first.headers["ETag"]
+    assert stale.status_code == 200 and stale.json() == first.json()
+
+
+async def test_status_change_busts_the_cached_signal(api, auth_headers):
+    sid = await signal_id(api)
+    first = await api.get(f"/api/sos/signals/{sid}")
+
+    update = await api.put(f"/api/sos/signals/{sid}/status", json={"status": "in_progress"}, headers=auth_headers)
+    after = await api.get(f"/api/sos/signals/{sid}", headers={"If-None-Match": first.headers["ETag"]})
+
+    assert update.status_code == 200
+    assert after.status_code == 200
+    assert after.json()["status"] == "in_progress"
+    assert after.headers["ETag"] != first.headers["ETag"]
@@ -0,0 +1,80 @@
+from collections import Counter
+from datetime import timedelta
+
+import pytest
+
+from archive import ARCHIVE_COLLECTION, SignalArchiver
+from stats import COUNTERS_ID, get_counters, hour_key, region_key
+from triage import TriageResult
+
+pytestmark = pytest.mark.anyio
+
+
+async def recount(db) -> dict:
+    """What rebuild_counters computes, counted in Python since mongomock lacks $unionWith."""
+    signals = await db.sos_signals.find().to_list(None) + await db[ARCHIVE_COLLECTION].find().to_list(None)
+    return {
+        "total": len(signals),
+        "danger": Counter(signal["danger_level"] for signal in signals),
+        "status": Counter(signal["status"] for signal in signals),
+        "region": Counter(region_key(signal["latitude"], signal["longitude"]) for signal in signals),
+        "hour": Counter(hour_key(signal["created_at"]) for signal in signals),
+    }
+
+
+def without_zeros(counters: dict) -> dict:
+    return {
+        field: value if field == "total" else {key: n for key, n in value.items() if n}
+        for field, value in counters.items() if field != "_id"
+    }
+
+
+async def submit(api, latitude: float, level: str) -> str:
+    response = await api.post("/api/sos/create", json={
+        "latitude": latitude, "longitude": 108.2, "description": f"help at {latitude}", "user_selected_level": level
+    })
+    return response.json()["id"]
+
+
+async def test_write_paths_keep_the_counters_equal_to_a_recount(api, server, auth_headers, tmp_path):
+    await server.db.stats.insert_one({"_id": COUNTERS_ID, "total": 0})
+    first = await submit(api, 16.05, "red")
+    second = await submit(api, 17.5, "green")
+    await submit(api, 18.5, "yellow")
+
+    await server.finish_triage(second, TriageResult(score=9.0, danger_level="red"))
+    await api.put(f"/api/sos/signals/{second}/status", json={"status": "in_progress"}, headers=auth_headers)
+    await api.put(f"/api/sos/signals/{first}/status", json={"status": "completed"}, headers=auth_headers)
+    # Archival takes the completed signal out of sos_signals
+    archiver = SignalArchiver(server.db, server.blob_store, archive_after=timedelta(0), interval=0)
+    assert await archiver.run_once() == 1
+
+    counters = await get_counters(server.db, breakdowns=True)
+
+    assert without_zeros(counters) == await recount(server.db)
+    assert counters["status"] == {"pending": 1, "in_progress": 1, "completed": 1}
+    assert counters["danger"] == {"red": 2, "green": 0, "yellow": 1}
+
+
+async def test_breakdowns_are_only_read_when_asked_for(db):
+    await db.stats.insert_one({
+        "_id": COUNTERS_ID, "total": 1, "danger": {"red": 1}, "status": {"pending": 1},
+        "region": {"16_108": 1}, "hour": {"2024-10-01T08": 1},
+    })
+
+    assert set(await get_counters(db)) == {"_id", "total", "danger", "status"}
+    assert (await get_counters(db, breakdowns=True))["region"] == {"16_108": 1}
+
+
+async def test_dashboard_breakdowns(api, server, auth_headers):
+    await server.db.stats.insert_one({"_id": COUNTERS_ID, "total": 0})
+    await submit(api, 16.05, "red")
+
+    summary = (await api.get("/api/rescue/dashboard/stats", headers=auth_headers)).json()
+    detailed = (await api.get("/api/rescue/dashboard/stats", params={"breakdowns": True}, headers=auth_headers)).json()
+
+    assert summary == {
+        "total_signals": 1, "red_signals": 1, "yellow_signals": 0, "green_signals": 0, "pending_signals": 1
+    }
+    assert detailed["by_region"] == {"16_108": 1}
+    assert detailed["by_status"] == {"pending": 1}
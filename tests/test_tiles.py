@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+from mongomock.aggregate import _Parser
+
+from events import SIGNAL_CREATED, EventBus
+from geo import geohash_encode, tile_for
+from tiles import TileCache, backfill_geohashes, cluster_precision
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("substr_cp")]
+
+DA_NANG = (16.05, 108.2)
+HUE = (16.46, 107.59)
+
+
+def signal(signal_id: str, latitude: float, longitude: float, danger_level: str = "red", status: str = "pending") -> dict:
+    return {
+        "id": signal_id,
+        "latitude": latitude,
+        "longitude": longitude,
+        "geohash": geohash_encode(latitude, longitude),
+        "danger_level": danger_level,
+        "status": status,
+    }
+
+
+@pytest.fixture
+def substr_cp(monkeypatch):
+    """mongomock lacks $substrCP; on ASCII geohashes it is the same as $substr."""
+    handle = _Parser._handle_string_operator
+
+    def handle_string_operator(self, operator, values):
+        return handle(self, "$substr" if operator == "$substrCP" else operator, values)
+
+    monkeypatch.setattr(_Parser, "_handle_string_operator", handle_string_operator)
+
+
+async def settle() -> None:
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+@pytest.fixture
+async def tiles(db):
+    cache = TileCache(db, EventBus())
+    cache.start()
+    yield cache
+    await cache.stop()
+
+
+async def test_tile_clusters_signals_by_geohash_prefix(db, tiles):
+    await db.sos_signals.insert_many([
+        signal("a", *DA_NANG),
+        signal("b", DA_NANG[0] + 0.001, DA_NANG[1], danger_level="green", status="in_progress"),
+        signal("c", *HUE, danger_level="yellow"),
+    ])
+    z = 8
+    x, y = tile_for(*DA_NANG, z)
+
+    tile = await tiles.get(z, x, y)
+
+    assert (tile["z"], tile["x"], tile["y"], tile["precision"]) == (z, x, y, cluster_precision(z))
+    assert tile["count"] == 3
+    assert tile["danger"] == {"red": 1, "green": 1, "yellow": 1}
+    assert tile["status"] == {"pending": 2, "in_progress": 1}
+    [da_nang] = [cell for cell in tile["cells"] if cell["geohash"] == geohash_encode(*DA_NANG, tile["precision"])]
+    assert da_nang["count"] == 2
+    assert da_nang["latitude"] == pytest.approx(DA_NANG[0] + 0.0005)
+
+
+async def test_tile_is_cached_until_an_event_touches_it(db, tiles):
+    z = 12
+    x, y = tile_for(*DA_NANG, z)
+    await tiles.get(z, x, y)
+    await db.sos_signals.insert_one(signal("a", *DA_NANG))
+
+    assert (await tiles.get(z, x, y))["count"] == 0
+    assert tiles.hits == 1
+
+    tiles.bus.publish(SIGNAL_CREATED, "a", *DA_NANG, {})
+    await settle()
+
+    assert (await tiles.get(z, x, y))["count"] == 1
+
+
+async def test_lost_events_clear_every_tile(db, tiles):
+    z = 12
+    x, y = tile_for(*DA_NANG, z)
+    await tiles.get(z, x, y)
+    await db.sos_signals.insert_one(signal("a", *DA_NANG))
+
+    # Only an event far away arrives, after the queue overflowed
+    tiles._subscription.dropped += 1
+    tiles.bus.publish(SIGNAL_CREATED, "far", -33.9, 18.4, {})
+    await settle()
+
+    assert (await tiles.get(z, x, y))["count"] == 1
+
+
+async def test_backfill_stores_missing_geohashes(db):
+    await db.sos_signals.insert_many([
+        {"id": "old", "latitude": DA_NANG[0], "longitude": DA_NANG[1]},
+        signal("new", *HUE),
+    ])
+
+    assert await backfill_geohashes(db) == 1
+    assert (await db.sos_signals.find_one({"id": "old"}))["geohash"] == geohash_encode(*DA_NANG)
+
+
+async def create(api, latitude: float, longitude: float) -> None:
+    await api.post("/api/sos/create", json={"latitude": latitude, "longitude": longitude, "description": "help"})
+
+
+async def test_tile_endpoint(api, server):
+    server.tile_cache.clear()
+    await create(api, *DA_NANG)
+    x, y = tile_for(*DA_NANG, 10)
+
+    tile = (await api.get(f"/api/sos/tiles/10/{x}/{y}")).json()
+    empty = (await api.get(f"/api/sos/tiles/10/{x + 1}/{y}")).json()
+
+    assert tile["count"] == 1 and tile["cells"][0]["geohash"] == geohash_encode(*DA_NANG, 5)
+    assert empty["count"] == 0 and empty["cells"] == []
+
+
+@pytest.mark.parametrize("path", ["/api/sos/tiles/21/0/0", "/api/sos/tiles/2/4/0", "/api/sos/tiles/2/0/-1"])
+async def test_tile_endpoint_rejects_tiles_out_of_range(api, path):
+    assert (await api.get(path)).status_code == 400
+
+
+async def test_clusters_endpoint_merges_the_tiles_of_a_bbox(api, server):
+    server.tile_cache.clear()
+    await create(api, *DA_NANG)
+    await create(api, *HUE)
+
+    response = await api.get("/api/sos/clusters", params={"bbox": "107.0,15.5,109.0,17.0", "zoom": 9})
+    outside = await api.get("/api/sos/clusters", params={"bbox": "108.0,16.0,108.1,16.1", "zoom": 9})
+
+    body = response.json()
+    assert (body["zoom"], body["precision"], body["count"]) == (9, 5, 2)
+    assert {cell["geohash"] for cell in body["cells"]} == {geohash_encode(*DA_NANG, 5), geohash_encode(*HUE, 5)}
+    assert outside.json()["count"] == 0
+
+
+async def test_clusters_endpoint_rejects_a_bbox_spanning_too_many_tiles(api):
+    response = await api.get("/api/sos/clusters", params={"bbox": "100.0,10.0,110.0,20.0", "zoom": 14})
+
+    assert response.status_code == 400
@@ -0,0 +1,103 @@
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from tracks import TRACK_COLLECTION, TrackDownsampler, encode_polyline, from_series_document, simplify, to_series_document
+
+
+def test_encode_polyline_reference_example():
+    # The worked example of the encoded polyline format
+    points = [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]]
+
+    assert encode_polyline(points) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+
+def test_encode_polyline_ignores_extra_fields():
+    assert encode_polyline([[38.5, -120.2, 1700000000]]) == encode_polyline([[38.5, -120.2]])
+
+
+def test_encode_polyline_empty():
+    assert encode_polyline([]) == ""
+
+
+def test_simplify_drops_points_on_a_straight_line():
+    line = [[16.0 + i * 0.001, 108.0, i] for i in range(50)]
+
+    assert simplify(line, tolerance_m=5) == [line[0], line[-1]]
+
+
+def test_simplify_keeps_corners():
+    # North about 1.1 km, then east
+    path = [[16.0 + i * 0.001, 108.0] for i in range(11)] + [[16.01, 108.0 + i * 0.001] for i in range(1, 11)]
+
+    assert simplify(path, tolerance_m=5) == [path[0], [16.01, 108.0], path[-1]]
+
+
+def test_simplify_keeps_deviations_above_the_tolerance():
+    # The middle point is about 55 m off the line between the endpoints
+    path = [[16.0, 108.0], [16.0005, 108.0005], [16.001, 108.0]]
+
+    assert simplify(path, tolerance_m=100) == [path[0], path[-1]]
+    assert simplify(path, tolerance_m=10) == path
+
+
+def test_simplify_short_tracks_unchanged():
+    assert simplify([[16.0, 108.0], [16.1, 108.1]], tolerance_m=1000) == [[16.0, 108.0], [16.1, 108.1]]
+
+
+def test_series_document_round_trip():
+    location = {
+        "id": "location-1",
+        "signal_id": "signal-1",
+        "team_id": "team-1",
+        "latitude": 16.05,
+        "longitude": 108.2,
+        "timestamp": datetime(2024, 10, 1, 8, 30, tzinfo=timezone.utc).isoformat(),
+    }
+
+    assert from_series_document(to_series_document(location)) == location
+
+
+async def add_points(db, signal_id: str, count: int, ingested_at: datetime) -> None:
+    await db[TRACK_COLLECTION].insert_many([
+        {
+            "timestamp": ingested_at - timedelta(seconds=count - i),
+            "meta": {"team_id": "team-1", "signal_id": signal_id},
+            "id": f"{signal_id}-{ingested_at.timestamp()}-{i}",
+            # Off a straight line, so simplification keeps every point
+            "latitude": 16.0 + i * 0.01,
+            "longitude": 108.0 + (i % 2) * 0.01,
+            "ingested_at": ingested_at,
+        }
+        for i in range(count)
+    ])
+
+
+@pytest.mark.anyio
+async def test_downsampler_retry_after_a_crash_folds_no_point_twice(db):
+    downsampler = TrackDownsampler(db, downsample_after=timedelta(0), interval=0)
+    an_hour_ago = datetime.now(timezone.utc) - timedelta(hours=1)
+    await add_points(db, "signal-a", 3, an_hour_ago)
+    await add_points(db, "signal-b", 3, an_hour_ago)
+
+    fold = TrackDownsampler._fold
+    async def crash_after_first(self, meta, points, cutoff):
+        if meta["signal_id"] == "signal-b":
+            raise RuntimeError("worker died")
+        return await fold(self, meta, points, cutoff)
+
+    downsampler._fold = crash_after_first.__get__(downsampler)
+    with pytest.raises(RuntimeError):
+        await downsampler.run_once()
+    del downsampler._fold
+
+    # Points ingested after the failed run belong to the next window
+    await add_points(db, "signal-a", 2, datetime.now(timezone.utc))
+    assert await downsampler.run_once() == 1
+    assert await downsampler.run_once() == 1
+
+    missions = {m["signal_id"]: m async for m in db.rescue_mission_tracks.find()}
+    assert missions["signal-a"]["raw_point_count"] == 5
+    assert missions["signal-a"]["point_count"] == 5
+    assert missions["signal-b"]["raw_point_count"] == 3
+    assert "folding_until" not in await db.jobs_state.find_one({"_id": TrackDownsampler.STATE_ID})
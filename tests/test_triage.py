@@ -0,0 +1,87 @@
+import pytest
+
+import triage
+from triage import DEFAULT_RULES, TriageEngine, normalize
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Mắc KẸT trên mái nhà!!!", "mac ket tren mai nha"),
+    ("Đuối nước", "duoi nuoc"),
+    ("  cứu   với... ", "cuu voi"),
+    ("NGẬP sâu 2m", "ngap sau 2m"),
+])
+def test_normalize_folds_case_diacritics_and_punctuation(text, expected):
+    assert normalize(text) == expected
+
+
+def test_decomposed_input_folds_like_precomposed():
+    assert normalize("ke\u0323t") == normalize("k\u1eb9t") == "ket"
+
+
+@pytest.mark.parametrize("text", ["nhà/sập,cứu!!", "— !!! —", "a_b\tc\u00a0d", "Đà Nẵng... ngập"])
+def test_token_cache_matches_folding_the_whole_text(text):
+    whole = triage._NON_WORD.sub(" ", text.lower().translate(triage._FOLD_TABLE)).strip()
+
+    assert normalize(text) == normalize(text) == whole
+
+
+def test_token_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(triage, "FOLD_CACHE_SIZE", 3)
+    monkeypatch.setattr(triage, "_FOLDED_TOKENS", {})
+
+    assert normalize("một hai ba bốn năm") == "mot hai ba bon nam"
+    assert len(triage._FOLDED_TOKENS) <= 3
+
+
+@pytest.fixture
+def engine():
+    return TriageEngine(DEFAULT_RULES)
+
+
+def test_red_report(engine):
+    result = engine.analyze("Cả nhà mắc kẹt trên mái, nước dâng nhanh, có người bị thương!")
+
+    assert result.danger_level == "red"
+    assert set(result.matched) == {"mac ket", "nuoc dang", "bi thuong"}
+    assert result.score == 8
+
+
+def test_report_without_keywords_is_yellow(engine):
+    result = engine.analyze("Cần nước uống")
+
+    assert result.danger_level == "yellow"
+    assert result.matched == []
+    assert result.assessment == "Keyword triage: no danger keywords found."
+
+
+def test_negative_terms_pull_a_report_down(engine):
+    assert engine.analyze("Mọi người an toàn rồi").danger_level == "green"
+
+
+def test_a_term_counts_once(engine):
+    assert engine.analyze("cứu cứu cứu").score == 1
+
+
+def test_terms_match_whole_words_only(engine):
+    # "lũ" must not match inside "lũy"
+    assert engine.analyze("Đi qua lũy tre").matched == []
+
+
+def test_traffic_jam_is_not_trapped(engine):
+    assert engine.analyze("Kẹt xe trên cầu").matched == []
+
+
+def test_longest_phrase_wins(engine):
+    assert engine.analyze("Gia đình đang kêu cứu").matched == ["keu cuu"]
+
+
+def test_fire_needs_a_phrase(engine):
+    # Folded, "chạy" (run) and "cháy" (fire) are the same word
+    assert engine.analyze("Chạy lên tầng 2").matched == []
+    assert engine.analyze("Cháy nhà ở cuối hẻm").matched == ["chay nha"]
+
+
+def test_custom_thresholds():
+    engine = TriageEngine([{"term": "help", "weight": 1}], {"red": 1})
+
+    assert engine.analyze("HELP").danger_level == "red"
@@ -0,0 +1,135 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from triage import TriageResult
+from triage_queue import TriageQueue
+
+pytestmark = pytest.mark.anyio
+
+RESULT = TriageResult(score=9.0, danger_level="red", matched=["trapped"])
+
+
+class Recorder:
+    def __init__(self, results=None):
+        # Each analysis returns or raises the next item; RESULT once they run out
+        self.results = list(results or [])
+        self.analyzed = []
+        self.completed = []
+        self.failed = []
+
+    async def analyze(self, job: dict) -> TriageResult:
+        self.analyzed.append(job["_id"])
+        result = self.results.pop(0) if self.results else RESULT
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def on_complete(self, signal_id: str, result: TriageResult) -> None:
+        self.completed.append((signal_id, result))
+
+    async def on_failed(self, signal_id: str, error: str) -> None:
+        self.failed.append((signal_id, error))
+
+
+def make_queue(db, recorder: Recorder, **options) -> TriageQueue:
+    return TriageQueue(db, recorder.analyze, recorder.on_complete, recorder.on_failed, **options)
+
+
+def naive(value: datetime) -> datetime:
+    # mongomock hands datetimes back without a timezone
+    return value.replace(tzinfo=None)
+
+
+async def test_claim_leases_the_job(db):
+    queue = make_queue(db, Recorder(), lease_seconds=60)
+    await queue.enqueue("signal-1", "trapped on the roof", ["abc"])
+
+    job = await queue._claim()
+
+    assert job["_id"] == "signal-1"
+    assert (job["status"], job["attempts"], job["image_hashes"]) == ("running", 1, ["abc"])
+    assert job["lease_until"] > naive(datetime.now(timezone.utc) + timedelta(seconds=50))
+    # Leased: no other worker gets it
+    assert await queue._claim() is None
+    assert await queue.backlog() == 1
+
+
+async def test_expired_lease_is_reclaimed(db):
+    queue = make_queue(db, Recorder())
+    await queue.enqueue("signal-1", "help", [])
+    await queue._claim()
+
+    # The worker holding the job died
+    await db.triage_jobs.update_one(
+        {"_id": "signal-1"}, {"$set": {"lease_until": datetime.now(timezone.utc) - timedelta(seconds=1)}}
+    )
+    job = await queue._claim()
+
+    assert (job["_id"], job["status"], job["attempts"]) == ("signal-1", "running", 2)
+
+
+async def test_jobs_are_not_claimed_before_they_are_due(db):
+    queue = make_queue(db, Recorder())
+    await queue.enqueue("signal-1", "help", [])
+    await db.triage_jobs.update_one(
+        {"_id": "signal-1"}, {"$set": {"run_at": datetime.now(timezone.utc) + timedelta(minutes=1)}}
+    )
+
+    assert await queue._claim() is None
+
+
+async def test_completed_job_is_acked(db):
+    recorder = Recorder()
+    queue = make_queue(db, recorder)
+    await queue.enqueue("signal-1", "help", [])
+
+    await queue._process(await queue._claim())
+
+    assert recorder.completed == [("signal-1", RESULT)]
+    assert await db.triage_jobs.count_documents({}) == 0
+
+
+async def test_failed_analysis_is_retried_with_backoff(db):
+    recorder = Recorder([RuntimeError("rules unavailable")])
+    queue = make_queue(db, recorder)
+    await queue.enqueue("signal-1", "help", [])
+
+    await queue._process(await queue._claim())
+
+    job = await db.triage_jobs.find_one({"_id": "signal-1"})
+    assert (job["status"], job["last_error"]) == ("queued", "rules unavailable")
+    assert job["run_at"] > naive(datetime.now(timezone.utc) + timedelta(seconds=1))
+    assert recorder.completed == [] and recorder.failed == []
+
+
+async def test_job_fails_after_its_last_attempt(db):
+    recorder = Recorder([RuntimeError("rules unavailable")])
+    queue = make_queue(db, recorder, max_attempts=1)
+    await queue.enqueue("signal-1", "help", [])
+
+    await queue._process(await queue._claim())
+
+    job = await db.triage_jobs.find_one({"_id": "signal-1"})
+    assert job["status"] == "failed"
+    assert recorder.failed == [("signal-1", "rules unavailable")]
+    assert await queue._claim() is None
+
+
+async def test_workers_process_enqueued_jobs(db):
+    recorder = Recorder()
+    queue = make_queue(db, recorder, workers=2, poll_interval=0.01)
+    queue.start()
+    try:
+        await queue.enqueue("signal-1", "help", [])
+        await queue.enqueue("signal-2", "help", [])
+        for _ in range(100):
+            if len(recorder.completed) == 2:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await queue.stop()
+
+    assert sorted(signal_id for signal_id, _ in recorder.completed) == ["signal-1", "signal-2"]
+    assert await queue.backlog() == 0
@@ -0,0 +1,157 @@
+import io
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+from PIL import Image
+from starlette.responses import PlainTextResponse
+
+from uploads import MaxBodySizeMiddleware, MultipartUpload, UploadError, UploadTooLarge
+
+pytestmark = pytest.mark.anyio
+
+BOUNDARY = "sos-test-boundary"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+
+def multipart(fields: dict = None, files: list = None) -> bytes:
+    body = b""
+    for name, value in (fields or {}).items():
+        body += f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+    for name, filename, data in files or []:
+        body += (
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n"
+        ).encode() + data + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+async def chunks(body: bytes, size: int = 7):
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+
+async def parse(body: bytes, max_file_bytes: int = 100, max_files: int = 2, **kwargs):
+    received = []
+
+    async def on_file(name: str, data: bytes) -> None:
+        received.append((name, data))
+
+    upload = MultipartUpload(CONTENT_TYPE, on_file, max_file_bytes=max_file_bytes, max_files=max_files, **kwargs)
+    fields = await upload.parse(chunks(body))
+    return fields, received
+
+
+async def test_fields_and_files_are_parsed():
+    body = multipart({"latitude": "16.05", "description": "Cứu với"}, [("images", "a.jpg", b"A" * 100), ("images", "b.jpg", b"B")])
+
+    fields, received = await parse(body)
+
+    assert fields == {"latitude": "16.05", "description": "Cứu với"}
+    assert received == [("images", b"A" * 100), ("images", b"B")]
+
+
+async def test_file_over_the_limit_is_rejected():
+    with pytest.raises(UploadTooLarge):
+        await parse(multipart(files=[("images", "a.jpg", b"A" * 101)]))
+
+
+async def test_too_many_files_are_rejected():
+    files = [("images", f"{i}.jpg", b"x") for i in range(3)]
+
+    with pytest.raises(UploadTooLarge):
+        await parse(multipart(files=files))
+
+
+async def test_field_over_the_limit_is_rejected():
+    with pytest.raises(UploadTooLarge):
+        await parse(multipart({"description": "x" * 65}), max_field_bytes=64)
+
+
+async def test_files_are_handed_over_before_the_body_ends():
+    received = []
+
+    async def on_file(name: str, data: bytes) -> None:
+        received.append(name)
+
+    body = multipart(files=[("first", "a.jpg", b"A"), ("second", "b.jpg", b"B")])
+    # Up to the start of the second part
+    split = body.index(b"\r\n", body.index(f"--{BOUNDARY}".encode(), 1)) + 2
+
+    async def stream():
+        yield body[:split]
+        assert received == ["first"]
+        yield body[split:]
+
+    upload = MultipartUpload(CONTENT_TYPE, on_file, max_file_bytes=10, max_files=2)
+    await upload.parse(stream())
+
+    assert received == ["first", "second"]
+
+
+async def test_truncated_body_is_rejected():
+    with pytest.raises(UploadError):
+        await parse(multipart(files=[("images", "a.jpg", b"A" * 50)])[:-40])
+
+
+def test_non_multipart_content_type_is_rejected():
+    async def on_file(name: str, data: bytes) -> None:
+        pass
+
+    with pytest.raises(UploadError):
+        MultipartUpload("application/json", on_file, max_file_bytes=10, max_files=1)
+
+
+echo = FastAPI()
+
+
+@echo.post("/")
+async def echo_length(request: Request):
+    return PlainTextResponse(str(len(await request.body())))
+
+
+@pytest.mark.parametrize("declare_length", [True, False])
+async def test_max_body_size(declare_length):
+    app = MaxBodySizeMiddleware(echo, max_bytes=10)
+
+    async def stream(body: bytes):
+        yield body
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        small = await client.post("/", content=b"x" * 10)
+        body = b"x" * 11
+        large = await client.post("/", content=body if declare_length else stream(body))
+
+    assert small.status_code == 200 and small.text == "10"
+    assert large.status_code == 413
+
+
+def png(color: str = "red") -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (40, 40), color).save(out, format="PNG")
+    return out.getvalue()
+
+
+async def test_upload_creates_a_signal(api, server):
+    response = await api.post(
+        "/api/sos/create/upload",
+        data={"latitude": "16.05", "longitude": "108.2", "description": "Cứu với"},
+        files=[("images", ("a.png", png(), "image/png"))],
+    )
+
+    assert response.status_code == 200
+    [image] = response.json()["images"]
+    assert image["content_type"] == "image/webp"
+    assert (await api.get(f"/api/sos/images/{image['hash']}")).status_code == 200
+
+
+async def test_rejected_upload_queues_its_images_for_collection(api, server):
+    response = await api.post(
+        "/api/sos/create/upload",
+        data={"latitude": "north", "longitude": "108.2", "description": "Cứu với"},
+        files=[("images", ("b.png", png("blue"), "image/png"))],
+    )
+
+    assert response.status_code == 422
+    [queued] = await server.db.orphaned_blobs.find().to_list(None)
+    assert await server.blob_store.info(queued["_id"]) is not None